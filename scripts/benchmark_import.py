@@ -0,0 +1,103 @@
+"""
+   benchmark_import
+   ~~~~~~~~~~~~~~~~
+
+   This script times `import sonde` in fresh interpreters and checks it
+   against a budget, and that the modules sonde imports lazily were not
+   imported. Python 2 has no `python -X importtime` (it needs Python
+   3.7), so the import is timed inside each interpreter instead; the
+   -v option lists the slowest modules imported, by timing each module
+   in sys.modules in a fresh interpreter after numpy.
+
+   usage: python benchmark_import.py [-v] [budget_ms]
+"""
+import os
+import subprocess
+import sys
+
+#: The budget for `import sonde`, in milliseconds. It was 250ms before
+#: quantities was imported lazily, and about 100ms after, 60ms of which
+#: is numpy.
+import_budget_ms = 150
+
+#: Modules that `import sonde` should not import
+lazy_modules = ['quantities', 'seawater', 'pandas', 'xlrd', 'netCDF4']
+
+package_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+_timed_import = """
+import sys, time
+start = time.time()
+import sonde
+print (time.time() - start) * 1000
+print ' '.join(sorted(name for name in sys.modules
+                      if sys.modules[name] is not None))
+"""
+
+_timed_module = """
+import sys, time
+import numpy
+start = time.time()
+__import__(sys.argv[1])
+print (time.time() - start) * 1000
+"""
+
+
+def run_python(code, *args):
+    """run `code` in a fresh interpreter and return its output lines"""
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(
+        [package_dir] + filter(None, [env.get('PYTHONPATH')]))
+    output = subprocess.check_output(
+        [sys.executable, '-c', code] + list(args), env=env)
+    return output.splitlines()
+
+
+def time_import(repeat=5):
+    """
+    Return the best of `repeat` times for `import sonde` in ms and the
+    modules that were imported
+    """
+    best = None
+    for i in range(repeat):
+        milliseconds, modules = run_python(_timed_import)
+        milliseconds = float(milliseconds)
+        if best is None or milliseconds < best:
+            best = milliseconds
+
+    return best, modules.split()
+
+
+def slowest_modules(modules, count=10):
+    """return the `count` slowest top level `modules` to import"""
+    times = []
+    for module in set(name.split('.')[0] for name in modules):
+        try:
+            times.append((float(run_python(_timed_module, module)[0]),
+                          module))
+        except subprocess.CalledProcessError:
+            pass
+
+    return sorted(times, reverse=True)[:count]
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    verbose = '-v' in args
+    args = [arg for arg in args if arg != '-v']
+    if args:
+        import_budget_ms = float(args[0])
+
+    milliseconds, modules = time_import()
+    print 'import sonde: %.1f ms (budget %.1f ms)' % (milliseconds,
+                                                     import_budget_ms)
+    imported = [module for module in lazy_modules if module in modules]
+    if imported:
+        print 'imported lazy modules: %s' % ', '.join(imported)
+
+    if verbose:
+        for module_ms, module in slowest_modules(modules):
+            print '%10.1f ms  %s' % (module_ms, module)
+
+    if milliseconds > import_budget_ms or imported:
+        sys.exit(1)
@@ -0,0 +1,66 @@
+"""
+   benchmark_merge
+   ~~~~~~~~~~~~~~~
+
+   This script times sonde.merge for an increasing number of deployment
+   files, to check that merge time grows linearly with the file count.
+   The deployment files are copies of one of the YSI test files.
+
+   usage: python benchmark_merge.py [max_file_count]
+"""
+import os
+import shutil
+import sys
+import tempfile
+import time
+import warnings
+
+import numpy as np
+import sonde
+
+test_file = os.path.join(os.path.dirname(__file__), '..', 'tests',
+                         'ysi_test_files',
+                         'BAYT_20070323_CDT_YS1772AA_000.dat')
+
+
+def time_merge(file_list, repeat=3):
+    """return the best of `repeat` wall clock times for sonde.merge"""
+    best = np.inf
+    for i in range(repeat):
+        stdout = sys.stdout
+        sys.stdout = open(os.devnull, 'w')
+        try:
+            start = time.time()
+            sonde.merge(file_list)
+            best = min(best, time.time() - start)
+        finally:
+            sys.stdout.close()
+            sys.stdout = stdout
+
+    return best
+
+
+if __name__ == '__main__':
+    warnings.simplefilter('ignore')
+    if len(sys.argv) > 1:
+        max_file_count = int(sys.argv[1])
+    else:
+        max_file_count = 128
+
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        file_list = []
+        for i in range(max_file_count):
+            file_name = os.path.join(tmp_dir, 'BENCH_%04d.dat' % i)
+            shutil.copy(test_file, file_name)
+            file_list.append(file_name)
+
+        print '%8s %12s %14s' % ('files', 'seconds', 'ms per file')
+        file_count = 8
+        while file_count <= max_file_count:
+            seconds = time_merge(file_list[:file_count])
+            print '%8d %12.3f %14.2f' % (file_count, seconds,
+                                         1000. * seconds / file_count)
+            file_count *= 2
+    finally:
+        shutil.rmtree(tmp_dir)
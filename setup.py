@@ -26,12 +26,14 @@ setup(
     package_data={'': ['data/ysi_param.def']},
     platforms='any',
     install_requires=[
-        'numpy>=1.5.0',
+        'numpy>=1.7.0',
         'pytz>=2010o',
         'quantities>=0.9.0',
-        'seawater>=3.3.1',
         'xlrd>=0.7.1',
     ],
+    extras_require={
+        'netcdf4': ['netCDF4>=1.2.8'],
+    },
     classifiers=[
         'Development Status :: 4 - Beta',
         'Intended Audience :: Science/Research',
@@ -44,6 +46,7 @@ setup(
     tests_require=[
         'nose>=0.11.4',
         'configobj>=4.7.2',
+        'seawater>=3.3.1',
     ],
     test_suite='nose.collector',
 )
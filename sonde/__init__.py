@@ -5,9 +5,14 @@
     A utility for reading in water data from a variety of device
     formats
 
+    Importing sonde doesn't import quantities (or the dependencies of
+    the format modules, like pandas and xlrd); they are imported when a
+    file is first read or sonde.quantities is imported.
 """
 
+__version__ = '0.2'
+
 from .sonde import autodetect, BaseSondeDataset, default_static_timezone, \
-     find_tz, master_parameter_list, merge, open_sonde, Sonde
-from . import quantities
+     find_tz, iter_sonde, master_parameter_list, merge, open_many, \
+     open_sonde, Sonde
 from . import formats
@@ -0,0 +1,330 @@
+"""
+    sonde.cache
+    ~~~~~~~~~~~
+
+    This module implements an on-disk cache of parsed datasets.
+
+    A cache entry holds a fully processed dataset, i.e. after the
+    rescaling and timezone conversion done when the file is read.
+    Derived parameters are not stored, they are calculated from the
+    cached data when they are accessed. The dates and data arrays are
+    stored as raw binary columns after a small pickled header, so a
+    cached dataset is loaded by reading the header and memory mapping
+    the rest of the entry. The arrays of a loaded dataset are copy on
+    write views of the memory map, so they can be modified like those of
+    a dataset that was read from its file, without changing the entry.
+
+    Entries are keyed by the absolute path of the data file, the
+    arguments it was read with, the sonde version and the default
+    timezone (sonde.default_static_timezone), and are only used while
+    the size and modification time (and optionally a hash of the
+    contents) of the file are unchanged.
+"""
+from __future__ import absolute_import
+
+import cPickle as pickle
+import hashlib
+import os
+import struct
+import tempfile
+
+import numpy as np
+
+from sonde import util
+
+
+#: The cache used by sonde.Sonde when it isn't passed a `cache`
+#: argument, None to not cache datasets by default
+default_cache = None
+
+_magic = 'SONDECACHE1\n'
+_header_length = struct.Struct('<Q')
+_alignment = 64
+_entry_ext = '.sondecache'
+
+
+class ParseCache(object):
+    """
+    A cache of parsed datasets stored in the directory `cache_dir`.
+
+    If `max_size` is given, the least recently used entries are removed
+    whenever a new entry makes the cache larger than `max_size` bytes.
+    If `hash_contents` is True a sha1 hash of the data file is checked
+    as well as its size and modification time, which catches changes
+    that keep both but means the whole file is read on every open.
+    """
+    def __init__(self, cache_dir, max_size=None, hash_contents=False):
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self.hash_contents = hash_contents
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+
+    def entry_path(self, data_file, read_args):
+        """
+        Return the path of the cache entry for `data_file` read with
+        `read_args`, a tuple of the arguments passed to sonde.Sonde
+        """
+        import sonde
+
+        # datasets are converted to the default timezone when read
+        key = pickle.dumps((os.path.abspath(data_file), read_args,
+                            sonde.__version__,
+                            sonde.sonde.default_static_timezone),
+                           pickle.HIGHEST_PROTOCOL)
+        return os.path.join(self.cache_dir,
+                            hashlib.sha1(key).hexdigest() + _entry_ext)
+
+    def file_stamp(self, data_file):
+        """
+        Return the (size, mtime, hash) tuple that an entry for
+        `data_file` must match to be used
+        """
+        stat = os.stat(data_file)
+        content_hash = None
+        if self.hash_contents:
+            content_hash = util.file_sha1(data_file)
+
+        return stat.st_size, stat.st_mtime, content_hash
+
+    def load(self, data_file, read_args, datetime64_dates=False):
+        """
+        Return the cached dataset for `data_file`, or None if there
+        isn't an up to date entry for it
+        """
+        entry_path = self.entry_path(data_file, read_args)
+        if not os.path.exists(entry_path):
+            return None
+
+        try:
+            header, data_offset = _read_header(entry_path)
+        except (IOError, ValueError, EOFError, pickle.UnpicklingError):
+            return None
+
+        if header['stamp'] != self.file_stamp(data_file):
+            return None
+
+        if header['data_size']:
+            buf = np.memmap(entry_path, dtype=np.uint8, mode='c',
+                            offset=data_offset, shape=header['data_size'])
+        else:
+            buf = np.zeros(0, dtype=np.uint8)
+
+        arrays = dict((name, _array_from_buffer(buf, spec))
+                      for name, spec in header['arrays'].iteritems())
+
+        # mark the entry as recently used for eviction
+        os.utime(entry_path, None)
+
+        return _restore_dataset(header, arrays, datetime64_dates)
+
+    def store(self, data_file, read_args, dataset):
+        """
+        Add `dataset`, read from `data_file` with `read_args`, to the
+        cache. Datasets with attributes that can't be pickled are not
+        cached.
+        """
+        stamp = self.file_stamp(data_file)
+        try:
+            header, arrays = _dataset_state(dataset)
+            header['stamp'] = stamp
+            header_str = _layout(header, arrays)
+        except (pickle.PicklingError, TypeError):
+            return
+
+        # write to a temporary file first so readers never see a
+        # partially written entry
+        entry_path = self.entry_path(data_file, read_args)
+        temp_fid, temp_path = tempfile.mkstemp(dir=self.cache_dir)
+        try:
+            with os.fdopen(temp_fid, 'wb') as entry_file:
+                entry_file.write(_magic)
+                entry_file.write(_header_length.pack(len(header_str)))
+                entry_file.write(header_str)
+                entry_file.write('\0' * (_data_offset(len(header_str)) -
+                                        entry_file.tell()))
+                for name in sorted(arrays):
+                    spec = header['arrays'][name]
+                    entry_file.write('\0' * (spec['offset'] -
+                                            (entry_file.tell() -
+                                             _data_offset(len(header_str)))))
+                    entry_file.write(arrays[name].tostring())
+
+            _rename(temp_path, entry_path)
+        except:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+        if self.max_size is not None:
+            self.evict(self.max_size)
+
+    def evict(self, max_size=0):
+        """
+        Remove the least recently used entries until the cache is no
+        larger than `max_size` bytes
+        """
+        entries = []
+        for file_name in os.listdir(self.cache_dir):
+            if file_name.endswith(_entry_ext):
+                entry_path = os.path.join(self.cache_dir, file_name)
+                stat = os.stat(entry_path)
+                entries.append((stat.st_mtime, stat.st_size, entry_path))
+
+        total_size = sum(size for mtime, size, entry_path in entries)
+        for mtime, size, entry_path in sorted(entries):
+            if total_size <= max_size:
+                break
+            os.remove(entry_path)
+            total_size -= size
+
+    def clear(self):
+        """
+        Remove all entries from the cache
+        """
+        self.evict(0)
+
+
+def _data_offset(header_size):
+    """the offset of the array data in an entry"""
+    offset = len(_magic) + _header_length.size + header_size
+    return -(-offset // _alignment) * _alignment
+
+
+def _read_header(entry_path):
+    """
+    Read the header of a cache entry, returns the header and the offset
+    of the array data
+    """
+    with open(entry_path, 'rb') as entry_file:
+        if entry_file.read(len(_magic)) != _magic:
+            raise ValueError('%s is not a sonde cache entry' % entry_path)
+        header_size, = _header_length.unpack(
+            entry_file.read(_header_length.size))
+        header = pickle.loads(entry_file.read(header_size))
+
+    return header, _data_offset(header_size)
+
+
+def _layout(header, arrays):
+    """
+    Set the offsets of `arrays` in the header and return the pickled
+    header
+    """
+    header['arrays'] = {}
+    offset = 0
+    for name in sorted(arrays):
+        array = arrays[name]
+        offset = -(-offset // _alignment) * _alignment
+        header['arrays'][name] = {'dtype': array.dtype.str,
+                                  'shape': array.shape,
+                                  'offset': offset}
+        offset += array.nbytes
+
+    header['data_size'] = offset
+    return pickle.dumps(header, pickle.HIGHEST_PROTOCOL)
+
+
+def _array_from_buffer(buf, spec):
+    """return the array described by `spec` as a view of `buf`"""
+    dtype = np.dtype(spec['dtype'])
+    count = int(np.prod(spec['shape']))
+    nbytes = count * dtype.itemsize
+    array = buf[spec['offset']:spec['offset'] + nbytes].view(dtype)
+    return array.reshape(spec['shape'])
+
+
+def _dataset_state(dataset):
+    """
+    Split a dataset into a picklable header and a dict of the numeric
+    arrays to store as binary columns
+    """
+    import quantities as pq
+    from sonde.derived import DerivedData
+
+    arrays = {}
+    units = {}
+    # derived parameters are calculated again when they are accessed
+    derived = isinstance(dataset.data, DerivedData)
+    if derived:
+        data_items = dataset.data.measured_items()
+    else:
+        data_items = dataset.data.items()
+
+    for param, values in data_items:
+        name = 'data/' + param
+        if isinstance(values, pq.Quantity):
+            units[param] = values.dimensionality
+            values = values.magnitude
+        arrays[name] = np.ascontiguousarray(values)
+
+    arrays['utc_dates'] = np.ascontiguousarray(dataset.utc_dates,
+                                               dtype='M8[ns]')
+
+    attributes = {}
+    for name, value in dataset.__dict__.iteritems():
+        if name in ('data', '_dates', '_utc_dates', '_tzinfo',
+                    'datetime64_dates'):
+            continue
+        if isinstance(value, np.ndarray) and value.dtype != object:
+            arrays['attribute/' + name] = np.ascontiguousarray(value)
+        else:
+            attributes[name] = value
+
+    for name, array in arrays.items():
+        if array.dtype == object:
+            raise TypeError('can not store object array %s' % name)
+
+    header = {
+        'class': (dataset.__class__.__module__, dataset.__class__.__name__),
+        'attributes': attributes,
+        'units': units,
+        'tzinfo': dataset.tzinfo,
+        'derived': derived,
+        }
+
+    return header, arrays
+
+
+def _restore_dataset(header, arrays, datetime64_dates):
+    """
+    Create a dataset from a cache entry header and its arrays, without
+    reading the data file again
+    """
+    import quantities as pq
+    from sonde.derived import DerivedData
+
+    module_name, class_name = header['class']
+    module = __import__(module_name, fromlist=[class_name])
+    dataset_class = getattr(module, class_name)
+
+    dataset = dataset_class.__new__(dataset_class)
+    dataset.__dict__.update(header['attributes'])
+    dataset.data = {}
+    for name, array in arrays.iteritems():
+        if name.startswith('data/'):
+            param = name[len('data/'):]
+            if param in header['units']:
+                array = pq.Quantity(array, header['units'][param],
+                                    copy=False)
+            dataset.data[param] = array
+        elif name.startswith('attribute/'):
+            setattr(dataset, name[len('attribute/'):], array)
+
+    if header.get('derived'):
+        dataset.data = DerivedData(dataset, dataset.data)
+
+    dataset.datetime64_dates = datetime64_dates
+    dataset.set_utc_dates(arrays['utc_dates'], header['tzinfo'])
+
+    return dataset
+
+
+def _rename(source, destination):
+    """rename `source` to `destination`, replacing it if it exists"""
+    try:
+        os.rename(source, destination)
+    except OSError:
+        # windows can't rename over an existing file
+        os.remove(destination)
+        os.rename(source, destination)
@@ -0,0 +1,357 @@
+"""
+    sonde.catalog
+    ~~~~~~~~~~~~~
+
+    This module implements a catalog of data files, kept in a SQLite
+    database, so questions like which parameters were measured at a
+    site and over what dates can be answered without reading any data.
+
+    Each catalogued file has a row with its path, size, modification
+    time, format, site, serial number, manufacturer, first and last
+    timestamps and number of rows, plus the number of values (that
+    aren't NaN) of each of its parameters. Files that can't be read are
+    catalogued with the error instead.
+
+    Indexing is incremental: a file is only read again if its size or
+    modification time changed, and files that were removed from an
+    indexed directory are dropped from the catalog.
+
+    Timestamps are stored as seconds since 1970-01-01 UTC (wall clock
+    time for files read without a timezone) and returned as naive
+    datetime.datetime instances.
+"""
+from __future__ import absolute_import
+
+import calendar
+import datetime
+import os
+import re
+import sqlite3
+
+import numpy as np
+
+from sonde import sonde
+
+_schema_version = 1
+
+_schema = """
+CREATE TABLE IF NOT EXISTS files (
+    id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE NOT NULL,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL,
+    format TEXT,
+    site TEXT,
+    serial_number TEXT,
+    manufacturer TEXT,
+    start_time INTEGER,
+    stop_time INTEGER,
+    row_count INTEGER,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS files_site ON files (site);
+CREATE TABLE IF NOT EXISTS parameters (
+    file_id INTEGER NOT NULL,
+    parameter TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (file_id, parameter)
+);
+CREATE INDEX IF NOT EXISTS parameters_parameter ON parameters (parameter);
+"""
+
+# deployment files are named e.g. JARD_20070222_CST_EU7396.xls and
+# merged site files twdb_wq_jard.csv
+_deployment_file_name = re.compile(r'^([^_]+)_\d{8}_')
+_site_file_name = re.compile(r'^twdb_wq_(.+?)(_provisional)?\.csv$', re.I)
+
+
+def site_from_path(path):
+    """
+    Return the site code of a data file from its TWDB file name, in
+    lower case, or None if the name doesn't follow the convention
+    """
+    file_name = os.path.basename(path)
+    for pattern in (_deployment_file_name, _site_file_name):
+        match = pattern.match(file_name)
+        if match:
+            return match.group(1).lower()
+
+    return None
+
+
+class Catalog(object):
+    """
+    A catalog of data files stored in the SQLite database `db_path`,
+    which is created if it doesn't exist (':memory:' keeps the catalog
+    in memory).
+    """
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.connection = sqlite3.connect(db_path)
+        version = self.connection.execute('PRAGMA user_version').fetchone()
+        if version[0] not in (0, _schema_version):
+            raise ValueError('%s is a version %d catalog, expected %d' %
+                             (db_path, version[0], _schema_version))
+        with self.connection:
+            self.connection.executescript(_schema)
+            self.connection.execute('PRAGMA user_version = %d' %
+                                    _schema_version)
+
+    def close(self):
+        self.connection.close()
+
+    def index(self, paths, file_format=None, tzinfo=None, workers=1,
+              **kwargs):
+        """
+        Add the files in `paths` to the catalog, reading those that are
+        new or have changed since they were last indexed. A path can be
+        a directory, in which case all the files below it are indexed
+        and catalogued files below it that no longer exist are removed.
+
+        `file_format` (autodetected if None), `tzinfo` and any other
+        keyword arguments are passed on to Sonde, and `workers` to
+        sonde.open_many. Returns the number of files that were read.
+        """
+        if isinstance(paths, basestring):
+            paths = [paths]
+
+        # the catalog's own database files are skipped when it is kept
+        # in an indexed directory
+        db_path = os.path.abspath(self.db_path)
+        db_files = set(db_path + suffix
+                       for suffix in ('', '-journal', '-wal', '-shm'))
+
+        file_paths = []
+        for path in paths:
+            path = os.path.abspath(path)
+            if os.path.isdir(path):
+                directory_paths = sorted(
+                    file_path
+                    for dir_path, dir_names, file_names in os.walk(path)
+                    for file_path in (os.path.join(dir_path, file_name)
+                                      for file_name in file_names)
+                    if file_path not in db_files)
+                self._remove_missing(path, directory_paths)
+                file_paths.extend(directory_paths)
+            else:
+                file_paths.append(path)
+
+        stats = {}
+        changed = {}
+        for path in file_paths:
+            stat = os.stat(path)
+            stats[path] = (stat.st_size, stat.st_mtime)
+            row = self.connection.execute(
+                'SELECT size, mtime FROM files WHERE path = ?',
+                (path,)).fetchone()
+            if row is not None and tuple(row) == stats[path]:
+                continue
+
+            path_format = file_format
+            if not path_format:
+                try:
+                    path_format = sonde.autodetect(path)
+                except Exception:
+                    path_format = False
+            changed.setdefault(path_format, []).append(path)
+
+        with self.connection:
+            for path_format, format_paths in changed.items():
+                if not path_format:
+                    for path in format_paths:
+                        self._store(path, stats[path], None, None,
+                                    'File Format Autodetection Failed')
+                    continue
+
+                results = sonde.open_many(format_paths, path_format, tzinfo,
+                                          workers=workers, **kwargs)
+                for path, result in results:
+                    if isinstance(result, Exception):
+                        self._store(path, stats[path], path_format, None,
+                                    '%s: %s' % (type(result).__name__,
+                                                result))
+                    else:
+                        self._store(path, stats[path], path_format, result)
+
+        return sum(len(format_paths) for format_paths in changed.values())
+
+    def _remove_missing(self, directory, paths):
+        """
+        Remove the catalogued files below `directory` that aren't in
+        `paths`
+        """
+        existing = set(paths)
+        prefix = os.path.join(directory, '')
+        rows = self.connection.execute(
+            'SELECT id, path FROM files WHERE substr(path, 1, ?) = ?',
+            (len(prefix), prefix)).fetchall()
+        with self.connection:
+            for file_id, path in rows:
+                if path not in existing:
+                    self._delete(file_id)
+
+    def _delete(self, file_id):
+        self.connection.execute('DELETE FROM parameters WHERE file_id = ?',
+                                (file_id,))
+        self.connection.execute('DELETE FROM files WHERE id = ?',
+                                (file_id,))
+
+    def _store(self, path, stat, file_format, dataset, error=None):
+        """
+        Replace the catalog row of `path` with one for `dataset`, or
+        for `error` if the file couldn't be read
+        """
+        row = self.connection.execute('SELECT id FROM files WHERE path = ?',
+                                      (path,)).fetchone()
+        if row is not None:
+            self._delete(row[0])
+
+        size, mtime = stat
+        if dataset is None:
+            self.connection.execute(
+                'INSERT INTO files (path, size, mtime, format, site, error) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                (path, size, mtime, file_format or None,
+                 site_from_path(path), error))
+            return
+
+        # NaT is the smallest int64
+        nanoseconds = np.asarray(dataset.utc_dates,
+                                 dtype='M8[ns]').view(np.int64)
+        nanoseconds = nanoseconds[nanoseconds != np.iinfo(np.int64).min]
+        if len(nanoseconds):
+            start_time = int(nanoseconds.min() // 10 ** 9)
+            stop_time = int(nanoseconds.max() // 10 ** 9)
+        else:
+            start_time, stop_time = None, None
+
+        site = site_from_path(path) or \
+            str(getattr(dataset, 'site_name', '') or '').strip() or None
+        cursor = self.connection.execute(
+            'INSERT INTO files (path, size, mtime, format, site, '
+            'serial_number, manufacturer, start_time, stop_time, row_count) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            (path, size, mtime, file_format, site,
+             _metadata_value(dataset.serial_number),
+             _metadata_value(dataset.manufacturer), start_time, stop_time,
+             len(dataset.utc_dates)))
+
+        # derived parameters aren't counted, they could be derived from
+        # the catalogued parameters
+        if hasattr(dataset.data, 'measured_items'):
+            data_items = dataset.data.measured_items()
+        else:
+            data_items = dataset.data.items()
+        self.connection.executemany(
+            'INSERT INTO parameters (file_id, parameter, count) '
+            'VALUES (?, ?, ?)',
+            [(cursor.lastrowid, param,
+              int(np.count_nonzero(~np.isnan(np.asarray(values,
+                                                        dtype=float)))))
+             for param, values in data_items])
+
+    def files(self, site=None, parameter=None, start=None, end=None,
+              errors=False):
+        """
+        Return the catalogued files as a list of dicts of their catalog
+        rows, ordered by site and start time. Each dict also has a
+        `parameters` dict of the number of values of each parameter.
+
+        The files can be limited to those of a `site`, with values of a
+        `parameter` or with timestamps between `start` and `end`
+        (datetimes, naive ones are taken as UTC). Files that couldn't
+        be read are only included if `errors` is True.
+        """
+        where, args = self._where(site, parameter, start, end, errors)
+        cursor = self.connection.execute(
+            'SELECT * FROM files' + where + ' ORDER BY site, start_time, path',
+            args)
+        columns = [column[0] for column in cursor.description]
+        files = []
+        for row in cursor.fetchall():
+            record = dict(zip(columns, row))
+            record['start_time'] = _to_datetime(record['start_time'])
+            record['stop_time'] = _to_datetime(record['stop_time'])
+            record['parameters'] = dict(self.connection.execute(
+                'SELECT parameter, count FROM parameters WHERE file_id = ?',
+                (record['id'],)).fetchall())
+            files.append(record)
+
+        return files
+
+    def sites(self):
+        """Return the sites of the catalogued files, in order"""
+        return [row[0] for row in self.connection.execute(
+            'SELECT DISTINCT site FROM files WHERE site IS NOT NULL '
+            'ORDER BY site')]
+
+    def coverage(self, site=None, parameter=None, start=None, end=None):
+        """
+        Return the availability of each parameter at each site as a
+        list of (site, parameter, start_time, stop_time, file_count,
+        value_count) tuples, ordered by site and parameter. See `files`
+        for the arguments.
+        """
+        where, args = self._where(site, parameter, start, end, False)
+        query = ('SELECT files.site, parameters.parameter, '
+                 'MIN(files.start_time), MAX(files.stop_time), COUNT(*), '
+                 'SUM(parameters.count) FROM files JOIN parameters '
+                 'ON parameters.file_id = files.id' + where +
+                 (' AND' if where else ' WHERE') + ' parameters.count > 0')
+        if parameter is not None:
+            query += ' AND parameters.parameter = ?'
+            args.append(parameter)
+        query += (' GROUP BY files.site, parameters.parameter '
+                  'ORDER BY files.site, parameters.parameter')
+
+        rows = self.connection.execute(query, args)
+        return [(row_site, row_parameter, _to_datetime(start_time),
+                 _to_datetime(stop_time), file_count, value_count)
+                for row_site, row_parameter, start_time, stop_time,
+                file_count, value_count in rows]
+
+    def _where(self, site, parameter, start, end, errors):
+        """the WHERE clause and arguments of a files query"""
+        conditions = []
+        args = []
+        if not errors:
+            conditions.append('files.error IS NULL')
+        if site is not None:
+            conditions.append('files.site = ?')
+            args.append(site)
+        if parameter is not None:
+            conditions.append('EXISTS (SELECT 1 FROM parameters AS p '
+                              'WHERE p.file_id = files.id AND '
+                              'p.parameter = ? AND p.count > 0)')
+            args.append(parameter)
+        if start is not None:
+            conditions.append('files.stop_time >= ?')
+            args.append(_to_seconds(start))
+        if end is not None:
+            conditions.append('files.start_time <= ?')
+            args.append(_to_seconds(end))
+
+        if not conditions:
+            return '', args
+        return ' WHERE ' + ' AND '.join(conditions), args
+
+
+def _metadata_value(value):
+    """a serial number or manufacturer as a string, or None"""
+    value = str(value).strip()
+    return value or None
+
+
+def _to_seconds(date):
+    """seconds since 1970-01-01 UTC of a datetime"""
+    if date.tzinfo is not None:
+        date = date.replace(tzinfo=None) - date.utcoffset()
+    return calendar.timegm(date.timetuple())
+
+
+def _to_datetime(seconds):
+    """naive datetime of seconds since 1970-01-01 UTC, None for None"""
+    if seconds is None:
+        return None
+    return datetime.datetime(1970, 1, 1) + datetime.timedelta(
+        seconds=seconds)
@@ -0,0 +1,397 @@
+"""
+    sonde.derived
+    ~~~~~~~~~~~~~
+
+    This module keeps the registry of derived parameters, i.e.
+    parameters that can be calculated from other parameters of a
+    dataset, such as salinity from conductivity and temperature.
+
+    Each derived parameter is registered with the parameters it
+    requires, the parameters it uses if they are present, the units it
+    wants them in and a function that calculates it from plain float
+    arrays. A parameter can be registered more than once, e.g. salinity
+    from either specific conductance or electrical conductivity; the
+    first registration whose required parameters are measured is used,
+    otherwise the first whose required parameters can be derived.
+
+    The `data` dict of a dataset is a DerivedData. Any parameter that
+    can be derived is calculated the first time it is accessed, and kept
+    until one of the parameters it was calculated from is replaced. Only
+    the derived parameters registered as `listed` (salinity, which
+    datasets have always included) are listed alongside the measured
+    ones by keys(), items() and `in`; the others have to be asked for by
+    code, see DerivedData.derived_keys().
+"""
+from __future__ import absolute_import
+
+import numpy as np
+import quantities as pq
+
+from sonde import quantities as sq
+from sonde import salinity
+
+
+class DerivedParameter(object):
+    """
+    A registered way of deriving the parameter `code`. `requires` and
+    `optional` are dicts that map the codes of the input parameters to
+    the units they are passed in. `function` is called with a dict of
+    the input values, as plain arrays, and returns the derived values in
+    `unit`. Optional inputs are only used if they are measured. If
+    `listed` is True the parameter is listed with the measured ones in
+    the data of the datasets it can be derived for.
+    """
+    def __init__(self, code, function, requires, optional=None, unit=None,
+                 listed=False):
+        self.code = code
+        self.function = function
+        self.requires = requires
+        self.optional = optional or {}
+        self.unit = unit
+        self.listed = listed
+
+    @property
+    def inputs(self):
+        """the codes of all the parameters the derivation can use"""
+        return set(self.requires) | set(self.optional)
+
+
+#: registered derived parameters, a list of DerivedParameters in order
+#: of preference keyed by parameter code
+derived_registry = {}
+
+
+def register_derived(code, function, requires, optional=None, unit=None,
+                     listed=False):
+    """
+    Register a way of deriving the parameter `code`. See
+    DerivedParameter for the arguments.
+    """
+    derived = DerivedParameter(code, function, requires, optional=optional,
+                               unit=unit, listed=listed)
+    derived_registry.setdefault(code, []).append(derived)
+
+    return derived
+
+
+class DerivedData(dict):
+    """
+    The data dict of a dataset. The keys are the codes of the measured
+    parameters plus those that can be derived from them; derived values
+    are calculated by `dataset` on first access and cached.
+
+    Replacing a value with `data[code] = values` drops the cached
+    values derived from it. Values that are modified in place have to
+    be assigned back to be noticed. Assigning to a derived parameter
+    replaces it with the assigned values, and deleting it stops it
+    being derived.
+    """
+    def __init__(self, dataset, values=None):
+        super(DerivedData, self).__init__()
+        self.dataset = dataset
+        # derived values that have been calculated, mapped to the codes
+        # they can depend on
+        self._computed = {}
+        # derived parameters that were deleted
+        self._suppressed = set()
+        self._resolved = None
+        if values:
+            dict.update(self, values)
+
+    def __reduce__(self):
+        return (_restore_derived_data,
+                (self.dataset, dict(self.measured_items()),
+                 self._suppressed))
+
+    def measured_keys(self):
+        """Return the codes of the parameters that aren't derived"""
+        return [code for code in dict.keys(self)
+                if code not in self._computed]
+
+    def measured_items(self):
+        """Return (code, values) pairs for the parameters that aren't
+        derived"""
+        return [(code, dict.__getitem__(self, code))
+                for code in self.measured_keys()]
+
+    def derived_keys(self):
+        """Return the codes of all the parameters that can be derived,
+        listed or not"""
+        return self._resolve().keys()
+
+    def _is_listed(self, code):
+        """True if `code` is measured or a listed derived parameter"""
+        derived = self._resolve().get(code)
+        if derived is None:
+            return dict.__contains__(self, code)
+        return derived.listed
+
+    def is_derived(self, code):
+        """Return True if the values of `code` are derived"""
+        return code in self._resolve()
+
+    def invalidate(self, code):
+        """
+        Drop the cached values of the derived parameter `code`, and of
+        everything derived from it, so they are calculated again on
+        next access
+        """
+        if code in self._computed:
+            del self._computed[code]
+            dict.__delitem__(self, code)
+            self.dataset.units.pop(code, None)
+        self._invalidate_dependents(code)
+
+    def _invalidate_dependents(self, code):
+        for derived_code, inputs in self._computed.items():
+            if code in inputs and derived_code in self._computed:
+                self.invalidate(derived_code)
+
+    def _changed(self):
+        """forget everything derived when a parameter is added or
+        removed, as it can change how parameters are derived"""
+        for code in self._computed.keys():
+            dict.__delitem__(self, code)
+            self.dataset.units.pop(code, None)
+        self._computed = {}
+        self._resolved = None
+
+    def _resolve(self):
+        """
+        Return a dict that maps the codes of the parameters that can be
+        derived to the DerivedParameter used to derive them
+        """
+        if self._resolved is not None:
+            return self._resolved
+
+        measured = set(self.measured_keys())
+        resolved = {}
+        codes = sorted(code for code in derived_registry
+                       if code not in measured and
+                       code not in self._suppressed)
+
+        # prefer deriving from measured parameters
+        for code in codes:
+            for derived in derived_registry[code]:
+                if measured.issuperset(derived.requires):
+                    resolved[code] = derived
+                    break
+
+        # then from other derived parameters, until nothing changes
+        available = measured | set(resolved)
+        added = True
+        while added:
+            added = False
+            for code in codes:
+                if code in available:
+                    continue
+                for derived in derived_registry[code]:
+                    if available.issuperset(derived.requires):
+                        resolved[code] = derived
+                        available.add(code)
+                        added = True
+                        break
+
+        self._resolved = resolved
+        return resolved
+
+    def __missing__(self, code):
+        derived = self._resolve().get(code)
+        if derived is None:
+            raise KeyError(code)
+
+        values = self.dataset._derive(derived)
+        dict.__setitem__(self, code, values)
+        self._computed[code] = derived.inputs
+        return values
+
+    def __setitem__(self, code, values):
+        structural = code not in self.measured_keys()
+        self._computed.pop(code, None)
+        self._suppressed.discard(code)
+        dict.__setitem__(self, code, values)
+        if structural:
+            self._changed()
+        else:
+            self._invalidate_dependents(code)
+
+    def __delitem__(self, code):
+        if not dict.__contains__(self, code) and code not in self._resolve():
+            raise KeyError(code)
+        if code in derived_registry:
+            self._suppressed.add(code)
+        if dict.__contains__(self, code):
+            dict.__delitem__(self, code)
+        self._computed.pop(code, None)
+        self._changed()
+
+    def __contains__(self, code):
+        return self._is_listed(code)
+
+    has_key = __contains__
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def keys(self):
+        """Return the codes of the measured and listed derived
+        parameters"""
+        derived_keys = [code for code in sorted(self._resolve())
+                        if not dict.__contains__(self, code) and
+                        self._is_listed(code)]
+        return [code for code in dict.keys(self) if self._is_listed(code)] + \
+            derived_keys
+
+    iterkeys = __iter__
+
+    def values(self):
+        return [self[code] for code in self.keys()]
+
+    def itervalues(self):
+        return iter(self.values())
+
+    def items(self):
+        return [(code, self[code]) for code in self.keys()]
+
+    def iteritems(self):
+        return iter(self.items())
+
+    def get(self, code, default=None):
+        try:
+            return self[code]
+        except KeyError:
+            return default
+
+    def pop(self, code, *default):
+        if code not in self:
+            if default:
+                return default[0]
+            raise KeyError(code)
+        values = self[code]
+        del self[code]
+        return values
+
+    def popitem(self):
+        if not len(self):
+            raise KeyError('popitem(): dictionary is empty')
+        code = self.keys()[0]
+        return code, self.pop(code)
+
+    def setdefault(self, code, default=None):
+        if code not in self:
+            self[code] = default
+        return self[code]
+
+    def update(self, *args, **kwargs):
+        for code, values in dict(*args, **kwargs).iteritems():
+            self[code] = values
+
+    def clear(self):
+        dict.clear(self)
+        self._computed = {}
+        self._suppressed = set()
+        self._resolved = None
+
+    def copy(self):
+        """Return a plain dict of the values of the measured and
+        listed derived parameters, deriving any that haven't been
+        calculated yet"""
+        return dict(self.items())
+
+
+def _restore_derived_data(dataset, values, suppressed):
+    """unpickle a DerivedData"""
+    data = DerivedData(dataset, values)
+    data._suppressed = set(suppressed)
+    return data
+
+
+# Built in derived parameters
+
+# atmospheric pressure in dbar
+_atm = float(pq.atm.rescale(sq.dbar).magnitude)
+
+_pressure_inputs = {'water_depth_non_vented': sq.dbar,
+                    'water_depth_vented': sq.dbar}
+
+
+def _pressure(values):
+    """the pressure in dbar used for salinity"""
+    if 'water_depth_non_vented' in values:
+        return values['water_depth_non_vented'] + _atm
+    elif 'water_depth_vented' in values:
+        return values['water_depth_vented']
+    else:
+        return _atm
+
+
+def _salinity_from_specific_conductance(values):
+    R = values['water_specific_conductance'] / 42.914
+    return salinity.salt(R, 25.0, _pressure(values))
+
+
+def _salinity_from_conductivity(values):
+    R = values['water_electrical_conductivity'] / 42.914
+    return salinity.salt(R, values['water_temperature'], _pressure(values))
+
+
+#: the temperature compensation coefficient used for specific
+#: conductance, per degC
+specific_conductance_coefficient = 0.0191
+
+
+def _specific_conductance(values):
+    return values['water_electrical_conductivity'] / \
+        (1 + specific_conductance_coefficient *
+         (values['water_temperature'] - 25.0))
+
+
+def _oxygen_saturation(values):
+    """
+    Dissolved oxygen as a percentage of its solubility at 1 atm, from
+    Benson and Krause (1984) as given in APHA Standard Methods 4500-O
+    """
+    T = values['water_temperature'] + 273.15
+    ln_solubility = -139.34411 + (1.575701e5 + (-6.642308e7 +
+                                                (1.243800e10 -
+                                                 8.621949e11 / T) / T) /
+                                  T) / T
+    if 'seawater_salinity' in values:
+        ln_solubility -= values['seawater_salinity'] * \
+            (1.7674e-2 + (-1.0754e1 + 2.1407e3 / T) / T)
+
+    return 100 * values['water_dissolved_oxygen_concentration'] / \
+        np.exp(ln_solubility)
+
+
+def _depth_from_pressure(values):
+    return values['water_pressure']
+
+
+def _vented_depth(values):
+    return values['water_depth_non_vented'] - values['air_pressure']
+
+
+register_derived('seawater_salinity', _salinity_from_specific_conductance,
+                 {'water_specific_conductance': sq.mScm},
+                 optional=_pressure_inputs, unit=sq.psu, listed=True)
+register_derived('seawater_salinity', _salinity_from_conductivity,
+                 {'water_electrical_conductivity': sq.mScm,
+                  'water_temperature': pq.degC},
+                 optional=_pressure_inputs, unit=sq.psu, listed=True)
+register_derived('water_specific_conductance', _specific_conductance,
+                 {'water_electrical_conductivity': sq.mScm,
+                  'water_temperature': pq.degC}, unit=sq.mScm)
+register_derived('water_dissolved_oxygen_percent_saturation',
+                 _oxygen_saturation,
+                 {'water_dissolved_oxygen_concentration': sq.mgl,
+                  'water_temperature': pq.degC},
+                 optional={'seawater_salinity': sq.psu}, unit=pq.percent)
+register_derived('water_depth_non_vented', _depth_from_pressure,
+                 {'water_pressure': sq.mH2O}, unit=sq.mH2O)
+register_derived('water_depth_vented', _vented_depth,
+                 {'water_depth_non_vented': sq.mH2O,
+                  'air_pressure': sq.mH2O}, unit=sq.mH2O)
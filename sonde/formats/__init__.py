@@ -0,0 +1,225 @@
+"""
+    sonde.formats
+    ~~~~~~~~~~~~~
+
+    This module keeps the registry of the file formats sonde can read.
+
+    Each format is registered with a name, the dotted path of its
+    dataset class and an optional sniff function that is used by
+    sonde.autodetect. The dataset class is only imported the first time
+    a file in that format is read, so the dependencies of a format
+    module (e.g. pandas for lcra and midgewater) are only loaded when
+    they are needed.
+
+    A sniff function is called as `sniff(prefix, filename)`, where
+    `prefix` is the first bytes of the file (the first rows as csv text
+    for excel files) and `filename` is the name of the file, and
+    returns True if the file is in its format.
+"""
+from StringIO import StringIO
+
+
+class SondeFormat(object):
+    """
+    A registered file format. Sniffers with a lower `cost` are tried
+    first, formats with the same cost are tried in the order they were
+    registered. If `pass_format` is True the format name is passed to
+    the dataset class as its `format` argument.
+    """
+    def __init__(self, name, dataset, sniff=None, cost=0,
+                 pass_format=False):
+        self.name = name
+        self.dataset = dataset
+        self.sniff = sniff
+        self.cost = cost
+        self.pass_format = pass_format
+        self._dataset_class = None
+
+    def dataset_class(self):
+        """
+        Return the dataset class, importing its module if needed
+        """
+        if self._dataset_class is None:
+            module_name, class_name = self.dataset.rsplit('.', 1)
+            module = __import__(module_name, fromlist=[class_name])
+            self._dataset_class = getattr(module, class_name)
+
+        return self._dataset_class
+
+
+#: registered formats, keyed by lower case format name
+format_registry = {}
+
+# formats with a sniff function, in registration order
+_sniffers = []
+
+
+def register_format(name, dataset, sniff=None, cost=0, pass_format=False):
+    """
+    Register a file format. `dataset` is the dotted path of the dataset
+    class that reads the format. See SondeFormat for the other
+    arguments.
+    """
+    file_format = SondeFormat(name, dataset, sniff=sniff, cost=cost,
+                              pass_format=pass_format)
+    format_registry[name.lower()] = file_format
+    if sniff is not None:
+        _sniffers.append(file_format)
+        # sort is stable, so equal costs keep registration order
+        _sniffers.sort(key=lambda registered: registered.cost)
+
+    return file_format
+
+
+def get_format(name):
+    """
+    Return the registered SondeFormat for the format `name`
+    """
+    try:
+        return format_registry[name.lower()]
+    except KeyError:
+        raise NotImplementedError("file format '%s' is not supported" % \
+                                  (name,))
+
+
+def sniff_format(prefix, filename):
+    """
+    Return the name of the first registered format whose sniff function
+    accepts the file, or None if none of them do.
+    """
+    for file_format in _sniffers:
+        if file_format.sniff(prefix, filename):
+            return file_format.name
+
+    return None
+
+
+def _lines(prefix, count=3):
+    """
+    Return the first `count` lines of `prefix`, padded with empty
+    strings like readline does at the end of a file
+    """
+    prefix_fid = StringIO(prefix)
+    return [prefix_fid.readline() for i in range(count)]
+
+
+def _file_ext(filename):
+    return filename.split('.')[-1].lower()
+
+
+# The built in sniffers only look at the first three lines of the file,
+# so they all cost the same; registration order decides between formats
+# that could both match a file.
+
+def _sniff_greenspan(prefix, filename):
+    return _lines(prefix)[0].lower().find('greenspan') != -1
+
+
+def _sniff_macroctd(prefix, filename):
+    return _lines(prefix)[0].lower().find('macroctd') != -1
+
+
+def _sniff_solinst(prefix, filename):
+    lines = _lines(prefix)
+    return lines[0].lower().find('data file for datalogger.') != -1 or \
+           (lines[0].find('Serial_number:') != -1 and
+            lines[2].find('Project ID:') != -1)
+
+
+def _sniff_hydrolab(prefix, filename):
+    return _lines(prefix)[0].lower().find('log file name') != -1
+
+
+def _sniff_generic(prefix, filename):
+    return _lines(prefix)[0].lower().find('pysonde csv format') != -1
+
+
+def _sniff_hydrotech(prefix, filename):
+    lines = _lines(prefix)
+    # possible binary junk in first line of hydrotech file
+    return lines[0].lower().find('minisonde4a') != -1 or \
+           lines[1].lower().find('log file name') != -1
+
+
+def _sniff_lcra(prefix, filename):
+    return _lines(prefix)[0].lower().find('the following data have been') \
+           != -1
+
+
+def _sniff_espey(prefix, filename):
+    # ascii files for ysi in brazos riv.
+    return _lines(prefix)[0].find('espey') != -1
+
+
+def _sniff_ysi_binary(prefix, filename):
+    return _lines(prefix)[0][:1] == 'A'
+
+
+def _sniff_ysi_text(prefix, filename):
+    return _lines(prefix)[0].find('=') != -1
+
+
+def _sniff_ysi_ascii(prefix, filename):
+    return _lines(prefix)[0].find('##YSI ASCII Datafile=') != -1
+
+
+def _sniff_ysi_cdf(prefix, filename):
+    return _file_ext(filename) == 'cdf'
+
+
+def _sniff_ysi_csv(prefix, filename):
+    lines = _lines(prefix)
+    return lines[0].find("Date") > -1 and lines[1].find("M/D/Y") > -1
+
+
+def _sniff_eureka(prefix, filename):
+    lines = _lines(prefix)
+    # try and detect degree symbol
+    return lines[1].find('\xb0') > -1 or lines[2].find('Manta') > -1 or \
+           lines[0].find('Start time : ') > -1
+
+
+def _sniff_netcdf4(prefix, filename):
+    # netcdf4 files are hdf5 files
+    return prefix.startswith('\x89HDF\r\n\x1a\n')
+
+
+def _sniff_midgewater(prefix, filename):
+    # files from various intruments processed by an old script.
+    return _lines(prefix)[0].lower().find('request date') != -1
+
+
+register_format('greenspan', 'sonde.formats.greenspan.GreenspanDataset',
+                _sniff_greenspan)
+register_format('macroctd', 'sonde.formats.macroctd.MacroctdDataset',
+                _sniff_macroctd)
+register_format('solinst', 'sonde.formats.solinst.SolinstDataset',
+                _sniff_solinst)
+register_format('hydrolab', 'sonde.formats.hydrolab.HydrolabDataset',
+                _sniff_hydrolab)
+register_format('generic', 'sonde.formats.generic.GenericDataset',
+                _sniff_generic)
+# hydrotech files can have binary junk in the first line and the log
+# file name in the second, so they are tried after hydrolab and generic
+register_format('hydrotech', 'sonde.formats.hydrotech.HydrotechDataset',
+                _sniff_hydrotech)
+register_format('lcra', 'sonde.formats.lcra.LcraDataset', _sniff_lcra)
+register_format('espey', 'sonde.formats.espey.EspeyDataset', _sniff_espey,
+                pass_format=True)
+register_format('ysi_binary', 'sonde.formats.ysi.YSIDataset',
+                _sniff_ysi_binary, pass_format=True)
+register_format('ysi_text', 'sonde.formats.ysi.YSIDataset', _sniff_ysi_text,
+                pass_format=True)
+register_format('ysi_ascii', 'sonde.formats.ysi.YSIDataset',
+                _sniff_ysi_ascii, pass_format=True)
+register_format('ysi_cdf', 'sonde.formats.ysi.YSIDataset', _sniff_ysi_cdf,
+                pass_format=True)
+register_format('ysi_csv', 'sonde.formats.ysi.YSIDataset', _sniff_ysi_csv,
+                pass_format=True)
+register_format('eureka', 'sonde.formats.eureka.EurekaDataset',
+                _sniff_eureka)
+register_format('midgewater', 'sonde.formats.midgewater.MidgewaterDataset',
+                _sniff_midgewater)
+register_format('netcdf4', 'sonde.formats.netcdf.NetcdfDataset',
+                _sniff_netcdf4)
+register_format('ysi', 'sonde.formats.ysi.YSIDataset')
@@ -8,9 +8,7 @@
 from __future__ import absolute_import
 
 from datetime import datetime
-import pkg_resources
 import re
-from StringIO import StringIO
 import struct
 import time
 import warnings
@@ -20,12 +18,11 @@ import quantities as pq
 
 from .. import sonde
 from .. import quantities as sq
+from .. import timeparse
+from . import ysi
 from ..timezones import cdt, cst
 
 
-DEFAULT_ESPEY_PARAM_DEF = 'data/ysi_param.def'
-
-
 class EspeyDataset(sonde.BaseSondeDataset):
     """
     Dataset object that represents the data contained in a ESPEY binary
@@ -34,13 +31,14 @@ class EspeyDataset(sonde.BaseSondeDataset):
     object that represents the timezone of the timestamps in the
     binary file.
     """
-    def __init__(self, data_file, tzinfo=None, param_file=None, format=None):
-        self.file_format = sonde.autodetect(data_file) or 'espey'
+    def __init__(self, data_file, tzinfo=None, param_file=None, format=None,
+                 **kwargs):
+        self.file_format = format or sonde.autodetect(data_file) or 'espey'
         self.manufacturer = 'espey'
         self.data_file = data_file
         self.param_file = param_file
         self.default_tzinfo = tzinfo
-        super(EspeyDataset, self).__init__(data_file)
+        super(EspeyDataset, self).__init__(data_file, **kwargs)
 
     def _read_data(self):
         """
@@ -100,7 +98,8 @@ class EspeyDataset(sonde.BaseSondeDataset):
                 pcode = param_map[(parameter.name).strip()]
                 punit = unit_map[(parameter.unit).strip()]
                 self.parameters[pcode] = sonde.master_parameter_list[pcode]
-                self.data[param_map[parameter.name]] = parameter.data * punit
+                self._set_parameter_data(param_map[parameter.name],
+                                         parameter.data, punit)
             except KeyError:
                 warnings.warn('Un-mapped Parameter/Unit Type:\n'
                               '%s parameter name: "%s"\n'
@@ -188,7 +187,6 @@ class ESPEYReaderTxt:
         timestr = line1[2]
         start = 2
 
-        fmt = '%m/%d/%Y %H:%M:%S'
 
         params = fields[start:]
         units = units[start:]
@@ -205,11 +203,9 @@ class ESPEYReaderTxt:
 
         fid.seek(fid_initial_location)
 
-        self.dates = np.array(
-            [datetime.strptime(d.strip('"') + ' ' + \
-                               t.strip('"'), fmt)
-             for d, t in zip(data['Date'], data['Time'])]
-            )
+        self.dates = timeparse.to_datetimes(
+            timeparse.to_epoch(data['Date'], '%m/%d/%Y', data['Time'],
+                               '%H:%M:%S', strip='"'))
 
         #assign param & unit names
         for param, unit in zip(params, units):
@@ -277,36 +273,14 @@ class ESPEYReaderBin:
 
     def read_param_def(self, param_file):
         """
-        Open and read a ESPEY param definition file.
+        Read a ESPEY param definition file, see ysi.load_param_def
         """
-        if param_file == None:
-            file_string = pkg_resources.resource_string('sonde',
-                                                        DEFAULT_ESPEY_PARAM_DEF)
-        elif type(param_file) == str:
-            with open(param_file, 'rb') as fid:
-                file_string = fid.read()
-
-        elif type(param_file) == file:
-            file_string = param_file.read()
-
-        file_string = re.sub("\n\s*\n*", "\n", file_string)
-        file_string = re.sub(";.*\n*", "", file_string)
-        file_string = re.sub("\t", "", file_string)
-        file_string = re.sub("\"", "", file_string)
-        self.espey_file_version = int(file_string.splitlines()[0].split('=')[-1])
-        self.espey_num_param_in_def = int(
-            file_string.splitlines()[1].split('=')[-1])
-        self.espey_ecowatch_version = int(
-            file_string.splitlines()[2].split('=')[-1])
-        dtype = np.dtype([('espey_id', '<i8'),
-                          ('name', '|S20'),
-                          ('unit', '|S11'),
-                          ('shortname', '|S9'),
-                          ('num_dec_places', '<i8')])
-        self.espey_param_def = np.genfromtxt(StringIO(file_string),
-                                           delimiter=',',
-                                           usecols=(0, 1, 3, 5, 7),
-                                           skip_header=3, dtype=dtype)
+        param_def = ysi.load_param_def(param_file)
+        self.espey_file_version = param_def.file_version
+        self.espey_num_param_in_def = param_def.num_param_in_def
+        self.espey_ecowatch_version = param_def.ecowatch_version
+        self.espey_param_def = param_def.table
+        self.espey_param_types = param_def.types
 
     def read_espey(self, espey_file):
         """
@@ -343,7 +317,7 @@ class ESPEYReaderBin:
                 fmt_size = struct.calcsize(fmt)
                 self.parameters.append(
                     ChannelRec(struct.unpack(fmt, fid.read(fmt_size)),
-                               self.espey_param_def))
+                               self.espey_param_types))
 
             elif record_type == 'D':
                 fmt = '<l' + str(self.num_params) + 'f'
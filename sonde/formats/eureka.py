@@ -9,7 +9,7 @@
 from __future__ import absolute_import
 
 import datetime
-import os
+from StringIO import StringIO
 import warnings
 
 import numpy as np
@@ -17,7 +17,7 @@ import quantities as pq
 import xlrd
 
 from .. import sonde
-from sonde import util
+from sonde import timeparse, util
 from sonde import quantities as sq
 
 
@@ -28,14 +28,14 @@ class EurekaDataset(sonde.BaseSondeDataset):
     object that represents the timezone of the timestamps in the file.
     """
 
-    def __init__(self, data_file, tzinfo=None):
+    def __init__(self, data_file, tzinfo=None, **kwargs):
         self.file_format = 'eureka'
         self.manufacturer = 'eureka'
         self.data_file = data_file
         self.default_tzinfo = tzinfo
         self.data = dict()
         self.dates = []
-        super(EurekaDataset, self).__init__(data_file)
+        super(EurekaDataset, self).__init__(data_file, **kwargs)
 
     def _read_data(self):
         """
@@ -79,8 +79,8 @@ class EurekaDataset(sonde.BaseSondeDataset):
                 #ignore params that have no data
                 if not np.all(np.isnan(parameter.data)):
                     self.parameters[pcode] = sonde.master_parameter_list[pcode]
-                    self.data[param_map[parameter.name]] = parameter.data * \
-                                                           punit
+                    self._set_parameter_data(param_map[parameter.name],
+                                             parameter.data, punit)
             except KeyError:
                 warnings.warn('Un-mapped Parameter/Unit Type:\n'
                               '%s parameter name: "%s"\n'
@@ -126,11 +126,19 @@ class EurekaReader:
             self.file_name = data_file.name
         self.file_ext = self.file_name.split('.')[-1].lower()
 
-        temp_file_path = None
+        self.xls_columns = None
         if self.file_ext == 'xls':
-            temp_file_path, self.xlrd_datemode = util.xls_to_csv(
-                self.file_name)
-            file_buf = open(temp_file_path, 'rb')
+            sheet, self.xlrd_datemode = util.open_xls_sheet(data_file)
+            # the header is read as text, up to the units row under the
+            # 'Date' row, and the data straight from the columns
+            header_rows = sheet.nrows
+            for row, val in enumerate(sheet.col_values(0)):
+                if util._xls_cell_str(val)[0:4] == 'Date':
+                    header_rows = row + 2
+                    self.xls_columns = util.xls_columns(sheet, header_rows)
+                    break
+            file_buf = StringIO(util.xls_sheet_to_csv(sheet,
+                                                      nrows=header_rows))
         else:
             if type(data_file) == str:
                 file_buf = open(data_file)
@@ -144,8 +152,7 @@ class EurekaReader:
         finally:
             if type(data_file) == str:
                 file_buf.close()
-            if temp_file_path:
-                os.remove(temp_file_path)
+            self.xls_columns = None
 
         if tzinfo:
             if hasattr(self, 'setup_time'):
@@ -199,32 +206,53 @@ class EurekaReader:
         params = fields[2:]
         units = file_buf.readline().strip('\r\n').split(',')[2:]
 
-        data = np.genfromtxt(file_buf, delimiter=',', dtype=None, names=fields)
+        if 'Date' not in fields or 'Time' not in fields:
+            raise ValueError("No Date and Time fields found in file '%s'" %
+                             (self.file_name,))
+        date_col = fields.index('Date')
+        time_col = fields.index('Time')
+
+        if self.xls_columns is not None:
+            columns = self.xls_columns
+        else:
+            data = np.genfromtxt(file_buf, delimiter=',', dtype=None,
+                                 names=fields)
+            columns = [data[name] for name in data.dtype.names]
 
         if self.file_ext == 'xls':  # xlrd reads in dates as floats
-            self.dates = np.array(
-                [(datetime.datetime(*xlrd.xldate_as_tuple(d, 0))
-                  + datetime.timedelta(t))
-                 for d, t in zip(data['Date'], data['Time'])])
+            days = np.asarray(columns[date_col], dtype=float)
+            dates, valid = util.xldates_to_datetime64(days,
+                                                      self.xlrd_datemode)
+            for index in np.flatnonzero(~valid):
+                # raises the error for the bad date
+                dates[index] = datetime.datetime(
+                    *xlrd.xldate_as_tuple(days[index], self.xlrd_datemode))
+            times = np.round(np.asarray(columns[time_col], dtype=float) *
+                             86400e6).astype('i8')
+            self.dates = (dates.astype('M8[us]') + times).astype(object)
 
         else:
-            self.dates = np.array(
-                [datetime.datetime.strptime(d + t, '%m/%d/%Y%H:%M:%S')
-                 for d, t in zip(data['Date'], data['Time'])])
+            self.dates = timeparse.to_datetimes(
+                timeparse.to_epoch(columns[date_col], '%m/%d/%Y',
+                                   columns[time_col], '%H:%M:%S'))
 
         #assign param & unit names
-        for param, unit in zip(params, units):
+        param_cols = []
+        manta_cols = []
+        for col, (param, unit) in enumerate(zip(params, units), 2):
             # grab serial number from the second 'Manta' field if it
             # exists
             if param.strip() == 'Manta':
-                if 'Manta_1' in data.dtype.fields:
-                    self.serial_number = data['Manta_1'][0].strip()
+                manta_cols.append(col)
+                if len(manta_cols) == 2 and len(columns[col]):
+                    self.serial_number = str(columns[col][0]).strip()
 
             elif param.strip() != '':  # remove trailing blank column
                 if param == 'SAL':  # fix unitless Salinity column
                     unit = 'psu'
 
                 self.parameters.append(Parameter(param.strip(), unit.strip()))
+                param_cols.append(col)
 
         # if the serial number just contains numbers the cell holding
         # it might be formatted as a number, in which case it gets
@@ -233,9 +261,8 @@ class EurekaReader:
                self.serial_number.rfind('.0') == len(self.serial_number) - 2:
             self.serial_number = self.serial_number[:-2]
 
-        for ii in range(len(self.parameters)):
-            param = (self.parameters[ii].name).strip(' .').replace(' ', '_')
-            self.parameters[ii].data = data[param]
+        for parameter, col in zip(self.parameters, param_cols):
+            parameter.data = columns[col]
 
 
 class Parameter:
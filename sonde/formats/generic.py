@@ -32,18 +32,18 @@
 from __future__ import absolute_import
 
 import csv
-import datetime
+import itertools
 import pkg_resources
 import re
 from StringIO import StringIO
 import warnings
-import xlrd
 
 import numpy as np
 import quantities as pq
 
 from .. import sonde
 from .. import quantities as sq
+from .. import timeparse
 from ..timezones import UTCStaticOffset
 
 
@@ -52,11 +52,23 @@ class GenericDataset(sonde.BaseSondeDataset):
     Dataset object that represents the data contained in a generic csv
     file.
     """
-    def __init__(self, data_file):
+    def __init__(self, data_file, reader=None, **kwargs):
         self.manufacturer = 'generic'
         self.file_format = 'generic'
         self.data_file = data_file
-        super(GenericDataset, self).__init__(data_file)
+        self._reader = reader
+        super(GenericDataset, self).__init__(data_file, **kwargs)
+
+    @classmethod
+    def iter_chunks(cls, data_file, chunk_rows, **kwargs):
+        """
+        Read a generic csv file `chunk_rows` rows at a time, yielding a
+        GenericDataset for each chunk. Only the current chunk is held
+        in memory.
+        """
+        generic_data = GenericReader(data_file, chunk_rows=chunk_rows)
+        for chunk in generic_data.chunks:
+            yield cls(data_file, reader=chunk, **kwargs)
 
     def _read_data(self):
         """
@@ -80,7 +92,11 @@ class GenericDataset(sonde.BaseSondeDataset):
                     'ntu': sq.ntu,
                     }
 
-        generic_data = GenericReader(self.data_file)
+        if self._reader is not None:
+            generic_data = self._reader
+            self._reader = None
+        else:
+            generic_data = GenericReader(self.data_file)
         self.parameters = dict()
         self.data = dict()
         metadata = dict()
@@ -97,7 +113,7 @@ class GenericDataset(sonde.BaseSondeDataset):
                     punit = unit_map[(parameter.unit.lower()).strip()]
                     if not np.all(np.isnan(parameter.data)):
                         self.parameters[pcode] = sonde.master_parameter_list[pcode]
-                        self.data[pcode] = parameter.data * punit
+                        self._set_parameter_data(pcode, parameter.data, punit)
                 except KeyError:
                     warnings.warn('Un-mapped Unit Type\n'
                                   'Unit Name: %s' % parameter.unit,
@@ -132,14 +148,20 @@ class GenericReader:
     object. It accepts one optional parameter, `tzinfo` is a
     datetime.tzinfo object that represents the timezone of the
     timestamps in the txt file.
+
+    If `chunk_rows` is given only the header is read straight away.
+    Instead `chunks` is a generator that reads the data `chunk_rows`
+    rows at a time, setting the dates and parameter data of the reader
+    to those of the chunk before yielding the reader itself.
     """
-    def __init__(self, data_file):
+    def __init__(self, data_file, chunk_rows=None):
         self.num_params = 0
         self.parameters = []
         self.format_parameters = {}
-        self.read_generic(data_file)
-        self.dates = [i.replace(tzinfo=self.default_tzinfo)
-                      for i in self.dates]
+        if chunk_rows is None:
+            self.read_generic(data_file)
+        else:
+            self.chunks = self.iter_generic(data_file, chunk_rows)
 
     def read_generic(self, data_file):
         """
@@ -151,6 +173,37 @@ class GenericReader:
         else:
             fid = data_file
 
+        self.read_header(fid)
+        self.read_rows(fid)
+
+    def iter_generic(self, data_file, chunk_rows):
+        """
+        Open a generic csv file and read its data `chunk_rows` rows at a
+        time, yielding the reader after each chunk has been read.
+        """
+        if type(data_file) == str:
+            fid = open(data_file, 'r')
+
+        else:
+            fid = data_file
+
+        try:
+            self.read_header(fid)
+            while True:
+                rows = list(itertools.islice(fid, chunk_rows))
+                if not rows:
+                    break
+
+                self.read_rows(rows)
+                yield self
+        finally:
+            if type(data_file) == str:
+                fid.close()
+
+    def read_header(self, fid):
+        """
+        Read the metadata, parameter and unit header lines
+        """
         buf = fid.readline().strip('# ')
         while buf:
             if buf[0:8].lower() == 'datetime':
@@ -165,17 +218,26 @@ class GenericReader:
         utc_offset = int(
             self.format_parameters['timezone'].lower().strip('utc'))
         self.default_tzinfo = UTCStaticOffset(utc_offset)
-        data = np.genfromtxt(fid, dtype=None, names=params, delimiter=',')
-        self.dates = np.array(
-            [datetime.datetime.strptime(dt, '%Y/%m/%d %H:%M:%S')
-             for dt in data['datetime']]
-            )
+        self.params = params
 
         #assign param & unit names
         for param, unit in zip(params[1:], units[1:]):
             self.num_params += 1
             self.parameters.append(Parameter(param.strip(), unit.strip()))
 
+    def read_rows(self, rows):
+        """
+        Read the data rows from `rows`, a file object or a list of lines
+        """
+        data = np.genfromtxt(rows, dtype=None, names=self.params,
+                             delimiter=',')
+        # a single row is read as a 0d array
+        data = np.atleast_1d(data)
+        self.dates = timeparse.to_datetimes(
+            timeparse.to_epoch(data['datetime'], '%Y/%m/%d %H:%M:%S'))
+        self.dates = [i.replace(tzinfo=self.default_tzinfo)
+                      for i in self.dates]
+
         for ii in range(self.num_params):
             param = self.parameters[ii].name
             self.parameters[ii].data = data[param]
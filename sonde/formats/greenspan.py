@@ -12,7 +12,6 @@ from __future__ import absolute_import
 
 import csv
 import datetime
-import os.path
 import pkg_resources
 import re
 from StringIO import StringIO
@@ -32,6 +31,10 @@ class BadDatafileError(IOError):
     pass
 
 
+# the number of header rows of a 2.x file, before its data rows
+header_rows = 15
+
+
 class GreenspanDataset(sonde.BaseSondeDataset):
     """
     Dataset object that represents the data contained in a greenspan txt
@@ -41,13 +44,13 @@ class GreenspanDataset(sonde.BaseSondeDataset):
     of the timestamps in the binary file.
     """
 
-    def __init__(self, data_file, tzinfo=None, format_version=None):
+    def __init__(self, data_file, tzinfo=None, format_version=None, **kwargs):
         self.file_format = 'greenspan'
         self.manufacturer = 'greenspan'
         self.data_file = data_file
         self.format_version = format_version
         self.default_tzinfo = tzinfo
-        super(GreenspanDataset, self).__init__(data_file)
+        super(GreenspanDataset, self).__init__(data_file, **kwargs)
 
     def _read_data(self):
         """
@@ -102,8 +105,8 @@ class GreenspanDataset(sonde.BaseSondeDataset):
                 #ignore params that have no data
                 if not np.all(np.isnan(parameter.data)):
                     self.parameters[pcode] = sonde.master_parameter_list[pcode]
-                    self.data[param_map[parameter.name]] = parameter.data * \
-                                                           punit
+                    self._set_parameter_data(param_map[parameter.name],
+                                             parameter.data, punit)
             except KeyError:
                 warnings.warn('Un-mapped Parameter/Unit Type:\n'
                               '%s parameter name: "%s"\n'
@@ -155,16 +158,28 @@ class GreenspanReader:
         self.data = {}
         self.dates = []
         self.xlrd_datemode = 0
+        self.xls_sheet = None
         if type(data_file) == str:
             self.file_name = data_file
         elif type(data_file) == file:
             self.file_name = data_file.name
         self.file_ext = self.file_name.split('.')[-1].lower()
 
-        temp_file_path = None
         if self.file_ext == 'xls':
-            temp_file_path, self.xlrd_datemode = util.xls_to_csv(self.file_name)
-            file_buf = open(temp_file_path, 'rb')
+            self.xls_sheet, self.xlrd_datemode = util.open_xls_sheet(
+                data_file)
+            # only the header of 2.x files is read as text, their data
+            # is read straight from the columns of the sheet. Block
+            # files have one of their lines in each row of the first
+            # column.
+            file_buf = StringIO(util.xls_sheet_to_csv(self.xls_sheet,
+                                                      nrows=header_rows))
+            if not self.format_version:
+                self.format_version = self.detect_format_version(file_buf)
+            if self.format_version == 'block':
+                lines = util.xls_columns(self.xls_sheet, 0, 1)[0]
+                file_buf = StringIO(''.join(line + '\r\n'
+                                            for line in lines))
         else:
             if type(data_file) == str:
                 file_buf = open(data_file)
@@ -180,8 +195,7 @@ class GreenspanReader:
             raise
         finally:
             file_buf.close()
-            if temp_file_path:
-                os.remove(temp_file_path)
+            self.xls_sheet = None
 
         if tzinfo:
             self.dates = [i.replace(tzinfo=tzinfo) for i in self.dates]
@@ -266,70 +280,15 @@ class GreenspanReader:
             # skip Channel Number line
             fid.readline()
 
-            #read data
-            data_start = fid.tell()
-
-            datestr = [line.split(',')[1] for line in fid]
-
-            # xlrd reads in dates as floats, but excel isn't too
-            # careful about datatypes and depending on how the file
-            # has been handled, there's a chance that the dates have
-            # already been converted to strings
-            number_of_unique_dates = len(np.unique(np.array(
-                [util.possibly_corrupt_xls_date_to_datetime(
-                    dt, self.xlrd_datemode)
-                 for dt in datestr])))
-
-            self.dates = np.array((datetime.datetime(1900, 1, 1), ) \
-                                  * number_of_unique_dates)
-
             for param, unit in zip(params, units):
-                param_name, unit_name = param.strip('()_'), unit.strip('()_')
-
                 # clean param & unit names
-                self.parameters.append(Parameter(param_name,
-                                                 unit_name))
-                # initialize data dict with empty arrays
-                self.data[param_name] = np.array((np.nan,) * len(self.dates))
-            fid.seek(data_start)
-            data_count = -1
-            last_date = None
-            for line in fid:
-                line_split = line.split(',')
-                date = util.possibly_corrupt_xls_date_to_datetime(
-                    line_split[1])
-                if date != last_date:
-                    if last_date and date < last_date:
-                        raise BadDatafileError(
-                            "Non-sequential timestamps found in file '%s'. "
-                            "This shouldn't happen!" % (fid.name,))
-
-                    data_count += 1
-                    self.dates[data_count] = date
-
-                for i, parameter in enumerate(self.parameters, start=3):
-                    val = line_split[i].strip()
-                    if date == last_date:
-                        if np.isnan(self.data[parameter.name][data_count]):
-                            if val != '':
-                                self.data[parameter.name][data_count] = \
-                                                                      float(val)
-                        elif val != '':
-                            warnings.warn("Conflicting values for parameter "
-                                          "'%s' on date: %s" % (
-                                              parameter.name,
-                                              self.dates[data_count]), Warning)
-                            self.data[parameter.name][data_count] = float(val)
-                    else:
-                        if val == '':
-                            self.data[parameter.name][data_count] = np.nan
-                        else:
-                            self.data[parameter.name][data_count] = float(val)
-
-                last_date = date
-
-            for ii, parameter in enumerate(self.parameters):
-                self.parameters[ii].data = self.data[parameter.name]
+                self.parameters.append(Parameter(param.strip('()_'),
+                                                 unit.strip('()_')))
+
+            if self.xls_sheet is not None:
+                self.read_xls_columns(len(fields))
+            else:
+                self.read_columns(fid, len(fields))
 
         elif self.format_version == 'block':
             self.header_lines = []
@@ -363,39 +322,7 @@ class GreenspanReader:
 
                 buf = fid.readline()
 
-            fmt = 'T%Y%m%d%H%M%S'
-            dates = []
-            data = []
-            row = None
-            prev_dt = None
-            while buf:
-                if buf[0] == 'T':
-                    dt = datetime.datetime.strptime(buf.strip('\r\n'), fmt)
-                    if dt != prev_dt:
-                        prev_dt = dt
-                        data.append(row)
-                        dates.append(datetime.datetime.strptime(
-                            buf.strip('\r\n'), fmt))
-                        row = np.zeros(self.num_params)
-                        row[:] = np.nan
-
-                elif buf[0] == 'D':
-                    col = int(buf[1])
-                    row[col] = float(buf.split()[1])
-
-                else:
-                    self.header_lines.append(buf)
-
-                buf = fid.readline()
-
-                ### TODO WORK OUT HOW TO APPEND data.append(row) correctly
-            #append last record to data
-            data.append(row)
-            #remove blank first record and convert to np.array
-            data = np.array(data[1:])
-            self.dates = np.array(dates)
-            for ii in range(self.num_params):
-                self.parameters[ii].data = data[:, ii]
+            self.read_blocks(buf + fid.read())
 
         else:
             warnings.warn('Unknown Format Type', Warning)
@@ -409,6 +336,192 @@ class GreenspanReader:
             self.serial_number = self.serial_number[:-2]
 
 
+    def read_columns(self, fid, num_fields):
+        """
+        Read the data rows of a 2.x file into column arrays. Rows with
+        the same timestamp are combined into one, with the values of
+        later rows taking precedence; `num_fields` is the number of
+        comma separated fields in each row.
+        """
+        lines = fid.read().splitlines()
+        if not lines:
+            self.combine_rows(np.array([], dtype='i8'),
+                              np.zeros((0, len(self.parameters))))
+            return
+
+        cells = ','.join(lines).split(',')
+        if len(cells) != len(lines) * num_fields:
+            # some rows have a different number of fields
+            rows = [line.split(',') for line in lines]
+            if min(len(row) for row in rows) < num_fields:
+                raise BadDatafileError("Missing values in file '%s'" %
+                                       (self.file_name,))
+            cells = [cell for row in rows for cell in row[:num_fields]]
+
+        cells = np.array(cells).reshape(len(lines), num_fields)
+
+        # xlrd reads in dates as floats, but excel isn't too careful
+        # about datatypes and depending on how the file has been
+        # handled, there's a chance that the dates have already been
+        # converted to strings
+        dates = util.possibly_corrupt_xls_dates_to_datetime64(
+            cells[:, 1], self.xlrd_datemode).view('i8')
+        values = _float_values(cells[:, 3:3 + len(self.parameters)])
+        self.combine_rows(dates, values)
+
+    def read_xls_columns(self, num_fields):
+        """
+        Read the data rows of a 2.x xls file from the columns of its
+        sheet, like read_columns does for a text file
+        """
+        columns = util.xls_columns(self.xls_sheet, header_rows, num_fields)
+        dates = util.possibly_corrupt_xls_dates_to_datetime64(
+            columns[1], self.xlrd_datemode).view('i8')
+        values = np.zeros((len(dates), len(self.parameters)))
+        for ii in range(len(self.parameters)):
+            values[:, ii] = _float_values(columns[3 + ii])
+        self.combine_rows(dates, values)
+
+    def combine_rows(self, dates, values):
+        """
+        Set the dates and parameter data from the rows of a 2.x file,
+        `dates` are int64 seconds and `values` a rows x parameters
+        array. Rows with the same timestamp are combined into one, with
+        the values of later rows taking precedence.
+        """
+        if np.any(dates[1:] < dates[:-1]):
+            raise BadDatafileError(
+                "Non-sequential timestamps found in file '%s'. "
+                "This shouldn't happen!" % (self.file_name,))
+
+        if not len(dates):
+            self.dates = np.array([], dtype=object)
+            for parameter in self.parameters:
+                parameter.data = np.array([])
+                self.data[parameter.name] = parameter.data
+            return
+
+        # rows are grouped by timestamp, and the last value in each
+        # group that isn't nan is kept
+        starts = np.flatnonzero(np.r_[True, dates[1:] != dates[:-1]])
+        has_value = ~np.isnan(values)
+        last_value = np.maximum.reduceat(
+            np.where(has_value, np.arange(len(values))[:, np.newaxis], -1),
+            starts, axis=0)
+        data = values[last_value, np.arange(values.shape[1])]
+        data[last_value < 0] = np.nan
+
+        conflicts = np.add.reduceat(has_value, starts, axis=0) > 1
+        if conflicts.any():
+            group, column = np.argwhere(conflicts)[0]
+            warnings.warn("Conflicting values for %d parameter values on %d "
+                          "dates, the last value was kept (e.g. parameter "
+                          "'%s' on date: %s)" % (
+                              conflicts.sum(), conflicts.any(axis=1).sum(),
+                              self.parameters[column].name,
+                              dates[starts[group]].astype('M8[s]')),
+                          Warning)
+
+        self.dates = dates[starts].astype('M8[s]').astype(object)
+        for ii, parameter in enumerate(self.parameters):
+            parameter.data = data[:, ii]
+            self.data[parameter.name] = parameter.data
+
+    def read_blocks(self, text):
+        """
+        Read the records of a block file, `text` is the file from the
+        first 'T' (timestamp) line on. Each 'T' line starts a record
+        and the 'D' lines that follow hold its values, 'Dn' being the
+        value of parameter n. Records with the same timestamp as the
+        record before them are combined. Any other lines are added to
+        the header lines.
+        """
+        # line endings are dropped for parsing but kept in the header
+        lines = text.replace('\r\n', '\n').split('\n')
+        if lines[-1] == '':
+            lines.pop()
+
+        lines = np.array(lines, dtype=str)
+        kinds = lines.astype('S1')
+        is_time = kinds == 'T'
+        is_data = kinds == 'D'
+
+        other_lines = np.flatnonzero(~is_time & ~is_data)
+        if len(other_lines):
+            raw_lines = text.split('\n')
+            for index in other_lines:
+                if index < len(raw_lines) - 1:
+                    self.header_lines.append(raw_lines[index] + '\n')
+                else:
+                    self.header_lines.append(raw_lines[index])
+
+        # timestamps
+        time_lines = lines[is_time]
+        dates, valid = util.parse_fixed_width_dates(time_lines,
+                                                    'T%Y%m%d%H%M%S')
+        for index in np.flatnonzero(~valid):
+            # raises the error for the bad timestamp
+            dates[index] = datetime.datetime.strptime(
+                time_lines[index].rstrip('\r'), 'T%Y%m%d%H%M%S')
+
+        dates = dates.view('i8')
+        new_record = np.ones(len(dates), dtype=bool)
+        new_record[1:] = dates[1:] != dates[:-1]
+        record_of_time = np.cumsum(new_record) - 1
+        self.dates = dates[new_record].astype('M8[s]').astype(object)
+
+        # data values, 'Dn value' lines are read by slicing the column
+        # digit and value out of the fixed width line
+        data_lines = lines[is_data]
+        if data_lines.dtype.itemsize < 4:
+            data_lines = data_lines.astype('S4')
+        records = record_of_time[np.cumsum(is_time)[is_data] - 1]
+        width = data_lines.dtype.itemsize
+        chars = data_lines.view(np.uint8).reshape(-1, width)
+        columns = chars[:, 1].astype(np.int64) - ord('0')
+        try:
+            if np.any(chars[:, 2] != ord(' ')):
+                raise ValueError
+            values = np.ndarray(len(data_lines), dtype='S%d' % (width - 3),
+                                buffer=data_lines, offset=3,
+                                strides=(width,)).astype(float)
+        except ValueError:
+            values = np.array([line.split()[1] for line in data_lines],
+                              dtype=float)
+
+        if len(columns) and (columns.max() >= self.num_params or
+                             columns.min() < 0):
+            raise BadDatafileError(
+                "Values for undefined parameters found in file '%s'" %
+                (self.file_name,))
+
+        data = np.zeros((len(self.dates), self.num_params))
+        data[:] = np.nan
+        # when a value is repeated in a record the last one is kept
+        flat_index = records * self.num_params + columns
+        unique_index, last = np.unique(flat_index[::-1], return_index=True)
+        data.flat[unique_index] = values[::-1][last]
+
+        for ii in range(self.num_params):
+            self.parameters[ii].data = data[:, ii]
+
+
+def _float_values(values):
+    """
+    Convert an array of value strings to floats, blank values are nan.
+    Float arrays (e.g. xls columns) are returned as they are.
+    """
+    if values.dtype.kind == 'f':
+        return values
+
+    try:
+        return np.where(values == '', 'nan', values).astype(float)
+    except ValueError:
+        # blank values padded with whitespace
+        values = np.char.strip(values)
+        return np.where(values == '', 'nan', values).astype(float)
+
+
 class Parameter:
     """
     Class that implements the a structure to return a parameters
@@ -8,9 +8,9 @@
 from __future__ import absolute_import
 
 import datetime
+import itertools
 import pkg_resources
 import re
-from StringIO import StringIO
 import struct
 import time
 import warnings
@@ -20,6 +20,7 @@ import quantities as pq
 
 from .. import sonde
 from .. import quantities as sq
+from .. import util
 from ..timezones import cdt, cst
 
 
@@ -32,13 +33,28 @@ class HydrolabDataset(sonde.BaseSondeDataset):
     binary file.
     """
 
-    def __init__(self, data_file, tzinfo=None, param_file=None):
+    def __init__(self, data_file, tzinfo=None, param_file=None, reader=None,
+                 **kwargs):
         self.file_format = 'hydrolab'
         self.manufacturer = 'hydrolab'
         self.data_file = data_file
         self.param_file = param_file
         self.default_tzinfo = tzinfo
-        super(HydrolabDataset, self).__init__(data_file)
+        self._reader = reader
+        super(HydrolabDataset, self).__init__(data_file, **kwargs)
+
+    @classmethod
+    def iter_chunks(cls, data_file, chunk_rows, tzinfo=None, param_file=None,
+                    **kwargs):
+        """
+        Read a Hydrolab txt file `chunk_rows` data lines at a time,
+        yielding a HydrolabDataset for each chunk. Only the current
+        chunk is held in memory.
+        """
+        hydrolab_data = HydrolabReader(data_file, tzinfo,
+                                       chunk_rows=chunk_rows)
+        for chunk in hydrolab_data.chunks:
+            yield cls(data_file, tzinfo, param_file, reader=chunk, **kwargs)
 
     def _read_data(self):
         """
@@ -74,21 +90,27 @@ class HydrolabDataset(sonde.BaseSondeDataset):
                     'mV': 'NotImplemented',
                     }
 
-        hydrolab_data = HydrolabReader(self.data_file, self.default_tzinfo)
+        if self._reader is not None:
+            hydrolab_data = self._reader
+            self._reader = None
+        else:
+            hydrolab_data = HydrolabReader(self.data_file,
+                                           self.default_tzinfo)
 
         # determine parameters provided and in what units
         self.parameters = dict()
         self.data = dict()
 
-        for parameter in hydrolab_data.parameters:
+        for parameter, has_data in zip(hydrolab_data.parameters,
+                                       hydrolab_data.has_data):
             try:
                 pcode = param_map[(parameter.name).strip()]
                 punit = unit_map[(parameter.unit).strip()]
                 #ignore params that have no data
-                if not np.all(np.isnan(parameter.data)):
+                if has_data:
                     self.parameters[pcode] = sonde.master_parameter_list[pcode]
-                    self.data[param_map[parameter.name]] = parameter.data \
-                                                           * punit
+                    self._set_parameter_data(param_map[parameter.name],
+                                             parameter.data, punit)
             except KeyError:
                 warnings.warn('Un-mapped Parameter/Unit Type:\n'
                               '%s parameter name: "%s"\n'
@@ -118,14 +140,28 @@ class HydrolabReader:
     object. It accepts one optional parameter, `tzinfo` is a
     datetime.tzinfo object that represents the timezone of the
     timestamps in the txt file.
+
+    If `chunk_rows` is given only the header is read straight away.
+    Instead `chunks` is a generator that reads the data `chunk_rows`
+    lines at a time, setting the dates and parameter data of the reader
+    to those of the chunk before yielding the reader itself.
     """
 
-    def __init__(self, data_file, tzinfo=None):
+    def __init__(self, data_file, tzinfo=None, chunk_rows=None):
         self.default_tzinfo = tzinfo
         self.num_params = 0
         self.parameters = []
-        self.read_hydrolab(data_file)
+        if chunk_rows is None:
+            self.read_hydrolab(data_file)
+            self.set_tzinfo()
+        else:
+            self.chunks = self.iter_hydrolab(data_file, chunk_rows)
 
+    def set_tzinfo(self):
+        """
+        Set the timezone of the header times and dates
+        """
+        tzinfo = self.default_tzinfo
         if tzinfo:
             self.setup_time = self.setup_time.replace(tzinfo=tzinfo)
             self.start_time = self.start_time.replace(tzinfo=tzinfo)
@@ -145,6 +181,66 @@ class HydrolabReader:
         self.read_header(fid)
         self.read_data(fid)
 
+    def iter_hydrolab(self, hydrolab_file, chunk_rows):
+        """
+        Open a Hydrolab txt file and read its data `chunk_rows` lines at
+        a time, yielding the reader after each chunk has been read.
+
+        Repeated values are removed within each chunk, and dates that
+        are not later than the last date of the previous chunk are
+        dropped, so the chunks are in time order.
+
+        The data lines are scanned once before the chunks are read, to
+        find the parameters with data anywhere in the file. Those are
+        the parameters of every chunk, as they are of a full read.
+        """
+        if type(hydrolab_file) == str:
+            fid = open(hydrolab_file, 'r')
+
+        else:
+            fid = hydrolab_file
+
+        try:
+            self.read_header(fid)
+            data_start = fid.tell()
+            self.has_data = np.zeros(self.num_params, dtype=bool)
+            data_rows = self.data_rows(fid)
+            while True:
+                chunk = list(itertools.islice(data_rows, chunk_rows))
+                if not chunk:
+                    break
+                dates, data = self.parse_rows(chunk)
+                self.has_data |= self.columns_with_data(data)
+
+            fid.seek(data_start)
+            last_date = None
+            data_rows = self.data_rows(fid)
+            while True:
+                chunk = list(itertools.islice(data_rows, chunk_rows))
+                if not chunk:
+                    if last_date is None:
+                        _no_data()
+                    break
+
+                self.dates, data = self.parse_rows(chunk)
+                if last_date is not None:
+                    later = self.dates > last_date
+                    self.dates = self.dates[later]
+                    data = data[later]
+
+                if len(self.dates) == 0:
+                    continue
+
+                last_date = self.dates[-1]
+                for ii in range(self.num_params):
+                    self.parameters[ii].data = data[:, ii]
+
+                self.set_tzinfo()
+                yield self
+        finally:
+            if type(hydrolab_file) == str:
+                fid.close()
+
     def read_header(self, fid):
         """
         Read header information
@@ -210,53 +306,103 @@ class HydrolabReader:
                 buf = fid.readline()
 
     def read_data(self, fid):
-        log_time = []
-        fmt = '%m%d%y%H%M%S'
-        data_str = ''
-        re_date = re.compile(' *Date')
-
-        # only process lines starting with a number
-        re_data = re.compile('^[0-9]')
-        re_clean_special_char = re.compile('[&@\*?$]')
-
-        # re_data = re.compile('((?!Date)(?![0-9]))', re.M) matches
-        # only junk lines might be more efficient to work out how to
-        # use the above to strip out all junk lines in one go.
-        for buf in fid.readlines():
-            if re_date.match(buf):
+        self.dates, data = self.parse_rows(self.data_rows(fid))
+        if not len(self.dates):
+            _no_data()
+
+        self.has_data = self.columns_with_data(data)
+        for ii in range(self.num_params):
+            self.parameters[ii].data = data[:, ii]
+
+    def columns_with_data(self, data):
+        """
+        Return a boolean array of which parameters have values that
+        aren't NaN in the 2d `data` array returned by parse_rows
+        """
+        return ~np.all(np.isnan(data[:, :self.num_params]), axis=0)
+
+    def data_rows(self, fid):
+        """
+        Generator that reads the data lines of the file, yielding the
+        'MMDDYYHHMMSS' timestamp and the list of value fields of each
+        line. Lines with fewer values than there are parameters are
+        padded with 'N' (missing) values.
+        """
+        log_date = None
+        for buf in fid:
+            if buf.lstrip(' ').startswith('Date'):
                 log_date = buf.split(':')[-1].strip()
 
-            if re_data.match(buf):
-                try:
-                    buf = re_clean_special_char.sub('', buf)
-                    time_field, data_line = buf.split(None, 1)
-                    log_time.append(datetime.datetime.strptime(
-                        log_date + time_field, fmt))
-                    #fix for incomplete lines
-                    if len(data_line.split()) < self.num_params:
-                        data_line = data_line.strip('\r\n')
-                        data_line += (self.num_params - \
-                                      len(data_line.split())) * \
-                                      ' N ' + '\n'
-                    data_str = data_str + data_line
-                except:
+            # only process lines starting with a number
+            if buf[:1].isdigit() and log_date is not None:
+                fields = buf.translate(None, '&@*?$').split()
+                if len(fields) < 2 or not fields[0].isdigit():
                     continue
 
-        self.dates = np.array(log_time)
-        data_str = re.sub('#', 'N', data_str)
-        try:
-            data = np.genfromtxt(StringIO(data_str), dtype=float)
-        except:
-            #no data in file
+                values = fields[1:]
+                #fix for incomplete lines
+                if len(values) < self.num_params:
+                    values += ['N'] * (self.num_params - len(values))
+
+                yield log_date + fields[0], values
+
+    def parse_rows(self, rows):
+        """
+        Parse (timestamp, values) pairs from data_rows into an array of
+        dates and a 2d array of data values. Rows with a timestamp that
+        can't be parsed are dropped, and the dates are sorted with only
+        the first row of each date kept, since some hydrolabs have
+        repeat values.
+        """
+        stamps = []
+        values = []
+        num_values = set()
+        for stamp, row_values in rows:
+            stamps.append(stamp)
+            values.extend(row_values)
+            num_values.add(len(row_values))
+
+        if len(num_values) > 1:
             warnings.warn('No Data Found In File', Warning)
-            raise
+            raise ValueError('Inconsistent number of values in data lines')
+        num_values = num_values.pop() if num_values else self.num_params
 
-        #de_duplicate data since some hydrolabs have repeat values
-        self.dates, idx = np.unique(self.dates, return_index=True)
-        data = data[idx]
+        # timestamps are usually fixed width, the others are left to
+        # strptime
+        fmt = '%m%d%y%H%M%S'
+        stamps = np.array(stamps, dtype=str)
+        dates, valid = util.parse_fixed_width_dates(stamps, fmt)
+        for index in np.flatnonzero(~valid):
+            try:
+                dates[index] = datetime.datetime.strptime(stamps[index], fmt)
+                valid[index] = True
+            except ValueError:
+                pass
 
-        for ii in range(self.num_params):
-            self.parameters[ii].data = data[:, ii]
+        values = np.array(values, dtype=str)
+        try:
+            data = values.astype(float)
+        except ValueError:
+            data = np.array([_to_float(value) for value in values])
+        data = data.reshape(len(stamps), num_values)[valid]
+
+        dates, idx = np.unique(dates[valid], return_index=True)
+        return dates.astype(object), data[idx]
+
+
+def _no_data():
+    """raise the error for a file without any data lines that parse"""
+    warnings.warn('No Data Found In File', Warning)
+    raise ValueError('No Data Found In File')
+
+
+def _to_float(value):
+    """the float value of a string, nan if it isn't a number (e.g. the
+    '#' and 'N/A' placeholders of missing values)"""
+    try:
+        return float(value)
+    except ValueError:
+        return np.nan
 
 
 class Parameter:
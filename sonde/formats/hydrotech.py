@@ -12,17 +12,16 @@ from __future__ import absolute_import
 
 import csv
 import datetime
+import itertools
 import pkg_resources
-import re
-from StringIO import StringIO
 import warnings
-import xlrd
 
 import numpy as np
 import quantities as pq
 
 from .. import sonde
 from .. import quantities as sq
+from .. import timeparse
 from ..timezones import cdt, cst
 
 
@@ -32,12 +31,12 @@ class HydrotechDataset(sonde.BaseSondeDataset):
     file. It takes one optional parameter `tzinfo` is a datetime.tzinfo
     object that represents the timezone of the timestamps in the binary file.
     """
-    def __init__(self, data_file, tzinfo=None):
+    def __init__(self, data_file, tzinfo=None, **kwargs):
         self.file_format = 'hydrotech'
         self.manufacturer = 'hydrotech'
         self.data_file = data_file
         self.default_tzinfo = tzinfo
-        super(HydrotechDataset, self).__init__(data_file)
+        super(HydrotechDataset, self).__init__(data_file, **kwargs)
 
     def _read_data(self):
         """
@@ -72,8 +71,8 @@ class HydrotechDataset(sonde.BaseSondeDataset):
                 #ignore params that have no data
                 if not np.all(np.isnan(parameter.data)):
                     self.parameters[pcode] = sonde.master_parameter_list[pcode]
-                    self.data[param_map[parameter.name]] = parameter.data * \
-                                                           punit
+                    self._set_parameter_data(param_map[parameter.name],
+                                             parameter.data, punit)
             except KeyError:
                 warnings.warn('Un-mapped Parameter/Unit Type:\n'
                               '%s parameter name: "%s"\n'
@@ -111,51 +110,43 @@ class HydrotechReader:
         self.default_tzinfo = tzinfo
         self.num_params = 0
         self.parameters = []
-        file_buf = self.clean_file(data_file)
-        self.read_hydrotech(file_buf, tzinfo)
+        if type(data_file) == str:
+            with open(data_file) as fid:
+                self.read_hydrotech(self.clean_lines(fid), tzinfo)
+        else:
+            self.read_hydrotech(self.clean_lines(data_file), tzinfo)
 
-    def clean_file(self, data_file):
+    def clean_lines(self, fid):
         """
-        Cleans input file by replacing # with 'NaN' and adding
-        a # to the beginning of comment lines.
-        Returns a StringIO object
+        Generator that cleans the lines of `fid` by replacing # with
+        'NaN', removing quotes and adding a # to the beginning of
+        comment lines.
         """
-        if type(data_file) == str:
-            fid = open(data_file)
-        elif type(data_file) == file:
-            fid = data_file
-
-        file_string = fid.read()
-        #change no data string from # to NaN
-        file_string = re.sub('#', 'NaN', file_string)
-        #remove quotes
-        file_string = re.sub('"', '', file_string)
-        #prepend # to non data lines
-        file_string = re.sub(re.compile('^(\D)', re.MULTILINE),
-                             '#\\1', file_string)
-        #remove junk binary characters
-
-        return StringIO(file_string)
-
-    def read_hydrotech(self, data_file, tzinfo=None):
+        fid.seek(0)
+        for line in fid:
+            #change no data string from # to NaN
+            line = line.replace('#', 'NaN').replace('"', '')
+            #prepend # to non data lines
+            if not line[:1].isdigit():
+                line = '#' + line
+            yield line
+
+    def read_hydrotech(self, lines, tzinfo=None, block_rows=4096):
         """
-        Open and read a Hydrotech file.
+        Read a Hydrotech file from `lines`, an iterator over its cleaned
+        lines. The data lines are converted `block_rows` at a time.
         """
-        if type(data_file) == str:
-            fid = open(data_file, 'r')
-
-        else:
-            fid = data_file
+        def readline():
+            return next(lines, '')
 
-        fid.seek(0)
         fmt = '%m%d%y%H%M%S'
         strp = '#,\r\n'
 
-        buf = fid.readline().strip(strp)
+        buf = readline().strip(strp)
 
         #remove junk binary at top of file
         if not 'MiniSonde' or 'Log File Name' in buf:
-            buf = fid.readline().strip(strp)
+            buf = readline().strip(strp)
 
         if 'MiniSonde' in buf:
             self.model, self.serial_number = buf.split()
@@ -163,23 +154,23 @@ class HydrotechReader:
             self.model = ''
             self.serial_number = ''
 
-        self.log_file_name = fid.readline().strip(strp).split(':')[-1].strip()
+        self.log_file_name = readline().strip(strp).split(':')[-1].strip()
 
         #else:
         #    self.log_file_name = buf.strip(strp).split(':')[-1].strip()
 
-        d = fid.readline().strip(strp).split(':')[-1].strip()
-        t = fid.readline().strip(strp).split(':')[-1].strip()
+        d = readline().strip(strp).split(':')[-1].strip()
+        t = readline().strip(strp).split(':')[-1].strip()
         self.setup_time = datetime.datetime.strptime(d + t, fmt)
-        d = fid.readline().strip(strp).split(':')[-1].strip()
-        t = fid.readline().strip(strp).split(':')[-1].strip()
+        d = readline().strip(strp).split(':')[-1].strip()
+        t = readline().strip(strp).split(':')[-1].strip()
         self.start_time = datetime.datetime.strptime(d + t, fmt)
-        d = fid.readline().strip(strp).split(':')[-1].strip()
-        t = fid.readline().strip(strp).split(':')[-1].strip()
+        d = readline().strip(strp).split(':')[-1].strip()
+        t = readline().strip(strp).split(':')[-1].strip()
         self.stop_time = datetime.datetime.strptime(d + t, fmt)
-        interval = fid.readline().strip(strp).split(':')[-1].strip()
-        sensor_warmup = fid.readline().strip(strp).split(':')[-1].strip()
-        circltr_warmup = fid.readline().strip(strp).split(':')[-1].strip()
+        interval = readline().strip(strp).split(':')[-1].strip()
+        sensor_warmup = readline().strip(strp).split(':')[-1].strip()
+        circltr_warmup = readline().strip(strp).split(':')[-1].strip()
         self.logging_interval = int(interval[0:2]) * 3600 + \
                                 int(interval[2:4]) * 60 + int(interval[4:6])
         self.sensor_warmup_time = int(sensor_warmup[0:2]) * 3600 + \
@@ -189,41 +180,56 @@ class HydrotechReader:
                                    int(circltr_warmup[2:4]) * 60 + \
                                    int(circltr_warmup[4:6])
 
-        buf = fid.readline().strip(strp)
+        buf = readline().strip(strp)
         while buf[0:4] != 'Date':
-            buf = fid.readline().strip(strp)
+            buf = readline().strip(strp)
 
         fields = buf.split(',')
         params = fields[2:]
-        units = fid.readline().strip(strp).split(',')[2:]
-
-        #read data
-        fid.seek(0)
+        units = readline().strip(strp).split(',')[2:]
 
         #remove blank columns
-        cols = []
-        field_names = []
-        ncol = 0
-        for field in fields:
-            if field != '':
-                cols.append(ncol)
-                field_names.append(field)
-
-            ncol += 1
-
-        data = np.genfromtxt(fid, delimiter=',', dtype=None, names=field_names,
-                             usecols=cols, missing_values='NaN',
-                             filling_values=np.nan)
-
-        if len(data['Date'][0].split('/')[-1]) == 2:
-            fmt = '%m/%d/%y%H:%M:%S'
+        cols = [ncol for ncol, field in enumerate(fields)
+                if field != '' and ncol >= 2]
+        last_col = max(cols + [1])
+
+        #read data, the rest of the comment lines are skipped
+        data_lines = (line for line in lines if line[0] != '#')
+        date_strs = []
+        time_strs = []
+        blocks = []
+        while True:
+            block = list(itertools.islice(data_lines, block_rows))
+            if not block:
+                break
+
+            rows = [line.rstrip('\r\n').split(',') for line in block]
+            if min(len(row) for row in rows) <= last_col:
+                raise ValueError('Missing values in data line')
+            date_strs.extend(row[0] for row in rows)
+            time_strs.extend(row[1] for row in rows)
+            values = np.array([[row[col] for col in cols] for row in rows],
+                              dtype=str)
+            values = np.where(values == '', 'NaN', values)
+            try:
+                blocks.append(values.astype(float))
+            except ValueError:
+                blocks.append(np.array([[_to_float(value) for value in row]
+                                        for row in values]))
+
+        if blocks:
+            data = np.concatenate(blocks)
+        else:
+            data = np.zeros((0, len(cols)))
+
+        # date_strs are e.g. '01/14/09' for two digit years
+        if date_strs and len(date_strs[0].split('/')[-1]) == 2:
+            date_fmt = '%m/%d/%y'
         else:
-            fmt = '%m/%d/%Y%H:%M:%S'
+            date_fmt = '%m/%d/%Y'
 
-        self.dates = np.array(
-            [datetime.datetime.strptime(d + t, fmt)
-             for d, t in zip(data['Date'], data['Time'])]
-            )
+        self.dates = timeparse.to_datetimes(
+            timeparse.to_epoch(date_strs, date_fmt, time_strs, '%H:%M:%S'))
 
         if tzinfo:
             self.setup_time = self.setup_time.replace(tzinfo=tzinfo)
@@ -231,14 +237,20 @@ class HydrotechReader:
             self.stop_time = self.stop_time.replace(tzinfo=tzinfo)
             self.dates = [i.replace(tzinfo=tzinfo) for i in self.dates]
 
-        for param, unit in zip(params, units):
+        for param, unit, col in zip(params, units, range(2, len(fields))):
             if param != '':
                 self.num_params += 1
-                self.parameters.append(Parameter(param, unit))
+                parameter = Parameter(param, unit)
+                parameter.data = data[:, cols.index(col)]
+                self.parameters.append(parameter)
+
 
-        for ii in range(self.num_params):
-            param = self.parameters[ii].name
-            self.parameters[ii].data = data[param]
+def _to_float(value):
+    """the float value of a string, nan if it isn't a number"""
+    try:
+        return float(value)
+    except ValueError:
+        return np.nan
 
 
 class Parameter:
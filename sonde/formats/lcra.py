@@ -38,12 +38,12 @@ class LcraDataset(sonde.BaseSondeDataset):
     Dataset object that represents the data contained in 'lcra' txt
     file.
     """
-    def __init__(self, data_file, tzinfo=None):
+    def __init__(self, data_file, tzinfo=None, **kwargs):
         self.manufacturer = 'na'
         self.file_format = 'lcra'
         self.data_file = data_file
         self.default_tzinfo = tzinfo
-        super(LcraDataset, self).__init__(data_file)
+        super(LcraDataset, self).__init__(data_file, **kwargs)
 
     def _read_data(self):
         """
@@ -84,7 +84,8 @@ class LcraDataset(sonde.BaseSondeDataset):
                 pcode = param_map[(parameter.name).strip()]
                 punit = unit_map[(parameter.unit).strip()]
                 self.parameters[pcode] = sonde.master_parameter_list[pcode]
-                self.data[param_map[parameter.name]] = parameter.data * punit
+                self._set_parameter_data(param_map[parameter.name],
+                                         parameter.data, punit)
 
             except KeyError:
                 warnings.warn('Un-mapped Parameter/Unit Type:\n'
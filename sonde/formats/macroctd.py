@@ -8,7 +8,6 @@
 """
 from __future__ import absolute_import
 
-import datetime
 import pkg_resources
 import warnings
 
@@ -17,6 +16,7 @@ import quantities as pq
 
 from .. import sonde
 from .. import quantities as sq
+from .. import timeparse
 from ..timezones import cdt, cst
 
 
@@ -27,12 +27,12 @@ class MacroctdDataset(sonde.BaseSondeDataset):
     object that represents the timezone of the timestamps in the file.
     """
 
-    def __init__(self, data_file, tzinfo=None):
+    def __init__(self, data_file, tzinfo=None, **kwargs):
         self.file_format = 'macroctd'
         self.manufacturer = 'macroctd'
         self.data_file = data_file
         self.default_tzinfo = tzinfo
-        super(MacroctdDataset, self).__init__(data_file)
+        super(MacroctdDataset, self).__init__(data_file, **kwargs)
 
     def _read_data(self):
         """
@@ -63,8 +63,8 @@ class MacroctdDataset(sonde.BaseSondeDataset):
                 #ignore params that have no data
                 if not np.all(np.isnan(parameter.data)):
                     self.parameters[pcode] = sonde.master_parameter_list[pcode]
-                    self.data[param_map[parameter.name]] = parameter.data * \
-                                                           punit
+                    self._set_parameter_data(param_map[parameter.name],
+                                             parameter.data, punit)
             except KeyError:
                 warnings.warn('Un-mapped Parameter/Unit Type:\n'
                               '%s parameter name: "%s"\n'
@@ -141,9 +141,9 @@ class MacroctdReader:
         else:
             fid.seek(initial_file_location)
 
-        self.dates = np.array(
-            [datetime.datetime.strptime(d + t, '%m/%d/%y%H:%M')
-             for d, t in zip(data['Date'], data['Time'])])
+        self.dates = timeparse.to_datetimes(
+            timeparse.to_epoch(data['Date'], '%m/%d/%y',
+                               data['Time'], '%H:%M'))
 
         #atm pressure correction for macroctd
         data['Pressure'] -= 14.7
@@ -7,11 +7,9 @@
 """
 from __future__ import absolute_import
 
-import datetime
 import pkg_resources
 import re
 from StringIO import StringIO
-import xlrd
 import csv
 
 import numpy as np
@@ -19,6 +17,7 @@ import quantities as pq
 
 from .. import sonde
 from .. import quantities as sq
+from .. import util
 from ..timezones import cdt, cst
 
 
@@ -27,14 +26,22 @@ class MergeDataset(sonde.BaseSondeDataset):
     Dataset object that represents the data merged from multiple data
     files using sonde.merge timezone is default.timezone. parameter
     names/units are from the master list data is a dict containing all
-    the data with param names and units.
+    the data with param names and units. metadata['dates'] is either a
+    datetime64 array of UTC times or an array of datetime.datetime
+    instances.
     """
-    def __init__(self, metadata, paramdata):
-        idx = self._indices_duplicate_data(metadata['dates'], paramdata)
-        sort_idx = np.argsort(metadata['dates'][idx])
-        self.manufacturer = metadata['instrument_manufacturer'][idx][sort_idx]
-        self.serial_number = metadata['instrument_serial_number'][idx][sort_idx]
-        self.data_file = metadata['data_file_name'][idx][sort_idx]
+    def __init__(self, metadata, paramdata, datetime64_dates=False):
+        self.datetime64_dates = datetime64_dates
+        dates = metadata['dates']
+        if dates.dtype.kind == 'M':
+            tzinfo = sonde.default_static_timezone
+        else:
+            dates, tzinfo = util.datetimes_to_datetime64(dates)
+
+        idx = self._indices_duplicate_data(dates, paramdata)
+        self.manufacturer = metadata['instrument_manufacturer'][idx]
+        self.serial_number = metadata['instrument_serial_number'][idx]
+        self.data_file = metadata['data_file_name'][idx]
         self.default_tzinfo = sonde.default_static_timezone
 
         # determine parameters provided and in what units
@@ -43,28 +50,36 @@ class MergeDataset(sonde.BaseSondeDataset):
 
         for param in paramdata.keys():
             self.parameters[param] = param
-            self.data[param] = paramdata[param][idx][sort_idx]
+            self.data[param] = paramdata[param][idx]
 
-        self.dates = metadata['dates'][idx][sort_idx]
+        self.set_utc_dates(dates[idx], tzinfo)
         # I don't think the following line is needed
         # super(MergeDataset, self).__init__()
 
     def _indices_duplicate_data(self, dates, data):
         """
-        return data index required to remove duplicate data
+        return data index required to remove duplicate data, ordered
+        by date. `dates` is a datetime64 array. Rows are compared on
+        their int64 timestamps and the bit patterns of their values, so
+        NaN matches NaN. The first occurrence of each duplicated row is
+        kept.
         """
-        #convert to single structured array
-        dtypes = [datetime.datetime]
-        names = ['datetime']
-        for param in data.keys():
-            dtypes.append('f8')
-            names.append(param)
+        date_keys = np.asarray(dates, dtype='M8[ns]').view('i8')
 
-        tmp_data = np.zeros(dates.size, dtype=np.dtype({'names': names,
-                                                        'formats': dtypes}))
-        tmp_data['datetime'] = dates
+        value_keys = []
         for param in data.keys():
-            tmp_data[param] = data[param]
+            # adding zero turns -0.0 into 0.0
+            values = np.array(data[param], dtype='f8') + 0.
+            values[np.isnan(values)] = np.nan
+            value_keys.append(values.view('i8'))
+
+        # lexsort is stable and sorts on the last key first
+        order = np.lexsort(value_keys[::-1] + [date_keys])
+
+        duplicate = np.zeros(order.size, dtype=bool)
+        duplicate[1:] = True
+        for keys in [date_keys] + value_keys:
+            sorted_keys = keys[order]
+            duplicate[1:] &= sorted_keys[1:] == sorted_keys[:-1]
 
-        u, idx = np.unique(tmp_data, return_index=True)
-        return idx
+        return order[~duplicate]
@@ -32,19 +32,17 @@
 from __future__ import absolute_import
 
 import csv
-import datetime
 import pkg_resources
 import re
 from StringIO import StringIO
 import warnings
-import xlrd
 
-import numpy as np
 import quantities as pq
 import pandas as pd
 
 from .. import sonde
 from .. import quantities as sq
+from .. import timeparse
 from ..timezones import UTCStaticOffset
 
 class MidgewaterDataset(sonde.BaseSondeDataset):
@@ -52,12 +50,12 @@ class MidgewaterDataset(sonde.BaseSondeDataset):
     Dataset object that represents the data contained in 'midgewater' txt
     file.
     """
-    def __init__(self, data_file, tzinfo=None):
+    def __init__(self, data_file, tzinfo=None, **kwargs):
         self.manufacturer = 'na'
         self.file_format = 'midgewater'
         self.data_file = data_file
         self.default_tzinfo = tzinfo
-        super(MidgewaterDataset, self).__init__(data_file)
+        super(MidgewaterDataset, self).__init__(data_file, **kwargs)
 
     def _read_data(self):
         """
@@ -96,7 +94,8 @@ class MidgewaterDataset(sonde.BaseSondeDataset):
                 pcode = param_map[(parameter.name).strip()]
                 punit = unit_map[(parameter.unit).strip()]
                 self.parameters[pcode] = sonde.master_parameter_list[pcode]
-                self.data[param_map[parameter.name]] = parameter.data * punit
+                self._set_parameter_data(param_map[parameter.name],
+                                         parameter.data, punit)
 
             except KeyError:
                 warnings.warn('Un-mapped Parameter/Unit Type:\n'
@@ -166,13 +165,13 @@ class MidgewaterDataReader:
         data.dropna(how='all', inplace=True)
         datetime_cols = ['year', 'month', 'day', 'hour', 'minute']
         is_valid_date = ~(data.ix[:, datetime_cols].isnull().sum(axis=1).astype(bool))
-#        import pdb; pdb.set_trace()
-        raw_dates = np.array([datetime.datetime(year=int(y), month=int(m), 
-          day=int(d), hour=int(hh), minute=int(mm), tzinfo=self.default_tzinfo)
-          for y, m, d, hh, mm in zip(data['year'].values, data['month'].values,
-          data['day'].values, data['hour'].values, data['minute'].values)])
         # remove records missing any of y,m,d,hh and mm parameters
-        self.dates = raw_dates[is_valid_date.values]
+        data = data[is_valid_date.values]
+        self.dates = timeparse.to_datetimes(timeparse.fields_to_epoch(
+            *[data[col].values.astype(int) for col in datetime_cols]))
+        if self.default_tzinfo:
+            self.dates = [i.replace(tzinfo=self.default_tzinfo)
+                          for i in self.dates]
         #from IPython import embed; embed()
         #assign param & unit names
         for param, unit in zip(params, units):
@@ -181,7 +180,7 @@ class MidgewaterDataReader:
 
         for ii in range(self.num_params):
             param = self.parameters[ii].name
-            self.parameters[ii].data = data[param].values[is_valid_date.values]
+            self.parameters[ii].data = data[param].values
 
 
 class Parameter:
@@ -0,0 +1,189 @@
+"""
+    sonde.formats.netcdf
+    ~~~~~~~~~~~~~~~~~~~~
+
+    This module implements the netcdf4 format written by
+    BaseSondeDataset.write. See BaseSondeDataset._write_netcdf4 for a
+    description of the file layout.
+
+"""
+from __future__ import absolute_import
+
+import re
+import warnings
+
+import numpy as np
+import pytz
+import quantities as pq
+
+from .. import sonde
+from .. import quantities as sq
+from ..timezones import UTCStaticOffset
+
+
+class NetcdfDataset(sonde.BaseSondeDataset):
+    """
+    Dataset object that represents the data contained in a netcdf4
+    file written by BaseSondeDataset.write.
+    """
+    def __init__(self, data_file, **kwargs):
+        self.manufacturer = 'netcdf4'
+        self.file_format = 'netcdf4'
+        self.data_file = data_file
+        super(NetcdfDataset, self).__init__(data_file, **kwargs)
+
+    def _read_data(self):
+        """
+        Read the netcdf4 data file
+        """
+        # the standard units, plus the units the generic csv format
+        # accepts, by symbol (as written by older versions) and by
+        # UDUNITS string
+        unit_map = {'degF': pq.degF,
+                    'K': pq.degK,
+                    'm': pq.m,
+                    'ft': sq.ftH2O,
+                    'ftH2O': sq.ftH2O,
+                    'psi': pq.psi,
+                    'Pa': pq.Pa,
+                    'nd': pq.dimensionless,
+                    }
+        for description, unit in sonde.master_parameter_list.values():
+            if len(unit.dimensionality.keys()):
+                unit_map[unit.dimensionality.keys()[0].symbol] = unit
+        for unit in unit_map.values():
+            unit_map.setdefault(sonde.udunits(unit), unit)
+        # '1' is the UDUNITS string of several units, a parameter's
+        # own standard unit is checked first
+        unit_map['1'] = pq.dimensionless
+
+        netcdf_data = NetcdfReader(self.data_file)
+        self.parameters = dict()
+        self.data = dict()
+
+        for parameter in netcdf_data.parameters:
+            if parameter.name not in sonde.master_parameter_list:
+                warnings.warn('Un-mapped Parameter: %s' % parameter.name,
+                              Warning)
+                continue
+            try:
+                std_unit = sonde.master_parameter_list[parameter.name][1]
+                if parameter.unit == sonde.udunits(std_unit):
+                    punit = std_unit
+                else:
+                    punit = unit_map[parameter.unit]
+                if not np.all(np.isnan(parameter.data)):
+                    self.parameters[parameter.name] = \
+                        sonde.master_parameter_list[parameter.name]
+                    self._set_parameter_data(parameter.name,
+                                             parameter.data, punit)
+            except KeyError:
+                warnings.warn('Un-mapped Unit Type\n'
+                              'Unit Name: %s' % parameter.unit,
+                              Warning)
+
+        self.format_parameters = netcdf_data.format_parameters
+
+        #overide default metadata if present in file
+        names = ['manufacturer', 'data_file', 'serial_number']
+        kwds = ['instrument_manufacturer', 'original_data_file',
+                'instrument_serial_number']
+        for name, kwd in zip(names, kwds):
+            if kwd in netcdf_data.metadata:
+                values = netcdf_data.metadata[kwd]
+                if len(np.unique(values)) == 1:
+                    values = values[0]
+                setattr(self, name, values)
+
+        self.set_utc_dates(netcdf_data.utc_dates, netcdf_data.tzinfo)
+
+
+class NetcdfReader:
+    """
+    A reader object that opens and reads a netcdf4 file written by
+    BaseSondeDataset.write.
+
+    `data_file` should be either a file path string or a file-like
+    object.
+    """
+    def __init__(self, data_file):
+        self.parameters = []
+        self.metadata = {}
+        self.format_parameters = {}
+        self.read_netcdf(data_file)
+
+    def read_netcdf(self, data_file):
+        """
+        Open and read a netcdf4 file.
+        """
+        import netCDF4
+
+        if type(data_file) == str:
+            nc = netCDF4.Dataset(data_file, 'r')
+        else:
+            data_file.seek(0)
+            nc = netCDF4.Dataset('sonde.nc', 'r', memory=data_file.read())
+
+        try:
+            for key in nc.ncattrs():
+                self.format_parameters[str(key)] = nc.getncattr(key)
+
+            self.tzinfo = tzinfo_from_zone(
+                self.format_parameters.get('timezone'))
+
+            seconds = nc.variables['time'][:]
+            self.utc_dates = (np.round(np.asarray(seconds) * 1e6)
+                              .astype('i8') * 1000).view('M8[ns]')
+
+            dictionaries = set()
+            for name, var in nc.variables.items():
+                if 'dictionary' in var.ncattrs():
+                    dictionaries.add(var.getncattr('dictionary'))
+
+            for name, var in nc.variables.items():
+                name = str(name)
+                if name == 'time' or name in dictionaries:
+                    continue
+
+                var.set_auto_mask(False)
+                if 'dictionary' in var.ncattrs():
+                    dictionary = nc.variables[var.getncattr('dictionary')]
+                    values = np.asarray(dictionary[:], dtype=str)
+                    self.metadata[name] = values[np.asarray(var[:])]
+                    continue
+
+                data = np.asarray(var[:], dtype='f8')
+                if '_FillValue' in var.ncattrs():
+                    data[data == var.getncattr('_FillValue')] = np.nan
+
+                parameter = Parameter(name, str(var.getncattr('units')))
+                parameter.data = data
+                self.parameters.append(parameter)
+        finally:
+            nc.close()
+
+
+def tzinfo_from_zone(zone):
+    """
+    Return the tzinfo for a timezone name written by
+    BaseSondeDataset.write, None if `zone` is None
+    """
+    if zone is None:
+        return None
+
+    match = re.match('^UTC([+-]?\d+)$', zone)
+    if match:
+        return UTCStaticOffset(int(match.group(1)))
+
+    return pytz.timezone(zone)
+
+
+class Parameter:
+    """
+    Class that implements the a structure to return a parameters
+    name, unit and data
+    """
+    def __init__(self, param_name, param_unit):
+        self.name = param_name
+        self.unit = param_unit
+        self.data = []
@@ -9,18 +9,17 @@
 from __future__ import absolute_import
 
 import csv
-import datetime
 import pkg_resources
 import re
 from StringIO import StringIO
 import warnings
-import xlrd
 
 import numpy as np
 import quantities as pq
 
 from .. import sonde
 from .. import quantities as sq
+from .. import timeparse
 from ..timezones import cdt, cst
 
 
@@ -30,12 +29,12 @@ class SolinstDataset(sonde.BaseSondeDataset):
     file. It accepts one optional parameters, `tzinfo` is a datetime.tzinfo
     object that represents the timezone of the timestamps in the file.
     """
-    def __init__(self, data_file, tzinfo=None):
+    def __init__(self, data_file, tzinfo=None, **kwargs):
         self.file_format = 'solinst'
         self.manufacturer = 'solinst'
         self.data_file = data_file
         self.default_tzinfo = tzinfo
-        super(SolinstDataset, self).__init__(data_file)
+        super(SolinstDataset, self).__init__(data_file, **kwargs)
 
     def _read_data(self):
         """
@@ -75,8 +74,8 @@ class SolinstDataset(sonde.BaseSondeDataset):
                 #ignore params that have no data
                 if not np.all(np.isnan(parameter.data)):
                     self.parameters[pcode] = sonde.master_parameter_list[pcode]
-                    self.data[param_map[parameter.name]] = parameter.data * \
-                                                           punit
+                    self._set_parameter_data(param_map[parameter.name],
+                                             parameter.data, punit)
             except KeyError:
                 warnings.warn('Un-mapped Parameter/Unit Type:\n'
                               '%s parameter name: "%s"\n'
@@ -151,10 +150,9 @@ class SolinstReader:
 
         data = np.genfromtxt(fid, delimiter=',', dtype=None, names = fields)
 
-        self.dates = np.array(
-            [datetime.datetime.strptime(d + t, '%Y/%m/%d%H:%M:%S')
-             for d, t in zip(data['Date'], data['Time'])]
-            )
+        self.dates = timeparse.to_datetimes(
+            timeparse.to_epoch(data['Date'], '%Y/%m/%d',
+                               data['Time'], '%H:%M:%S'))
 
         #assign param & unit names
         for param, unit in zip(params, units):
@@ -235,10 +233,9 @@ class SolinstReader:
         data = np.genfromtxt(StringIO(buf.split('END')[0]),
                              dtype=None, names=fields)
 
-        self.dates = np.array(
-            [datetime.datetime.strptime(d + t, '%Y/%m/%d%H:%M:%S.0')
-             for d, t in zip(data['Date'], data['Time'])]
-            )
+        self.dates = timeparse.to_datetimes(
+            timeparse.to_epoch(data['Date'], '%Y/%m/%d',
+                               data['Time'], '%H:%M:%S.0'))
 
         #assign param & unit names
         for param, unit in zip(params, units):
@@ -8,6 +8,7 @@
 from __future__ import absolute_import
 
 from datetime import datetime
+import os
 import pkg_resources
 import re
 from StringIO import StringIO
@@ -20,11 +21,16 @@ import quantities as pq
 
 from .. import sonde
 from .. import quantities as sq
+from .. import timeparse
 from ..timezones import cdt, cst
 
 
 DEFAULT_YSI_PARAM_DEF = 'data/ysi_param.def'
 
+# parsed param definition files, the default file is keyed by None and
+# other files by their absolute path, as (mtime, ParamDef) pairs
+_param_def_cache = {}
+
 
 class YSIDataset(sonde.BaseSondeDataset):
     """
@@ -32,15 +38,43 @@ class YSIDataset(sonde.BaseSondeDataset):
     file. It accepts two optional parameters, `param_file` is a
     ysi_param.def definition file and `tzinfo` is a datetime.tzinfo
     object that represents the timezone of the timestamps in the
-    binary file.
+    binary file. `format` is the ysi format returned by
+    sonde.autodetect (e.g. 'ysi_binary'), if it isn't given the file
+    is autodetected again.
     """
-    def __init__(self, data_file, tzinfo=None, param_file=None, format=None):
-        self.file_format = sonde.autodetect(data_file) or 'ysi'
+    def __init__(self, data_file, tzinfo=None, param_file=None, format=None,
+                 reader=None, **kwargs):
+        if format and '_' in format:
+            self.file_format = format
+        else:
+            self.file_format = sonde.autodetect(data_file) or 'ysi'
         self.manufacturer = 'ysi'
         self.data_file = data_file
         self.param_file = param_file
         self.default_tzinfo = tzinfo
-        super(YSIDataset, self).__init__(data_file)
+        self._reader = reader
+        super(YSIDataset, self).__init__(data_file, **kwargs)
+
+    @classmethod
+    def iter_chunks(cls, data_file, chunk_rows, tzinfo=None, param_file=None,
+                    format=None, **kwargs):
+        """
+        Read a YSI binary file `chunk_rows` data records at a time,
+        yielding a YSIDataset for each chunk. Only the current chunk is
+        held in memory.
+        """
+        if not format or '_' not in format:
+            format = sonde.autodetect(data_file) or 'ysi'
+
+        if format.split('_')[-1] != 'binary':
+            raise NotImplementedError("file format '%s' can not be read "
+                                      "in chunks" % format)
+
+        ysi_data = YSIReaderBin(data_file, tzinfo, param_file,
+                                chunk_rows=chunk_rows)
+        for chunk in ysi_data.chunks:
+            yield cls(data_file, tzinfo, param_file, format, reader=chunk,
+                      **kwargs)
 
     def _read_data(self):
         """
@@ -88,8 +122,12 @@ class YSIDataset(sonde.BaseSondeDataset):
                     }
 
         if self.file_format.split('_')[-1] == 'binary':
-            ysi_data = YSIReaderBin(self.data_file, self.default_tzinfo,
-                                    self.param_file)
+            if self._reader is not None:
+                ysi_data = self._reader
+                self._reader = None
+            else:
+                ysi_data = YSIReaderBin(self.data_file, self.default_tzinfo,
+                                        self.param_file)
             self.format_parameters = {
                 'log_file_name': ysi_data.log_file_name,
                 'instr_type': ysi_data.instr_type,
@@ -122,7 +160,8 @@ class YSIDataset(sonde.BaseSondeDataset):
                     parameter.name = 'pH mV'
                     
                 self.parameters[pcode] = sonde.master_parameter_list[pcode]
-                self.data[param_map[parameter.name]] = parameter.data * punit
+                self._set_parameter_data(param_map[parameter.name],
+                                         parameter.data, punit)
             except KeyError:
                 warnings.warn('Un-mapped Parameter/Unit Type:\n'
                               '%s parameter name: "%s"\n'
@@ -134,10 +173,79 @@ class YSIDataset(sonde.BaseSondeDataset):
         self.dates = ysi_data.dates
 
 
+class ParamDef:
+    """
+    The contents of a YSI param definition file. `table` is the
+    structured array of its rows and `types` is a dict that maps each
+    sensor type id to its (ysi_id, name, unit, shortname,
+    num_dec_places) row.
+    """
+    def __init__(self, file_string):
+        file_string = re.sub("\n\s*\n*", "\n", file_string)
+        file_string = re.sub(";.*\n*", "", file_string)
+        file_string = re.sub("\t", "", file_string)
+        file_string = re.sub("\"", "", file_string)
+        lines = file_string.splitlines()
+        self.file_version = int(lines[0].split('=')[-1])
+        self.num_param_in_def = int(lines[1].split('=')[-1])
+        self.ecowatch_version = int(lines[2].split('=')[-1])
+        dtype = np.dtype([('ysi_id', '<i8'),
+                          ('name', '|S20'),
+                          ('unit', '|S11'),
+                          ('shortname', '|S9'),
+                          ('num_dec_places', '<i8')])
+        self.table = np.genfromtxt(StringIO(file_string),
+                                   delimiter=',',
+                                   usecols=(0, 1, 3, 5, 7),
+                                   skip_header=3, dtype=dtype)
+        # shared between readers, see load_param_def
+        self.table.flags.writeable = False
+        self.types = dict((row[0], row) for row in self.table.tolist())
+
+
+def load_param_def(param_file=None):
+    """
+    Return the ParamDef of the YSI param definition file `param_file`,
+    a file path string or a file-like object, or of the packaged
+    ysi_param.def if it is None.
+
+    The default file and files given by path are only parsed once per
+    process (and again if the file is modified), so the returned
+    ParamDef is shared and must not be modified.
+    """
+    if param_file is None:
+        key, mtime = None, None
+    elif isinstance(param_file, basestring):
+        key = os.path.abspath(param_file)
+        try:
+            mtime = os.path.getmtime(param_file)
+        except OSError:
+            # open raises the error for the missing file
+            mtime = None
+    else:
+        return ParamDef(param_file.read())
+
+    cached = _param_def_cache.get(key)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+
+    if param_file is None:
+        file_string = pkg_resources.resource_string('sonde',
+                                                    DEFAULT_YSI_PARAM_DEF)
+    else:
+        with open(param_file, 'rb') as fid:
+            file_string = fid.read()
+
+    param_def = ParamDef(file_string)
+    _param_def_cache[key] = (mtime, param_def)
+    return param_def
+
+
 class ChannelRec:
     """
     Class that implements the channel record data structure used by
-    the YSI binary file format
+    the YSI binary file format. `param_def` maps sensor type ids to
+    their param definition rows, see ParamDef.types.
     """
     def __init__(self, rec, param_def):
         self.sonde_channel_num = rec[0]
@@ -173,69 +281,71 @@ class YSIReaderBin:
     ysi_param.def definition file and `tzinfo` is a datetime.tzinfo
     object that represents the timezone of the timestamps in the
     binary file.
+
+    If `chunk_rows` is given the data records are not read straight
+    away. Instead `chunks` is a generator that reads the file
+    `chunk_rows` data records at a time, setting the dates and
+    parameter data of the reader to those of the chunk before yielding
+    the reader itself.
     """
-    def __init__(self, data_file, tzinfo=None, param_file=None):
+    def __init__(self, data_file, tzinfo=None, param_file=None,
+                 chunk_rows=None):
         self.default_tzinfo = tzinfo
         self.num_params = 0
         self.parameters = []
-        self.julian_time = []
         self.read_param_def(param_file)
-        self.read_ysi(data_file)
 
         ysi_epoch = datetime(year=1984, month=3, day=1,
                                       tzinfo=tzinfo)
 
-        ysi_epoch_in_seconds = time.mktime(ysi_epoch.timetuple())
+        self.ysi_epoch_in_seconds = time.mktime(ysi_epoch.timetuple())
 
-        for param in self.parameters:
-            param.data = (np.array(param.data)).round(decimals=param.ndecimals)
-
-        self.dates = np.array([datetime.fromtimestamp(t + ysi_epoch_in_seconds,
-                                                      tzinfo)
-                               for t in self.julian_time])
-
-        if tzinfo:
-            self.dates = [i.replace(tzinfo=tzinfo) for i in self.dates]
+        if chunk_rows is None:
+            self.read_ysi(data_file)
+            self.set_header_times()
+            self.set_data(self.julian_time, self.values)
+        else:
+            self.chunks = self.iter_ysi(data_file, chunk_rows)
 
-        self.julian_time = np.array(self.julian_time)
+    def set_header_times(self):
+        """
+        Convert the log start times in the header to datetimes
+        """
         self.begin_log_time = datetime.fromtimestamp(
-            self.begin_log_time + ysi_epoch_in_seconds)
+            self.begin_log_time + self.ysi_epoch_in_seconds)
 
         self.first_sample_time = datetime.fromtimestamp(
-            self.first_sample_time + ysi_epoch_in_seconds)
+            self.first_sample_time + self.ysi_epoch_in_seconds)
 
-    def read_param_def(self, param_file):
+    def set_data(self, julian_time, values):
         """
-        Open and read a YSI param definition file.
+        Set the dates and parameter data from the record times and the
+        (records, parameters) array of record values
         """
-        if param_file == None:
-            file_string = pkg_resources.resource_string('sonde',
-                                                        DEFAULT_YSI_PARAM_DEF)
-        elif type(param_file) == str:
-            with open(param_file, 'rb') as fid:
-                file_string = fid.read()
+        tzinfo = self.default_tzinfo
+        self.julian_time = julian_time
+        for ii in range(self.num_params):
+            param = self.parameters[ii]
+            param.data = values[:, ii].astype('f8').round(
+                decimals=param.ndecimals)
 
-        elif type(param_file) == file:
-            file_string = param_file.read()
+        self.dates = np.array([datetime.fromtimestamp(
+            t + self.ysi_epoch_in_seconds, tzinfo)
+                               for t in self.julian_time])
 
-        file_string = re.sub("\n\s*\n*", "\n", file_string)
-        file_string = re.sub(";.*\n*", "", file_string)
-        file_string = re.sub("\t", "", file_string)
-        file_string = re.sub("\"", "", file_string)
-        self.ysi_file_version = int(file_string.splitlines()[0].split('=')[-1])
-        self.ysi_num_param_in_def = int(
-            file_string.splitlines()[1].split('=')[-1])
-        self.ysi_ecowatch_version = int(
-            file_string.splitlines()[2].split('=')[-1])
-        dtype = np.dtype([('ysi_id', '<i8'),
-                          ('name', '|S20'),
-                          ('unit', '|S11'),
-                          ('shortname', '|S9'),
-                          ('num_dec_places', '<i8')])
-        self.ysi_param_def = np.genfromtxt(StringIO(file_string),
-                                           delimiter=',',
-                                           usecols=(0, 1, 3, 5, 7),
-                                           skip_header=3, dtype=dtype)
+        if tzinfo:
+            self.dates = [i.replace(tzinfo=tzinfo) for i in self.dates]
+
+    def read_param_def(self, param_file):
+        """
+        Read a YSI param definition file, see load_param_def
+        """
+        param_def = load_param_def(param_file)
+        self.ysi_file_version = param_def.file_version
+        self.ysi_num_param_in_def = param_def.num_param_in_def
+        self.ysi_ecowatch_version = param_def.ecowatch_version
+        self.ysi_param_def = param_def.table
+        self.ysi_param_types = param_def.types
 
     def read_ysi(self, ysi_file):
         """
@@ -248,20 +358,77 @@ class YSIReaderBin:
             fid = ysi_file
             fid.seek(0)
 
-        record_type = []
-        self.num_params = 0
+        time_runs = []
+        data_runs = []
+        for julian_time, values in self.read_records(fid):
+            time_runs.append(julian_time)
+            data_runs.append(values)
+
+        if type(ysi_file) == str:
+            fid.close()
+
+        if len(data_runs) == 1:
+            self.julian_time = time_runs[0]
+            self.values = data_runs[0]
+        elif len(data_runs) > 1:
+            self.julian_time = np.concatenate(time_runs)
+            self.values = np.concatenate(data_runs)
+        else:
+            self.julian_time = np.array([], dtype='<i4')
+            self.values = np.zeros((0, self.num_params), dtype='<f4')
+
+    def iter_ysi(self, ysi_file, chunk_rows):
+        """
+        Open a YSI binary file and read it `chunk_rows` data records at
+        a time, yielding the reader after each chunk has been read.
+        """
+        if type(ysi_file) == str:
+            fid = open(ysi_file, 'rb')
+
+        else:
+            fid = ysi_file
+            fid.seek(0)
+
+        try:
+            header_times_set = False
+            for julian_time, values in self.read_records(fid, chunk_rows):
+                if not header_times_set:
+                    self.set_header_times()
+                    header_times_set = True
+                self.set_data(julian_time, values)
+                yield self
+        finally:
+            if type(ysi_file) == str:
+                fid.close()
+
+    def read_records(self, fid, chunk_rows=None):
+        """
+        Read the records of a YSI binary file from the file object
+        `fid`, yielding a (time, values) tuple for each block of data
+        records. A block is a run of consecutive data records, split
+        into blocks of at most `chunk_rows` records if `chunk_rows` is
+        given.
+
+        The 'A' (header) and 'B' (channel definition) records are
+        unpacked one at a time. The fixed-size 'D' (data) records are
+        decoded a block at a time with a numpy structured dtype, so the
+        timestamps and channel values come out as column views of the
+        bytes read.
+        """
+        while True:
+            record_type = fid.read(1)
+            if not record_type:
+                break
 
-        record_type = fid.read(1)
-        while record_type:
             if record_type == 'A':
                 fmt = '<HLH16s32s6sLll36s'
-                fmt_size = struct.calcsize(fmt)
                 self.instr_type, self.system_sig, self.prog_ver, \
                                  self.serial_number, self.site_name, \
                                  self.pad1, self.logging_interval, \
                                  self.begin_log_time, \
                                  self.first_sample_time, self.pad2 \
-                                 = struct.unpack(fmt, fid.read(fmt_size))
+                                 = struct.unpack(
+                                     fmt, fid.read(struct.calcsize(fmt)))
                 self.site_name = self.site_name.strip('\x00')
                 self.serial_number = self.serial_number.strip('\x00')
                 self.log_file_name = self.site_name
@@ -269,29 +436,46 @@ class YSIReaderBin:
             elif record_type == 'B':
                 self.num_params = self.num_params + 1
                 fmt = '<hhHff'
-                fmt_size = struct.calcsize(fmt)
                 self.parameters.append(
-                    ChannelRec(struct.unpack(fmt, fid.read(fmt_size)),
-                               self.ysi_param_def))
+                    ChannelRec(struct.unpack(
+                        fmt, fid.read(struct.calcsize(fmt))),
+                               self.ysi_param_types))
 
             elif record_type == 'D':
-                fmt = '<l' + str(self.num_params) + 'f'
-                fmt_size = struct.calcsize(fmt)
-                recs = struct.unpack(fmt, fid.read(fmt_size))
-                self.julian_time.append(recs[0])
-                for ii in range(self.num_params):
-                    self.parameters[ii].data.append(recs[ii + 1])
+                # the record type byte is part of each fixed-size
+                # record in the dtype
+                dtype = np.dtype([('record_type', 'S1'),
+                                  ('time', '<i4'),
+                                  ('values', '<f4', (self.num_params,))])
+                if chunk_rows is None:
+                    buf = record_type + fid.read()
+                else:
+                    buf = record_type + fid.read(
+                        chunk_rows * dtype.itemsize - 1)
+
+                num_records = len(buf) // dtype.itemsize
+                if num_records == 0:
+                    warnings.warn('Truncated data record at end of file',
+                                  Warning)
+                    break
+
+                recs = np.frombuffer(buf, dtype=dtype, count=num_records)
+
+                # the run of data records ends at the first record
+                # that is not a 'D' record
+                not_data = np.flatnonzero(recs['record_type'] != 'D')
+                if not_data.size:
+                    recs = recs[:not_data[0]]
+
+                # go back to the first byte that isn't part of the run
+                fid.seek(recs.size * dtype.itemsize - len(buf), 1)
+                yield recs['time'], recs['values']
 
             else:
                 warnings.warn('Type not implemented yet: %s' % record_type,
                               Warning)
                 break
 
-            record_type = fid.read(1)
-
-        if type(ysi_file) == str:
-            fid.close()
-
 
 class YSIReaderTxt:
     """
@@ -363,13 +547,13 @@ class YSIReaderTxt:
         else:
             y = '%y'
 
-        fmt = re.sub('([mMdD])', '%\\1',
-                     param_units[0].lower()).replace('y', y).strip(' "')
+        date_fmt = re.sub('([mMdD])', '%\\1',
+                          param_units[0].lower()).replace('y', y).strip(' "')
 
         if len(timestr.split(':')) == 3:
-            fmt += ' %H:%M:%S'
+            time_fmt = '%H:%M:%S'
         else:
-            fmt += ' %H:%M'
+            time_fmt = '%H:%M'
 
         params = fields[start:]
         units = units[start:]
@@ -382,16 +566,13 @@ class YSIReaderTxt:
         fid.seek(fid_initial_location)
 
         if fields[0].lower() == 'datetime':
-            self.dates = np.array(
-                [datetime.strptime(d.strip('"'), fmt)
-                 for d in data['DateTime']]
-                )
+            seconds = timeparse.to_epoch(data['DateTime'],
+                                         date_fmt + ' ' + time_fmt,
+                                         strip='"')
         else:
-            self.dates = np.array(
-                [datetime.strptime(d.strip('"') + ' ' + \
-                                            t.strip('"'), fmt)
-                 for d, t in zip(data['Date'], data['Time'])]
-                )
+            seconds = timeparse.to_epoch(data['Date'], date_fmt,
+                                         data['Time'], time_fmt, strip='"')
+        self.dates = timeparse.to_datetimes(seconds)
 
         #assign param & unit names
         for param, unit in zip(params, units):
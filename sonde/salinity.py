@@ -0,0 +1,179 @@
+"""
+    sonde.salinity
+    ~~~~~~~~~~~~~~
+
+    This module implements the practical salinity scale (PSS-78), with
+    the same equations and constants as seawater.salt. The polynomials
+    are evaluated in place over chunks of the input, so the temporary
+    arrays stay small enough to be cached, and the chunks can be spread
+    over a pool of threads since numpy releases the GIL.
+"""
+from __future__ import absolute_import
+
+from multiprocessing.pool import ThreadPool
+
+import numpy as np
+
+
+#: The number of values evaluated at a time by salt
+salinity_chunk_size = 16384
+
+#: The number of threads used by salt, None to evaluate the chunks in
+#: the calling thread
+salinity_workers = None
+
+# PSS-78 coefficients, from Fofonoff and Millard (1983) as used by
+# seawater.library
+_a = (0.0080, -0.1692, 25.3851, 14.0941, -7.0261, 2.7081)
+_b = (0.0005, -0.0056, -0.0066, -0.0375, 0.0636, -0.0144)
+_c = (0.6766097, 2.00564e-2, 1.104259e-4, -6.9698e-7, 1.0031e-9)
+_d = (3.426e-2, 4.464e-4, 4.215e-1, -3.107e-3)
+_e = (2.070e-5, -6.370e-10, 3.989e-15)
+_k = 0.0162
+
+# IPTS-68 temperature from ITS-90
+_t68_scale = 1.00024
+
+
+def salt(r, t, p, chunk_size=None, workers=None, dtype=np.float64,
+         out=None):
+    """
+    Return the practical salinity (PSS-78) for conductivity ratio `r`,
+    temperature `t` (degC, ITS-90) and pressure `p` (dbar). The
+    arguments are broadcast against each other like seawater.salt.
+
+    `chunk_size` is the number of values evaluated at a time (default
+    salinity_chunk_size). If `workers` (default salinity_workers) is
+    greater than 1 the chunks are evaluated by a pool of that many
+    threads. `dtype` can be set to np.float32 to halve the memory used,
+    at the cost of agreeing with seawater.salt to about 1e-4 rather
+    than 1e-10. If `out` is given the result is written to it, it must
+    have the broadcast shape of the arguments.
+    """
+    if chunk_size is None:
+        chunk_size = salinity_chunk_size
+    if workers is None:
+        workers = salinity_workers
+
+    shape = np.broadcast(r, t, p).shape
+    if out is None:
+        out = np.empty(shape, dtype=dtype)
+    elif out.shape != shape:
+        raise ValueError('out has shape %s, expected %s' %
+                         (out.shape, shape))
+
+    r, t, p = [_flat_argument(arg, shape) for arg in (r, t, p)]
+    flat_out = out.reshape(-1)
+
+    size = flat_out.size
+    chunks = [slice(start, min(start + chunk_size, size))
+              for start in range(0, size, chunk_size)]
+
+    def evaluate(chunk):
+        _salt_chunk(_chunk_of(r, chunk), _chunk_of(t, chunk),
+                    _chunk_of(p, chunk), flat_out[chunk])
+
+    if workers is not None and workers > 1 and len(chunks) > 1:
+        pool = ThreadPool(min(workers, len(chunks)))
+        try:
+            pool.map(evaluate, chunks)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        for chunk in chunks:
+            evaluate(chunk)
+
+    # copy back in case reshape couldn't return a view of out
+    if not np.may_share_memory(flat_out, out):
+        out[...] = flat_out.reshape(shape)
+
+    return out
+
+
+def _flat_argument(arg, shape):
+    """
+    Return `arg` as a float scalar if it has a single value, otherwise
+    as a flat array of the broadcast `shape`
+    """
+    arg = np.asarray(arg, dtype=np.float64)
+    if arg.size == 1:
+        return float(arg.reshape(-1)[0])
+
+    if arg.shape != shape:
+        # the flat array of a broadcast is a copy anyway
+        broadcast = np.empty(shape, dtype=np.float64)
+        broadcast[...] = arg
+        arg = broadcast
+
+    return arg.reshape(-1)
+
+
+def _chunk_of(arg, chunk):
+    """the values of `arg` in `chunk`, scalars are returned unchanged"""
+    if isinstance(arg, float):
+        return arg
+    return arg[chunk]
+
+
+def _salt_chunk(r, t, p, out):
+    """
+    Evaluate PSS-78 for one chunk, writing the salinity to `out`. Only
+    three temporaries the size of the chunk are allocated.
+    """
+    dtype = out.dtype
+    t68 = np.multiply(t, _t68_scale, out=np.empty(out.shape, dtype=dtype))
+    work = np.empty(out.shape, dtype=dtype)
+    rt = np.empty(out.shape, dtype=dtype)
+
+    # rt(t), the conductivity ratio of standard seawater at t
+    _horner(_c, t68, rt)
+
+    # rp(r, t, p), the pressure correction; work holds the denominator
+    # 1 + d0*T68 + d1*T68**2 + (d2 + d3*T68)*r
+    np.multiply(t68, _d[3], out=work)
+    work += _d[2]
+    work *= r
+    work += 1
+    out[...] = t68
+    out *= _d[1]
+    out += _d[0]
+    out *= t68
+    work += out
+    # p is usually the same for the whole chunk, so the numerator is
+    # often a scalar
+    numerator = p * (_e[0] + (_e[1] + _e[2] * p) * p)
+    np.divide(numerator, work, out=work)
+    work += 1
+
+    # Rt = r / (rp * rt), the ratio at pressure 0
+    work *= rt
+    np.divide(r, work, out=work)
+    np.sqrt(work, out=work)
+
+    # del_S = (del_T68 / (1 + k*del_T68)) * (b0 + b1*Rt**0.5 + ...)
+    t68 -= 15
+    np.multiply(t68, _k, out=rt)
+    rt += 1
+    np.divide(t68, rt, out=t68)
+    _horner(_b, work, rt)
+    t68 *= rt
+
+    # S = a0 + a1*Rt**0.5 + ... + del_S
+    _horner(_a, work, out)
+    out += t68
+
+    return out
+
+
+def _horner(coefficients, x, out):
+    """
+    Evaluate the polynomial with `coefficients`, lowest order first, at
+    `x` in place in `out`
+    """
+    out.fill(coefficients[-1])
+    for coefficient in coefficients[-2::-1]:
+        out *= x
+        out += coefficient
+
+    return out
@@ -7,17 +7,23 @@
 """
 from __future__ import absolute_import
 
-import datetime
+import copy
+import cPickle as pickle
+import gzip
+import itertools
+import multiprocessing
+from multiprocessing.pool import ThreadPool
 import os
+import sys
 import traceback
 import warnings
 
 import numpy as np
-import quantities as pq
 import pytz
-import seawater
 
-from sonde import quantities as sq
+from sonde import cache as parse_cache
+from sonde import formats
+from sonde import timezones
 from sonde import util
 from sonde.timezones import UTCStaticOffset
 
@@ -29,6 +35,60 @@ default_utc_static_offset = -6
 default_static_timezone = UTCStaticOffset(default_utc_static_offset)
 default_timezone = pytz.timezone('US/Central')
 
+#: The number of bytes autodetect reads from the start of a file
+autodetect_prefix_size = 8192
+
+#: The number of rows in each compressed chunk of netcdf4 files written
+#: by BaseSondeDataset.write
+netcdf_chunk_size = 8192
+
+#: The number of rows formatted at a time by the csv writer
+csv_block_rows = 65536
+
+#: The compression level of gzipped csv files
+csv_gzip_level = 6
+
+
+def _master_parameter_list():
+    """the contents of master_parameter_list"""
+    import quantities as pq
+    from sonde import quantities as sq
+
+    return {
+        'air_pressure': ('Atmospheric Pressure', pq.pascal),
+        'air_temperature': ('Air Temperature', pq.degC),
+        'eastward_water_velocity': ('Eastward Water Velocity', sq.mps),
+        'instrument_battery_voltage': ('Battery Voltage', pq.volt),
+        'northward_water_velocity': ('Northward Water Velocity', sq.mps),
+        'seawater_salinity': ('Salinity', sq.psu),
+        'water_depth_non_vented': (
+            'Depth is the vertical distance below the water surface. '
+            '(No Atm Pressure Correction)', sq.mH2O),
+        'water_depth_vented': (
+            'Depth is the vertical distance below the water surface. '
+            '(w/ Atm Pressure Correction)', sq.mH2O),
+        'water_dissolved_oxygen_concentration': (
+            'Dissolved Oxygen Concentration', sq.mgl),
+        'water_dissolved_oxygen_percent_saturation': (
+            'Dissolved Oxygen Saturation Concentration', pq.percent),
+        'water_electrical_conductivity': (
+            'Electrical Conductivity(Not Normalized)', sq.mScm),
+        'water_ph': ('pH Level', pq.dimensionless),
+        'water_ph_mv': ('pH Sensor milivolts', sq.mvolt),
+        'water_pressure': ('Water Pressure', pq.psi),
+        'water_specific_conductance': (
+            'Specific Conductance(Normalized @25degC)', sq.mScm),
+        'water_surface_elevation': ('Water Surface Elevation', pq.m),
+        'water_temperature': ('Water Temperature', pq.degC),
+        'water_total_dissolved_salts': ('Total Dissolved Salts', sq.mgl),
+        'water_turbidity': ('Turbidity', sq.ntu),
+        'upward_water_velocity': ('Upward Water Velocity', sq.mps),
+        'water_x_velocity': ('Water Velocity in x direction', sq.mps),
+        'water_y_velocity': ('Water in y direction', sq.mps),
+        'chlorophyll_a': ('Chlorophyll-a', sq.ugl),
+        }
+
+
 #: A dict that contains all the parameters that could potentially be
 #: read from a data file, along with their standard units. This list
 #: is exhaustive and will be fully populated whether or not data is or
@@ -36,41 +96,85 @@ default_timezone = pytz.timezone('US/Central')
 #: attribute for parameters that are available for a particular file.
 #: where possible we follow netcdf CF standard for parameter name and unit
 #: (http://cf-pcmdi.llnl.gov/) in other cases we follow the general CF naming
-#: guidelines
-master_parameter_list = {
-    'air_pressure': ('Atmospheric Pressure', pq.pascal),
-    'air_temperature': ('Air Temperature', pq.degC),
-    'eastward_water_velocity': ('Eastward Water Velocity', sq.mps),
-    'instrument_battery_voltage': ('Battery Voltage', pq.volt),
-    'northward_water_velocity': ('Northward Water Velocity', sq.mps),
-    'seawater_salinity': ('Salinity', sq.psu),
-    'water_depth_non_vented': (
-        'Depth is the vertical distance below the water surface. '
-        '(No Atm Pressure Correction)', sq.mH2O),
-    'water_depth_vented': (
-        'Depth is the vertical distance below the water surface. '
-        '(w/ Atm Pressure Correction)', sq.mH2O),
-    'water_dissolved_oxygen_concentration': (
-        'Dissolved Oxygen Concentration', sq.mgl),
-    'water_dissolved_oxygen_percent_saturation': (
-        'Dissolved Oxygen Saturation Concentration', pq.percent),
-    'water_electrical_conductivity': (
-        'Electrical Conductivity(Not Normalized)', sq.mScm),
-    'water_ph': ('pH Level', pq.dimensionless),
-    'water_ph_mv': ('pH Sensor milivolts', sq.mvolt),
-    'water_pressure': ('Water Pressure', pq.psi),
-    'water_specific_conductance': ('Specific Conductance(Normalized @25degC)',
-                                   sq.mScm),
-    'water_surface_elevation': ('Water Surface Elevation', pq.m),
-    'water_temperature': ('Water Temperature', pq.degC),
-    'water_total_dissolved_salts': ('Total Dissolved Salts', sq.mgl),
-    'water_turbidity': ('Turbidity', sq.ntu),
-    'upward_water_velocity': ('Upward Water Velocity', sq.mps),
-    'water_x_velocity': ('Water Velocity in x direction', sq.mps),
-    'water_y_velocity': ('Water in y direction', sq.mps),
-    'chlorophyll_a': ('Chlorophyll-a', sq.ugl),
+#: guidelines. The units are quantities units, which are only imported
+#: when the list is first used.
+master_parameter_list = util.LazyDict(_master_parameter_list)
+
+
+#: The CF standard names of the parameters that have one, written to
+#: netcdf4 files
+cf_standard_names = {
+    'air_pressure': 'air_pressure',
+    'air_temperature': 'air_temperature',
+    'chlorophyll_a': 'mass_concentration_of_chlorophyll_a_in_sea_water',
+    'eastward_water_velocity': 'eastward_sea_water_velocity',
+    'northward_water_velocity': 'northward_sea_water_velocity',
+    'seawater_salinity': 'sea_water_practical_salinity',
+    'upward_water_velocity': 'upward_sea_water_velocity',
+    'water_dissolved_oxygen_concentration':
+        'mass_concentration_of_oxygen_in_sea_water',
+    'water_dissolved_oxygen_percent_saturation':
+        'fractional_saturation_of_oxygen_in_sea_water',
+    'water_electrical_conductivity': 'sea_water_electrical_conductivity',
+    'water_pressure': 'sea_water_pressure',
+    'water_temperature': 'sea_water_temperature',
+    'water_turbidity': 'sea_water_turbidity',
     }
 
+#: The UDUNITS strings of the unit symbols that aren't valid UDUNITS
+#: units, see udunits
+udunits_symbols = {
+    '%': 'percent',
+    'PSU': '1e-3',
+    'NTU': '1',
+    'mH2O': 'm H2O',
+    'ftH2O': 'ft H2O',
+    }
+
+
+def udunits(unit):
+    """
+    Return the UDUNITS string of the quantities `unit`, as written to
+    the units attribute of netcdf4 files
+    """
+    keys = unit.dimensionality.keys()
+    if not len(keys):
+        return '1'
+
+    symbol = keys[0].symbol
+    return udunits_symbols.get(symbol, symbol)
+
+
+#: The scale factors between units, keyed by the (from, to) pair of
+#: unit symbols, see unit_scale
+unit_scales = {}
+
+
+def unit_scale(from_unit, to_unit):
+    """
+    Return the factor that converts values in quantities units
+    `from_unit` to `to_unit`, or None if the units are the same. The
+    factors are looked up once and kept in `unit_scales`; they are
+    the same factors quantities uses in Quantity.rescale. Temperature
+    offsets are not included (see
+    BaseSondeDataset._temperature_offset).
+    """
+    key = (from_unit.dimensionality.string, to_unit.dimensionality.string)
+    try:
+        return unit_scales[key]
+    except KeyError:
+        pass
+
+    if from_unit.dimensionality == to_unit.dimensionality:
+        scale = None
+    else:
+        import quantities as pq
+        scale = float(pq.Quantity(1.0, from_unit.dimensionality).rescale(
+            to_unit).magnitude)
+    unit_scales[key] = scale
+
+    return scale
+
 
 def open_sonde(data_file, file_format=None, *args, **kwargs):
     """
@@ -87,7 +191,8 @@ def Sonde(data_file, file_format=None, *args, **kwargs):
     that the file is in. if `file_format` not provided function will
     try to autodetect format.
 
-    Currently supported file formats are:
+    Currently supported file formats are listed below, more can be
+    added with sonde.formats.register_format:
       - `ysi`: a YSI binary file
       - `hydrolab`: a Hydrolab txt file
       - `greenspan`: a Greenspan txt/csv/xls file
@@ -95,8 +200,36 @@ def Sonde(data_file, file_format=None, *args, **kwargs):
       - `macroctd` : a Macroctd csv file
       - `hydrotech` : a Hydrotech csv file
       - `solinst` : a solinst lev file
+      - `netcdf4` : a netcdf4 file written by BaseSondeDataset.write
+
+    Any keyword arguments not used by the format are passed on to
+    `BaseSondeDataset`, e.g. `datetime64_dates=True` stores the
+    timestamps as a datetime64 array (see `BaseSondeDataset`).
 
+    If `data_file` is a file path, the processed dataset can be kept in
+    an on-disk cache so the file doesn't have to be parsed again the
+    next time it is read. `cache` is either a sonde.cache.ParseCache
+    or the path of a cache directory, and defaults to
+    sonde.cache.default_cache.
     """
+    cache = kwargs.pop('cache', parse_cache.default_cache)
+    if cache is not None and type(data_file) == str:
+        if not isinstance(cache, parse_cache.ParseCache):
+            cache = parse_cache.ParseCache(cache)
+
+        # datetime64_dates only changes how the dates are represented,
+        # so both representations share the same entry
+        read_kwargs = dict(kwargs)
+        datetime64_dates = read_kwargs.pop('datetime64_dates', False)
+        read_args = (file_format, args, sorted(read_kwargs.items()))
+        dataset = cache.load(data_file, read_args,
+                             datetime64_dates=datetime64_dates)
+        if dataset is None:
+            dataset = Sonde(data_file, file_format, cache=None, *args,
+                            **kwargs)
+            cache.store(data_file, read_args, dataset)
+
+        return dataset
 
     if not file_format:
         file_format = autodetect(data_file)
@@ -105,52 +238,52 @@ def Sonde(data_file, file_format=None, *args, **kwargs):
             raise Exception("File Format Autodetection Failed. Try "
                             "specifying the file_format.")
 
-    if 'ysi' in file_format.lower():
-        from sonde.formats.ysi import YSIDataset
-        return YSIDataset(data_file, *args, **kwargs)
+    registered_format = formats.get_format(file_format)
 
-    if file_format.lower() == 'hydrolab':
-        from sonde.formats.hydrolab import HydrolabDataset
-        return HydrolabDataset(data_file, *args, **kwargs)
+    # the ysi and espey datasets sniff the file again unless they are
+    # told which of their formats was detected
+    if registered_format.pass_format and len(args) < 3:
+        kwargs.setdefault('format', registered_format.name)
 
-    if file_format.lower() == 'greenspan':
-        from sonde.formats.greenspan import GreenspanDataset
-        return GreenspanDataset(data_file, *args, **kwargs)
+    dataset_class = registered_format.dataset_class()
+    return dataset_class(data_file, *args, **kwargs)
 
-    if file_format.lower() == 'eureka':
-        from sonde.formats.eureka import EurekaDataset
-        return EurekaDataset(data_file, *args, **kwargs)
 
-    if file_format.lower() == 'macroctd':
-        from sonde.formats.macroctd import MacroctdDataset
-        return MacroctdDataset(data_file, *args, **kwargs)
-
-    if file_format.lower() == 'hydrotech':
-        from sonde.formats.hydrotech import HydrotechDataset
-        return HydrotechDataset(data_file, *args, **kwargs)
+def iter_sonde(data_file, file_format=None, chunk_rows=10000, *args,
+               **kwargs):
+    """
+    Read `data_file` in chunks of `chunk_rows` rows, yielding a sonde
+    dataset instance for each chunk, so that only one chunk is held in
+    memory at a time. The chunks are in time order and, like the
+    datasets created by `Sonde`, each has its own dates and data arrays
+    in standard units. Parameters that have no data in a chunk are left
+    out of that chunk.
+
+    `file_format` and any other arguments are used as they are by
+    `Sonde`. Reading in chunks is currently supported for the
+    following formats:
+      - `ysi`: a YSI binary file
+      - `hydrolab`: a Hydrolab txt file
+      - `generic`: a generic csv file
+    """
+    if not file_format:
+        file_format = autodetect(data_file)
 
-    if file_format.lower() == 'solinst':
-        from sonde.formats.solinst import SolinstDataset
-        return SolinstDataset(data_file, *args, **kwargs)
+        if file_format == False:
+            raise Exception("File Format Autodetection Failed. Try "
+                            "specifying the file_format.")
 
-    if file_format.lower() == 'generic':
-        from sonde.formats.generic import GenericDataset
-        return GenericDataset(data_file, *args, **kwargs)
+    registered_format = formats.get_format(file_format)
 
-    if file_format.lower() == 'midgewater':
-        from sonde.formats.midgewater import MidgewaterDataset
-        return MidgewaterDataset(data_file, *args, **kwargs)
+    if registered_format.pass_format and len(args) < 3:
+        kwargs.setdefault('format', registered_format.name)
 
-    if file_format.lower() == 'espey':
-        from sonde.formats.espey import EspeyDataset
-        return EspeyDataset(data_file, *args, **kwargs)
+    dataset_class = registered_format.dataset_class()
+    if not hasattr(dataset_class, 'iter_chunks'):
+        raise NotImplementedError("file format '%s' can not be read in "
+                                  "chunks" % (file_format,))
 
-    if file_format.lower() == 'lcra':
-        from sonde.formats.lcra import LcraDataset
-        return LcraDataset(data_file, *args, **kwargs)
-    else:
-        raise NotImplementedError("file format '%s' is not supported" % \
-                                   (file_format,))
+    return dataset_class.iter_chunks(data_file, chunk_rows, *args, **kwargs)
 
 
 def autodetect(data_file, filename=None):
@@ -174,74 +307,14 @@ def autodetect(data_file, filename=None):
 
     file_ext = filename.split('.')[-1].lower()
 
+    # only the first few lines are needed, so read the first rows of
+    # an excel file or a bounded prefix of any other file
     if file_ext and file_ext == 'xls':
-        temp_csv_path, xls_read_mode = util.xls_to_csv(data_file)
-        fid = open(temp_csv_path, 'rb')
-        lines = [fid.readline() for i in range(3)]
-        fid.close()
-        os.remove(temp_csv_path)
-
+        prefix = util.xls_head_to_csv(data_file, 3)
     else:
-        if type(data_file) == str:
-            fid = open(data_file, 'r')
-        else:
-            fid = data_file
-
-        file_initial_location = fid.tell()
-        fid.seek(0)
-        lines = [fid.readline() for i in range(3)]
-        fid.seek(file_initial_location)
-
-
-    if lines[0].lower().find('greenspan') != -1:
-        return 'greenspan'
-    if lines[0].lower().find('macroctd') != -1:
-        return 'macroctd'
-    if lines[0].lower().find('minisonde4a') != -1:
-        return 'hydrotech'
-    if lines[0].lower().find('data file for datalogger.') != -1:
-        return 'solinst'
-    if lines[0].find('Serial_number:')!= -1 and lines[2].find('Project ID:')!= -1:
-        return 'solinst'
-    if lines[0].lower().find('log file name') != -1:
-        return 'hydrolab'
-    if lines[0].lower().find('pysonde csv format') != -1:
-        return 'generic'
-        # possible binary junk in first line of hydrotech file
-    if lines[1].lower().find('log file name') != -1:
-        return 'hydrotech'
-    if lines[0].lower().find('the following data have been') != -1:
-        return 'lcra'
-
-    # ascii files for ysi in brazos riv.
-    if lines[0].find('espey') != -1:
-        return 'espey'
-
-    #check for ysi:
-    # binary
-    if lines[0][0] == 'A':
-        return 'ysi_binary'
-    # txt file
-    if lines[0].find('=') != -1:
-        return 'ysi_text'
-    if lines[0].find('##YSI ASCII Datafile=') != -1:
-        return 'ysi_ascii'
-    # cdf file
-    if file_ext and file_ext == 'cdf':
-        return 'ysi_cdf'
-    if lines[0].find("Date") > -1 and lines[1].find("M/D/Y") > -1:
-        return 'ysi_csv'
-
-    #eureka try and detect degree symbol
-    if lines[1].find('\xb0') > -1 or lines[2].find('Manta') > -1 or \
-           lines[0].find('Start time : ') > -1:
-        return 'eureka'
-
-    # files from various intruments processed by an old script.
-    if lines[0].lower().find('request date') != -1:
-        return 'midgewater'
-    else:
-        return False
+        prefix = util.read_file_prefix(data_file, autodetect_prefix_size)
+
+    return formats.sniff_format(prefix, filename) or False
 
 
 def find_tz(dt):
@@ -254,7 +327,50 @@ def find_tz(dt):
     return UTCStaticOffset(utc_offset)
 
 
-def merge(file_list, tz_list=None):
+def _read_merge_file(args):
+    """
+    Read a single file for merge(). `args` is a (file_name, tz) tuple,
+    where `tz` is a tzinfo instance, a 'utc-6' style string or 'auto'.
+
+    Returns a (columns, error) tuple. `columns` is a tuple of the UTC
+    dates as a datetime64 array, the serial number, the manufacturer
+    and a dict of the parameter values as plain float arrays. If the
+    file could not be read, `columns` is None and `error` is the
+    formatted traceback. Only numpy arrays and strings are returned so
+    the result is cheap to send back from a worker process.
+    """
+    file_name, tz = args
+    try:
+        if tz == 'auto':
+            # the timezone is resolved here rather than in the parent
+            # process, so each file is only handled by one process. Files
+            # read without a timezone are read again in the timezone of
+            # their setup time, since some readers (YSI binary) convert
+            # naive dates to the host's local time rather than keeping
+            # the wall clock time of the file.
+            dataset = Sonde(file_name, datetime64_dates=True,
+                            plain_arrays=True)
+            if dataset.tzinfo is None:
+                dataset = Sonde(file_name,
+                                tzinfo=find_tz(dataset.setup_time),
+                                datetime64_dates=True, plain_arrays=True)
+        else:
+            if isinstance(tz, str):
+                tz = UTCStaticOffset(int(tz.lower().strip('utc')))
+            dataset = Sonde(file_name, tzinfo=tz, datetime64_dates=True,
+                            plain_arrays=True)
+    except:
+        return None, traceback.format_exc()
+
+    data = dict([(param, np.asarray(values))
+                 for param, values in dataset.data.items()
+                 if param in master_parameter_list])
+
+    return (dataset.utc_dates, dataset.serial_number, dataset.manufacturer,
+            data), None
+
+
+def merge(file_list, tz_list=None, datetime64_dates=False, workers=None):
     """
     Merges all files in file_list
     tz_list specifies timezone of each file.
@@ -262,6 +378,11 @@ def merge(file_list, tz_list=None):
     If tz_list == None then cst is assumed i.e UTC-6
        tz_list == auto then cst/cdt is determined from dataset.setup_date
        tz_list == ['utc-6','utc-5', etc]
+    If datetime64_dates is True, the merged dataset stores its dates
+    as a datetime64 array (see BaseSondeDataset)
+    If workers is greater than 1, the files are read in parallel by a
+    pool of that many processes. The merged result does not depend on
+    the number of workers.
     returns a Sonde object
     """
     from sonde.formats.merge import MergeDataset
@@ -274,64 +395,167 @@ def merge(file_list, tz_list=None):
     #     tz_list = [UTCStaticOffset(int(tz.lower().strip('utc')))
     #                for tz in tz_list]
 
+    # the columns of each file are collected first and concatenated
+    # once at the end, so merging is linear in the number of files
     metadata = dict()
     data = dict()
 
-    metadata['dates'] = np.empty(0, dtype=datetime.datetime)
-    metadata['data_file_name'] = np.empty(0, dtype='|S100')
-    metadata['instrument_serial_number'] = np.empty(0, dtype='|S15')
-    metadata['instrument_manufacturer'] = np.empty(0, dtype='|S15')
+    # dates are merged as datetime64 UTC times; MergeDataset converts
+    # the rows it keeps to datetime.datetime instances if needed
+    metadata['dates'] = [np.empty(0, dtype='M8[ns]')]
+    metadata['data_file_name'] = [np.empty(0, dtype='|S100')]
+    metadata['instrument_serial_number'] = [np.empty(0, dtype='|S15')]
+    metadata['instrument_manufacturer'] = [np.empty(0, dtype='|S15')]
 
     for param, unit in master_parameter_list.items():
-        data[param] = np.empty(0, dtype='<f8') * unit[-1]
+        data[param] = [np.empty(0, dtype='<f8') * unit[-1]]
 
-    for file_name, tz in zip(file_list, tz_list):
-        try:
-            if tz == 'auto':
-                tmp = Sonde(file_name)
-                # tz = UTCStaticOffset(utc_offset)
-                tz = find_tz(tmp.setup_time)
-            elif isinstance(tz, str):
-                tz = UTCStaticOffset(int(tz.lower().strip('utc')))
-            dataset = Sonde(file_name, tzinfo=tz)
-        except:
-            warnings.warn('merged failed for file %s with error: %s' % (file_name, traceback.print_exc()), Warning)
-            continue
-
-        fn_list = np.zeros(len(dataset.dates), dtype='|S100')
-        sn_list = np.zeros(len(dataset.dates), dtype='|S15')
-        m_list = np.zeros(len(dataset.dates), dtype='|S15')
-
-        fn_list[:] = os.path.split(file_name)[-1]
-        sn_list[:] = dataset.serial_number
-        m_list[:] = dataset.manufacturer
-
-        metadata['dates'] = np.hstack((metadata['dates'], dataset.dates))
-        metadata['data_file_name'] = np.hstack(
-            (metadata['data_file_name'], fn_list))
-        metadata['instrument_serial_number'] = np.hstack(
-            (metadata['instrument_serial_number'], sn_list))
-        metadata['instrument_manufacturer'] = np.hstack(
-            (metadata['instrument_manufacturer'], m_list))
-
-        no_data = np.zeros(len(dataset.dates))
-        no_data[:] = np.nan
-        for param in master_parameter_list.keys():
-            if param in dataset.data.keys():
-                tmp_data = dataset.data[param]
-            else:
-                tmp_data = no_data
+    jobs = zip(file_list, tz_list)
 
-            data[param] = np.hstack((data[param], tmp_data))
-        print 'merged: %s' % file_name
+    pool = None
+    if workers > 1:
+        pool = multiprocessing.Pool(workers)
+        results = pool.imap(_read_merge_file, jobs)
+    else:
+        results = itertools.imap(_read_merge_file, jobs)
+
+    try:
+        for file_name, (columns, error) in itertools.izip(file_list,
+                                                          results):
+            if columns is None:
+                sys.stderr.write(error)
+                warnings.warn('merged failed for file %s with error: %s' %
+                              (file_name, error.strip().splitlines()[-1]),
+                              Warning)
+                continue
+
+            utc_dates, serial_number, manufacturer, file_data = columns
+
+            fn_list = np.zeros(len(utc_dates), dtype='|S100')
+            sn_list = np.zeros(len(utc_dates), dtype='|S15')
+            m_list = np.zeros(len(utc_dates), dtype='|S15')
+
+            fn_list[:] = os.path.split(file_name)[-1]
+            sn_list[:] = serial_number
+            m_list[:] = manufacturer
+
+            metadata['dates'].append(utc_dates)
+            metadata['data_file_name'].append(fn_list)
+            metadata['instrument_serial_number'].append(sn_list)
+            metadata['instrument_manufacturer'].append(m_list)
+
+            no_data = np.zeros(len(utc_dates))
+            no_data[:] = np.nan
+            for param in master_parameter_list.keys():
+                data[param].append(file_data.get(param, no_data))
+            print 'merged: %s' % file_name
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+
+    for key in metadata.keys():
+        metadata[key] = np.hstack(metadata[key])
 
     for param, unit in master_parameter_list.items():
+        data[param] = np.hstack(data[param])
         if np.all(np.isnan(data[param])):
             del data[param]
         else:
             data[param] = data[param] * unit[-1]
 
-    return MergeDataset(metadata, data)
+    return MergeDataset(metadata, data, datetime64_dates=datetime64_dates)
+
+
+def _read_open_many_file(args):
+    """
+    Read a single file for open_many() in a worker process. `args` is
+    a (path, file_format, kwargs) tuple.
+
+    Returns a (state, error) tuple. `state` is the (header, arrays)
+    pair a parse cache entry is made of, so only plain numpy arrays and
+    a small header are sent back to the calling process. If the file
+    could not be read, `state` is None and `error` is the exception.
+    """
+    path, file_format, kwargs = args
+    try:
+        dataset = Sonde(path, file_format, **kwargs)
+        return parse_cache._dataset_state(dataset), None
+    except Exception, error:
+        try:
+            pickle.dumps(error, pickle.HIGHEST_PROTOCOL)
+        except Exception:
+            error = Exception(traceback.format_exc())
+        return None, error
+
+
+def _read_open_many_dataset(args):
+    """
+    Read a single file for open_many() in the calling process or a
+    worker thread, returning a (dataset, error) tuple
+    """
+    path, file_format, kwargs = args
+    try:
+        return Sonde(path, file_format, **kwargs), None
+    except Exception, error:
+        return None, error
+
+
+def open_many(paths, file_format=None, tzinfo=None, workers=None,
+              executor='process', **kwargs):
+    """
+    Read each of the files in `paths` with Sonde, returning an iterator
+    of (path, result) pairs in the order of `paths`. `result` is the
+    dataset, or the exception raised while reading the file, so one bad
+    file doesn't stop the others from being read.
+
+    `file_format` (autodetected if None) and `tzinfo` are used for all
+    the files, as are any other keyword arguments of Sonde.
+
+    The files are read by a pool of `workers` processes, or threads if
+    `executor` is 'thread'; `workers` defaults to the number of CPUs.
+    Each pair is returned as soon as its file and the files before it
+    have been read. Worker processes send back the dates and data of a
+    dataset as plain numpy arrays (the same layout as an entry of
+    sonde.cache.ParseCache) rather than pickling the dataset. If
+    `workers` is 1 the files are read one at a time in the calling
+    process.
+    """
+    if executor not in ('process', 'thread'):
+        raise ValueError("executor must be 'process' or 'thread', not %r" %
+                         (executor,))
+    if tzinfo is not None:
+        kwargs['tzinfo'] = tzinfo
+    if workers is None:
+        workers = multiprocessing.cpu_count()
+
+    paths = list(paths)
+    jobs = [(path, file_format, kwargs) for path in paths]
+    if workers <= 1 or len(jobs) <= 1:
+        results = itertools.imap(_read_open_many_dataset, jobs)
+        pool = None
+    elif executor == 'thread':
+        pool = ThreadPool(min(workers, len(jobs)))
+        results = pool.imap(_read_open_many_dataset, jobs)
+    else:
+        pool = multiprocessing.Pool(min(workers, len(jobs)))
+        results = pool.imap(_read_open_many_file, jobs)
+
+    datetime64_dates = kwargs.get('datetime64_dates', False)
+    try:
+        for path, (result, error) in itertools.izip(paths, results):
+            if error is not None:
+                yield path, error
+            elif isinstance(result, BaseSondeDataset):
+                yield path, result
+            else:
+                header, arrays = result
+                yield path, parse_cache._restore_dataset(header, arrays,
+                                                         datetime64_dates)
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
 
 
 class BaseSondeDataset(object):
@@ -339,43 +563,93 @@ class BaseSondeDataset(object):
     The base class that all sonde format objects should inherit. This
     class contains all the attributes and methods that are common to
     all data formats; it is not intended to be instantiated directly.
+
+    If `datetime64_dates` is True, the timestamps are stored as a
+    datetime64[ns] array of UTC times (see `utc_dates`) plus a single
+    dataset-level `tzinfo`, rather than as an array of
+    datetime.datetime instances. Timezone conversion then only changes
+    `tzinfo`, and the `dates` attribute is built lazily the first time
+    it is accessed.
+
+    If `plain_arrays` is True, the values in `data` are plain float
+    arrays rather than quantities and the unit of each parameter is
+    kept in the `units` dict. The format modules store the values they
+    read with `_set_parameter_data`, so no quantities arrays are made
+    in this mode. Unit conversions then use the scale and offset tables
+    in `unit_scale` and `_temperature_offset` instead of the quantities
+    machinery, and give the same values.
+
+    Parameters that can be calculated from the measured ones, e.g.
+    salinity from conductivity and temperature, are listed in `data`
+    and `parameters` but only calculated the first time they are
+    accessed. See sonde.derived.
     """
     #: A dict that maps parameter codes to long descriptions and their
     #: standard units
     parameters = {}
 
-    def __init__(self, data_file=None):
+    #: Whether the timestamps are stored as a datetime64 array
+    datetime64_dates = False
+
+    #: Whether the data values are plain arrays, with their units in
+    #: `units`
+    plain_arrays = False
+
+    _dates = None
+    _utc_dates = None
+    _tzinfo = None
+    _date_axis = None
+
+    def __init__(self, data_file=None, datetime64_dates=False,
+                 plain_arrays=False):
+        import quantities as pq
+        from sonde.derived import DerivedData
+
         if type(data_file) == str:
             self.file_name = data_file
         elif type(data_file) == file:
             self.file_name = data_file.name
+        self.datetime64_dates = datetime64_dates
+        self.plain_arrays = plain_arrays
         self.data = {}
+        self.units = {}
         self.dates = []
         self.format_parameters = {}
         self.manufacturer = ''
         self.serial_number = ''
         self._read_data()
+
+        # formats that build quantities arrays themselves
+        if self.plain_arrays:
+            for param_code, values in self.data.items():
+                if isinstance(values, pq.Quantity):
+                    self.units[param_code] = values.units
+                    self.data[param_code] = values.magnitude
+
         self.rescale_all()
 
-        if 'water_specific_conductance' in self.data or \
-               'water_electrical_conductivity' in self.data:
-            self._calculate_salinity()
+        # derived parameters are only calculated when they are accessed
+        self.data = DerivedData(self, self.data)
+        for param_code in self.data.keys():
+            if param_code not in self.parameters:
+                self.parameters[param_code] = \
+                    master_parameter_list[param_code]
 
         #if 'site_name' in self.format_parameters.keys():
         #    site_name = self.format_parameters['site_name']
         #    @todo tz check
 
-        if default_static_timezone and self.dates[0].tzinfo != None:
+        if default_static_timezone and self.tzinfo != None:
             self.convert_timezones(default_static_timezone)
 
         if not hasattr(self, 'setup_time'):
-            self.setup_time = self.dates[0]
+            self.setup_time = self._date_at(0)
 
         if not hasattr(self, 'start_time'):
-            self.start_time = self.dates[0]
+            self.start_time = self._date_at(0)
 
         if not hasattr(self, 'stop_time'):
-            self.stop_time = self.dates[-1]
+            self.stop_time = self._date_at(-1)
 
         if not hasattr(self, 'serial_number'):
             self.serial_number = ''
@@ -383,6 +657,74 @@ class BaseSondeDataset(object):
         if not hasattr(self, 'site_name'):
             self.site_name = ''
 
+    def _get_dates(self):
+        if self.datetime64_dates and self._dates is None:
+            self._dates = util.datetime64_to_datetimes(self._utc_dates,
+                                                       self._tzinfo)
+        return self._dates
+
+    def _set_dates(self, dates):
+        if self.datetime64_dates:
+            utc_dates, tzinfo = util.datetimes_to_datetime64(dates)
+            self.set_utc_dates(utc_dates, tzinfo)
+        else:
+            self._dates = dates
+
+    dates = property(_get_dates, _set_dates, doc="""
+        The timestamps of the dataset as datetime.datetime instances
+        """)
+
+    @property
+    def utc_dates(self):
+        """
+        The timestamps of the dataset as a datetime64[ns] array of UTC
+        times (wall clock times if the dates are naive)
+        """
+        if self.datetime64_dates:
+            return self._utc_dates
+
+        return util.datetimes_to_datetime64(self._dates)[0]
+
+    @property
+    def tzinfo(self):
+        """
+        The timezone the dates are represented in, None if the dates
+        are naive
+        """
+        if self.datetime64_dates:
+            return self._tzinfo
+
+        if len(self._dates):
+            return self._dates[0].tzinfo
+
+        return None
+
+    def set_utc_dates(self, utc_dates, tzinfo=None):
+        """
+        Set the dates from `utc_dates`, an array of datetime64 UTC times
+        (or of int64 nanoseconds since the epoch), which are
+        represented in the timezone `tzinfo`. If `tzinfo` is None the
+        values are taken as naive wall clock times.
+        """
+        utc_dates = np.asarray(utc_dates).astype('M8[ns]')
+        if self.datetime64_dates:
+            self._utc_dates = utc_dates
+            self._tzinfo = tzinfo
+            self._dates = None
+        else:
+            self._dates = util.datetime64_to_datetimes(utc_dates, tzinfo)
+
+    def _date_at(self, index):
+        """
+        Return the date at `index` as a datetime.datetime without
+        building the rest of the `dates` array
+        """
+        if self.datetime64_dates and self._dates is None:
+            return util.datetime64_to_datetimes(
+                self._utc_dates[index:][:1], self._tzinfo)[0]
+
+        return self.dates[index]
+
     def apply_mask(self, mask, parameters=None):
         """
         remove data and headers where mask=False
@@ -390,9 +732,20 @@ class BaseSondeDataset(object):
         else apply to list of parameters by setting
         parameter values to np.nan based on mask
         """
+        from sonde.derived import DerivedData
+
         if parameters is None:
-            self.dates = self.dates[mask]
-            for key in self.data.keys():
+            if self.datetime64_dates:
+                self.set_utc_dates(self._utc_dates[mask], self._tzinfo)
+            else:
+                self.dates = self.dates[mask]
+            # derived values are masked by being derived again from
+            # the masked parameters
+            if isinstance(self.data, DerivedData):
+                keys = self.data.measured_keys()
+            else:
+                keys = self.data.keys()
+            for key in keys:
                 self.data[key] = self.data[key][mask]
 
             self.manufacturer = self.manufacturer[mask]
@@ -400,14 +753,114 @@ class BaseSondeDataset(object):
             self.serial_number = self.serial_number[mask]
         else:
             for parameter in parameters:
-                self.data[parameter][~mask] = np.nan
+                values = self.data[parameter]
+                values[~mask] = np.nan
+                # assigned back so values derived from it are updated
+                self.data[parameter] = values
+
+    def between(self, start, end, parameters=None):
+        """
+        Return a dataset of the values timestamped from `start` to
+        `end` (both included). The bounds are datetime.datetime
+        instances, naive ones being in the timezone of the dataset, or
+        datetime64 UTC times; either can be None for an open ended
+        window. If `parameters` is given only those parameters are
+        kept.
+
+        The window is found by a binary search of the timestamps, which
+        must be sorted, and the returned dataset's dates and values are
+        views of this dataset's arrays, so nothing is copied; modify
+        them in place with care.
+        """
+        from sonde.derived import DerivedData
+
+        if self.datetime64_dates:
+            dates = self._utc_dates
+        else:
+            dates = np.asarray(self._dates)
+        axis = self._sorted_date_axis(dates)
+        start_index = 0 if start is None else \
+            np.searchsorted(axis, self._date_bound(start), side='left')
+        end_index = len(axis) if end is None else \
+            np.searchsorted(axis, self._date_bound(end), side='right')
+        window = slice(start_index, max(start_index, end_index))
+
+        if parameters is None:
+            if isinstance(self.data, DerivedData):
+                data_items = self.data.measured_items()
+            else:
+                data_items = self.data.items()
+        else:
+            data_items = [(param, self.data[param]) for param in parameters]
+
+        subset = copy.copy(self)
+        if self.datetime64_dates:
+            subset._utc_dates = dates[window]
+            subset._dates = None
+        else:
+            subset._dates = dates[window]
+        subset._date_axis = None
+        if hasattr(self, 'units'):
+            subset.units = dict(self.units)
+        subset.data = dict((param, values[window])
+                           for param, values in data_items)
+        if isinstance(self.data, DerivedData):
+            subset.data = DerivedData(subset, subset.data)
+
+        # merged datasets have a file name, serial number and
+        # manufacturer per timestamp
+        for attr in ('data_file', 'serial_number', 'manufacturer'):
+            values = getattr(self, attr, None)
+            if isinstance(values, np.ndarray) and len(values) == len(axis):
+                setattr(subset, attr, values[window])
+
+        return subset
+
+    def _sorted_date_axis(self, dates):
+        """
+        Return the timestamps `dates` as int64 nanoseconds since the
+        epoch, cached until the dates change. A ValueError is raised if
+        they aren't sorted.
+        """
+        if self._date_axis is None or self._date_axis[0] is not dates:
+            if self.datetime64_dates:
+                axis = np.asarray(dates, dtype='M8[ns]').view(np.int64)
+            else:
+                axis = util.datetimes_to_datetime64(dates)[0].view(np.int64)
+            is_sorted = bool(np.all(axis[1:] >= axis[:-1]))
+            self._date_axis = (dates, axis, is_sorted)
+
+        dates, axis, is_sorted = self._date_axis
+        if not is_sorted:
+            raise ValueError("the dates of the dataset are not sorted")
+
+        return axis
+
+    def _date_bound(self, date):
+        """`date` as int64 nanoseconds since the epoch in UTC"""
+        if isinstance(date, np.datetime64):
+            return np.datetime64(date, 'ns').astype(np.int64)
+
+        if date.tzinfo is None and self.tzinfo is not None:
+            if hasattr(self.tzinfo, 'localize'):
+                date = self.tzinfo.localize(date)
+            else:
+                date = date.replace(tzinfo=self.tzinfo)
+        elif date.tzinfo is not None and self.tzinfo is None:
+            raise ValueError("timezone aware bounds can not be compared "
+                             "with naive dates")
+
+        return util.datetimes_to_datetime64([date])[0].view(np.int64)[0]
 
     def write(self, file_name, file_format='netcdf4', fill_value='-999.99',
               metadata={}, disclaimer='', float_fmt='%5.2f'):
         """
         fill_value must be a float
+
+        Neither the dataset nor `metadata` are modified.
         """
         data = self.data.copy()
+        metadata = dict(metadata)
         #convert to column file_format
         if isinstance(self.data_file, str):
             fn_list = np.zeros(len(self.dates), dtype='|S100')
@@ -443,10 +896,95 @@ class BaseSondeDataset(object):
                           Warning)
             raise
 
+    def _write_netcdf4(self, file_name, metadata, dates, data, disclaimer):
+        """
+        write output in netcdf4 format
+
+        The file has an unlimited time dimension, with the times stored
+        as seconds since 1970-01-01 UTC and the timezone of the dataset
+        in the global `timezone` attribute. Each parameter is a
+        variable named after its parameter code, with its units as a
+        UDUNITS string (see udunits) and its CF standard name if it has
+        one (see cf_standard_names). Metadata arrays are
+        dictionary encoded: the `key` variable holds an index into the
+        `key_values` variable of unique values. Other metadata items
+        are stored as global attributes.
+        """
+        import netCDF4
+
+        fill_value = float(metadata['fill_value'])
+        utc_dates = np.asarray(self.utc_dates, dtype='M8[ns]')
+        chunk_size = max(1, min(len(utc_dates), netcdf_chunk_size))
+
+        nc = netCDF4.Dataset(file_name, 'w', format='NETCDF4')
+        try:
+            nc.setncattr('file_format', 'pysonde netcdf4 format version 1.0')
+            nc.setncattr('Conventions', 'CF-1.6')
+            if disclaimer:
+                nc.setncattr('disclaimer', disclaimer)
+            if self.tzinfo is not None:
+                nc.setncattr('timezone', getattr(self.tzinfo, 'zone',
+                                                 str(self.tzinfo)))
+
+            nc.createDimension('time', None)
+            time_var = nc.createVariable('time', 'f8', ('time',),
+                                         zlib=True, shuffle=True,
+                                         chunksizes=(chunk_size,))
+            time_var.standard_name = 'time'
+            time_var.units = 'seconds since 1970-01-01 00:00:00 UTC'
+            time_var.calendar = 'standard'
+            time_var[:] = utc_dates.view('i8') / 1e9
+
+            for param in np.sort(data.keys()):
+                values = data[param]
+                try:
+                    units = udunits(self.get_units(param))
+                except:
+                    units = '1'
+                values = np.asarray(values, dtype='f8')
+
+                var = nc.createVariable(param, 'f8', ('time',), zlib=True,
+                                        shuffle=True,
+                                        chunksizes=(chunk_size,),
+                                        fill_value=fill_value)
+                var.set_auto_mask(False)
+                if param in master_parameter_list:
+                    var.long_name = master_parameter_list[param][0]
+                if param in cf_standard_names:
+                    var.standard_name = cf_standard_names[param]
+                var.units = units
+                var[:] = np.where(np.isnan(values), fill_value, values)
+
+            for key in np.sort(metadata.keys()):
+                val = metadata[key]
+                if not isinstance(val, np.ndarray):
+                    nc.setncattr(str(key), str(val))
+                    continue
+                if not len(val):
+                    continue
+
+                unique_values, codes = np.unique(val.astype(str),
+                                                 return_inverse=True)
+                nc.createDimension(key + '_values', len(unique_values))
+                values_var = nc.createVariable(key + '_values', str,
+                                               (key + '_values',))
+                values_var[:] = unique_values.astype(object)
+
+                code_var = nc.createVariable(key, 'i4', ('time',),
+                                             zlib=True, shuffle=True,
+                                             chunksizes=(chunk_size,))
+                code_var.dictionary = key + '_values'
+                code_var[:] = codes
+        finally:
+            nc.close()
+
     def _write_csv(self, file_name, metadata, dates, data, disclaimer,
                    float_fmt):
         """
         write output in csv format
+
+        The rows are formatted and written csv_block_rows at a time. If
+        `file_name` ends in '.gz' the file is gzip compressed.
         """
 
         version = '# file_format: pysonde csv format version 1.0\n'
@@ -454,32 +992,23 @@ class BaseSondeDataset(object):
         #prepend parameter list and units with single #
         param_header = '# datetime, '
         unit_header = '# yyyy/mm/dd HH:MM:SS, '
-        dtype_fmts = ['|S19']
+        columns = []
         fmt = '%s, '
+        fill_value = float(metadata['fill_value'])
         for param in np.sort(data.keys()):
             param_header += param + ', '
             try:
-                unit_header += data[param].dimensionality.keys()[0].symbol + \
-                               ', '
+                unit_header += self.get_units(param).dimensionality.keys()[
+                    0].symbol + ', '
             except:
                 unit_header += 'nd, '
-            fill_value = float(metadata['fill_value']) * data[param].units
-            data[param][np.isnan(data[param])] = fill_value
-            dtype_fmts.append('f8')
+            columns.append((np.asarray(data[param], dtype='f8'), fill_value))
             fmt += float_fmt + ', '
 
         #prepend disclaimer and metadata with ##
         for line in disclaimer.splitlines():
             header.append('# disclaimer: ' + line + '\n')
 
-        #for key,val in metadata.items():
-        #    if not isinstance(val, np.ndarray):
-        #        header.append('# ' + str(key) + ': ' + str(val) + '\n')
-        #    else:
-        #        param_header += key + ', '
-        #        unit_header += 'n/a, '
-        #        dtype_fmts.append(val.dtype)
-        #        fmt += '%s, '
         for key in np.sort(metadata.keys()):
             if not isinstance(metadata[key], np.ndarray):
                 header.append('# %s: %s\n' % (str(key), str(metadata[key])))
@@ -487,39 +1016,47 @@ class BaseSondeDataset(object):
             else:
                 param_header += key + ', '
                 unit_header += 'n/a, '
-                dtype_fmts.append(metadata[key].dtype)
+                columns.append((metadata[key], None))
                 fmt += '%s, '
 
         #remove trailing commas
         param_header = param_header[:-2] + '\n'
         unit_header = unit_header[:-2] + '\n'
-        fmt = fmt[:-2]
+        row_fmt = fmt[:-2] + '\n'
 
-        header.append('# timezone: ' + str(self.default_tzinfo) + '\n')
+        header.append('# timezone: ' + str(self.tzinfo) + '\n')
         header.append(param_header)
         header.append(unit_header)
 
-        dtype = np.dtype({
-            'names': param_header.replace(' ', '').strip('#\n').split(','),
-            'formats': dtype_fmts})
-
-        write_data = np.zeros(dates.size, dtype=dtype)
-        write_data['datetime'] = np.array(
-            [datetime.datetime.strftime(dt, '%Y/%m/%d %H:%M:%S')
-             for dt in dates])
-
-        for key, val in metadata.items():
-            if isinstance(val, np.ndarray):
-                write_data[key] = val
-
-        for param in data.keys():
-            write_data[param] = data[param]
+        utc_dates = np.asarray(self.utc_dates, dtype='M8[ns]')
+        local_dates = utc_dates + timezones.utc_offsets(utc_dates,
+                                                        self.tzinfo)
 
         #start writing file
-        fid = open(file_name, 'w')
-        fid.writelines(header)
-        np.savetxt(fid, write_data, fmt=fmt)
-        fid.close()
+        if file_name.endswith('.gz'):
+            fid = gzip.open(file_name, 'wb', csv_gzip_level)
+        else:
+            fid = open(file_name, 'w')
+
+        try:
+            fid.writelines(header)
+            for start in range(0, len(local_dates), csv_block_rows):
+                stop = start + csv_block_rows
+                # fill a (rows, columns) object array so the whole block
+                # is formatted by a single string format operation
+                block = np.empty((len(local_dates[start:stop]),
+                                  len(columns) + 1), dtype=object)
+                block[:, 0] = util.format_datetime64(local_dates[start:stop])
+                for ii, (values, column_fill_value) in enumerate(columns):
+                    values = values[start:stop]
+                    if column_fill_value is not None:
+                        values = np.where(np.isnan(values),
+                                          column_fill_value, values)
+                    block[:, ii + 1] = values
+
+                fid.write(row_fmt * len(block) % tuple(block.ravel()))
+        finally:
+            fid.close()
 
     def get_standard_unit(self, param_code):
         """
@@ -527,6 +1064,18 @@ class BaseSondeDataset(object):
         """
         return self.parameters[param_code][1]
 
+    def get_units(self, param_code):
+        """
+        Return the units the data for parameter `param_code` is in
+        """
+        if self.plain_arrays:
+            if param_code not in self.units:
+                # calculates derived parameters
+                self.data[param_code]
+            return self.units[param_code]
+
+        return self.data[param_code].units
+
     def set_standard_unit(self, param_code, param_unit):
         """
         Set the standard param_unit for a given parameter `param_code`
@@ -540,7 +1089,9 @@ class BaseSondeDataset(object):
 
         self.parameters[param_code] = (param_description, param_unit)
 
-        if param_code in self.data:
+        # derived parameters that aren't listed in data are rescaled too
+        if param_code in self.data or (hasattr(self.data, 'is_derived') and
+                                       self.data.is_derived(param_code)):
             self.rescale_parameter(param_code)
 
     def rescale_all(self):
@@ -555,8 +1106,17 @@ class BaseSondeDataset(object):
         """
         Convert the data for a parameter to its standard unit.
         """
+        import quantities as pq
+        from sonde.derived import DerivedData
+
+        if isinstance(self.data, DerivedData) and \
+               self.data.is_derived(param_code):
+            # derived values are calculated in the standard unit
+            self.data.invalidate(param_code)
+            return
+
         std_unit = self.get_standard_unit(param_code)
-        current_unit = self.data[param_code].units
+        current_unit = self.get_units(param_code)
 
         # return if dimensionless parameter
         if not len(std_unit.dimensionality.keys()):
@@ -567,7 +1127,15 @@ class BaseSondeDataset(object):
         current_symbol = current_unit.dimensionality.keys()[0].symbol
 
         #if current_unit != std_unit:
-        if current_symbol != std_symbol:
+        if current_symbol != std_symbol and self.plain_arrays:
+            values = self._magnitude_in(param_code, std_unit)
+            if isinstance(std_unit, pq.UnitTemperature):
+                values = values + self._temperature_offset(
+                    current_unit, std_unit).magnitude
+            self.data[param_code] = values
+            self.units[param_code] = std_unit
+
+        elif current_symbol != std_symbol:
             self.data[param_code] = self.data[param_code].rescale(std_unit)
 
             # Add temperature offset depending on the temperature scales
@@ -575,6 +1143,20 @@ class BaseSondeDataset(object):
                 self.data[param_code] += self._temperature_offset(
                     current_unit, std_unit)
 
+    def _magnitude_in(self, param_code, unit):
+        """
+        Return the data for parameter `param_code` converted to `unit`
+        as a plain array, without any temperature offset
+        """
+        if not self.plain_arrays:
+            return self.data[param_code].rescale(unit).magnitude
+
+        scale = unit_scale(self.units[param_code], unit)
+        if scale is None:
+            return self.data[param_code]
+
+        return scale * self.data[param_code]
+
     def _temperature_offset(self, from_unit, to_unit):
         """
         Return the offset in degrees of `to_unit` that should be
@@ -582,6 +1164,7 @@ class BaseSondeDataset(object):
         `to_unit`. The quantities package purposely avoids converting
         absolute temperature scales to avoid ambiguity.
         """
+        import quantities as pq
 
         # This looks is a bit hacky because it is. In the quantities
         # package, comparing the units for celcius and kelvin
@@ -618,49 +1201,72 @@ class BaseSondeDataset(object):
                 "conversion from %s to %s not supported" %
                 (from_symbol, to_symbol))
 
-    def _calculate_salinity(self):
+    def _values_in(self, param_code, unit):
         """
-        Calculate salinity if salinity parameter is missing but
-        conductivity is present.
+        Return the data for parameter `param_code` converted to `unit`
+        as a plain array, including any temperature offset
         """
-        params = self.parameters.keys()
-        if 'seawater_salinity' in params:
-            return
+        import quantities as pq
+
+        values = self._magnitude_in(param_code, unit)
+        if isinstance(unit, pq.UnitTemperature):
+            values = values + self._temperature_offset(
+                self.get_units(param_code), unit).magnitude
+
+        return values
+
+    def _derive(self, derived):
+        """
+        Calculate the values of a derived parameter in its standard
+        unit. `derived` is the sonde.derived.DerivedParameter to use.
+        """
+        from sonde.derived import DerivedData
+
+        values = {}
+        for param_code, unit in derived.requires.items():
+            values[param_code] = self._values_in(param_code, unit)
+        # optional inputs are only used if they are measured
+        if isinstance(self.data, DerivedData):
+            measured = self.data.measured_keys()
         else:
-            if 'water_specific_conductance' in params:
-                T = 25.0
-                cond = self.data['water_specific_conductance'].rescale(
-                    sq.mScm).magnitude
-            elif 'water_electrical_conductivity' in params:
-                current_unit = self.data['water_temperature'].units
-                temp_celsius = self.data['water_temperature'].rescale(pq.degC)
-                temp_celsius += self._temperature_offset(current_unit, pq.degC)
-                T = temp_celsius.magnitude
-                cond = self.data['water_electrical_conductivity'].rescale(
-                    sq.mScm).magnitude
-            else:
-                return
+            measured = self.data.keys()
+        for param_code, unit in derived.optional.items():
+            if param_code in measured:
+                values[param_code] = self._values_in(param_code, unit)
 
-            if 'water_depth_non_vented' in params:
-                P = self.data['water_depth_non_vented'].rescale(
-                    sq.dbar).magnitude + (pq.atm).rescale(sq.dbar).magnitude
-            elif 'water_depth_vented' in params:
-                P = self.data['water_depth_vented'].rescale(sq.dbar).magnitude
-            else:
-                P = (pq.atm).rescale(sq.dbar).magnitude
+        derived_values = derived.function(values)
 
-            R = cond / 42.914
-            sal = seawater.salt(R, T, P)
+        if derived.code in self.parameters:
+            std_unit = self.get_standard_unit(derived.code)
+        else:
+            std_unit = master_parameter_list[derived.code][1]
+        scale = unit_scale(derived.unit, std_unit)
+        if scale is not None:
+            derived_values = scale * derived_values
+
+        if self.plain_arrays:
+            self.units[derived.code] = std_unit
+            return derived_values
 
-            self.set_standard_unit('seawater_salinity', sq.psu)
-            self.data['seawater_salinity'] = sal * sq.psu
+        return derived_values * std_unit
 
     def convert_timezones(self, to_tzinfo):
         """
         Convert all dates to some timezone. The argument `to_tzinfo`
         must be an instance of datetime.tzinfo, either from the
         datetime library itself or the pytz library.
+
+        For datasets with `datetime64_dates`, the UTC times are left
+        untouched and only the dataset `tzinfo` is changed.
         """
+        if self.datetime64_dates:
+            if self._tzinfo is None and self._utc_dates is not None \
+                    and len(self._utc_dates):
+                raise ValueError("naive dates can not be converted to "
+                                 "another timezone")
+            self._tzinfo = to_tzinfo
+            self._dates = None
+            return
 
         # If to_tzinfo is a pytz timezone, then use the normalize
         # method so pytz can do normalize DST transition data
@@ -675,6 +1281,20 @@ class BaseSondeDataset(object):
             self.dates = np.array([date.astimezone(to_tzinfo)
                                    for date in self.dates])
 
+    def _set_parameter_data(self, param_code, values, unit):
+        """
+        Set the data of parameter `param_code` to `values` in `unit`,
+        as a plain array with its unit in `units` if `plain_arrays` is
+        True and as a quantities array otherwise
+        """
+        import quantities as pq
+
+        if self.plain_arrays:
+            self.data[param_code] = np.asarray(values, dtype=np.float64)
+            self.units[param_code] = pq.Quantity(1.0, unit.dimensionality)
+        else:
+            self.data[param_code] = values * unit
+
     def _read_data(self):
         """
         Read data from a file. This method should be implemented by
@@ -0,0 +1,191 @@
+"""
+    sonde.timeparse
+    ~~~~~~~~~~~~~~~
+
+    This module parses the timestamp columns of the text formats into
+    int64 seconds since 1970-01-01 (wall clock time, no timezone is
+    applied). Dates, and optionally a separate column of times, are
+    parsed by slicing the digits of their fixed width fields out of the
+    whole column at once (see util.parse_fixed_width_dates), so no
+    datetime.datetime is made per row. The rows that don't fit the fixed
+    widths, e.g. dates without zero padding, are parsed with strptime,
+    once for each distinct value.
+
+    If no format is given it is inferred from a sample of the values.
+    Inferred formats are cached by the layout of the sample, so the
+    files of an instrument only pay for the inference once.
+"""
+from __future__ import absolute_import
+
+import calendar
+import datetime
+import re
+
+import numpy as np
+
+from sonde import util
+
+
+#: date formats tried by infer_format, in order of preference; month
+#: first is preferred over day first for dates that could be either
+date_formats = ['%Y/%m/%d', '%m/%d/%Y', '%m/%d/%y', '%d/%m/%Y', '%d/%m/%y',
+                '%Y-%m-%d', '%m-%d-%Y', '%d-%m-%Y', '%d.%m.%Y', '%Y%m%d']
+
+#: time formats tried by infer_format
+time_formats = ['%H:%M:%S', '%H:%M']
+
+#: the number of values infer_format checks a format against
+inference_sample_size = 100
+
+# inferred formats keyed by the layout of the values they were
+# inferred from
+_format_cache = {}
+
+# the timestamp of 1900-01-01, the date of times parsed without one
+_time_base = calendar.timegm((1900, 1, 1, 0, 0, 0))
+
+
+def to_epoch(dates, fmt=None, times=None, time_fmt=None, strip=None):
+    """
+    Parse a column of `dates` in the strptime format `fmt` and return
+    them as an int64 array of seconds since 1970-01-01. If `times` is
+    given it is a column of the times of day of the dates in `time_fmt`
+    (e.g. '%m/%d/%Y' and '%H:%M:%S' for '03/15/2010' and '13:45:00').
+    Formats that are None are inferred with infer_format. If `strip` is
+    given those characters are stripped from the values first, e.g.
+    '"' for quoted values.
+
+    A ValueError is raised if a value doesn't match its format.
+    """
+    dates = _as_strings(dates, strip)
+    if fmt is None:
+        fmt = infer_format(dates)
+    seconds = _parse(dates, fmt)
+
+    if times is not None:
+        times = _as_strings(times, strip)
+        if len(times) != len(dates):
+            raise ValueError('%d times given for %d dates' %
+                             (len(times), len(dates)))
+        if time_fmt is None:
+            time_fmt = infer_format(times, time_formats)
+        seconds += _parse(times, time_fmt) - _time_base
+
+    return seconds
+
+
+def to_datetime64(dates, fmt=None, times=None, time_fmt=None, strip=None):
+    """
+    Same as to_epoch, but return the dates as a datetime64[s] array
+    """
+    return to_epoch(dates, fmt, times, time_fmt, strip).view('M8[s]')
+
+
+def to_datetimes(seconds):
+    """
+    Convert an array of seconds since 1970-01-01 into an object array
+    of naive datetime.datetime instances
+    """
+    return np.asarray(seconds, dtype=np.int64).view('M8[s]').astype(object)
+
+
+def fields_to_epoch(year, month, day, hour=0, minute=0, second=0):
+    """
+    Return the seconds since 1970-01-01 of the dates made of the integer
+    arrays (or scalars) of their fields. A ValueError is raised if any
+    of them isn't a valid date.
+    """
+    dates, valid = util.fields_to_datetime64(year, month, day, hour,
+                                             minute, second)
+    if not valid.all():
+        index = np.flatnonzero(~valid)[0]
+        fields = np.broadcast_arrays(year, month, day, hour, minute, second)
+        raise ValueError('Invalid date fields %s' %
+                         (tuple(int(field[index]) for field in fields),))
+
+    return dates.astype(np.int64)
+
+
+def infer_format(values, formats=None):
+    """
+    Return the first of `formats` that parses a sample of `values`. The
+    default formats are those of date_formats, alone or followed by
+    those of time_formats, plus time_formats alone. A ValueError is
+    raised if none of them do.
+    """
+    values = _as_strings(values)
+    if len(values):
+        count = min(len(values), inference_sample_size)
+        sample = values[np.linspace(0, len(values) - 1, count).astype(int)]
+    else:
+        sample = values
+    sample = sample[sample != '']
+    if not len(sample):
+        raise ValueError('Cannot infer the format of empty dates')
+
+    if formats is None:
+        formats = [date_format + separator + time_format
+                   for date_format in date_formats
+                   for separator in (' ', 'T', '')
+                   for time_format in time_formats] + \
+            date_formats + time_formats
+
+    # the layout of a value is its characters with the digits masked out
+    key = (tuple(formats), re.sub('[0-9]', '0', sample[0]))
+    cached = _format_cache.get(key)
+    if cached is not None and _parses(sample, cached):
+        return cached
+
+    for fmt in formats:
+        if _parses(sample, fmt):
+            _format_cache[key] = fmt
+            return fmt
+
+    raise ValueError("Cannot infer the format of dates like '%s'" %
+                     (sample[0],))
+
+
+def _parses(values, fmt):
+    """True if all the `values` parse in the format `fmt`"""
+    try:
+        _parse(values, fmt)
+    except ValueError:
+        return False
+
+    return True
+
+
+def _as_strings(values, strip=None):
+    """`values` as an array of byte strings"""
+    values = np.asarray(values)
+    if values.dtype.kind != 'S':
+        values = values.astype(str)
+    if strip is not None:
+        values = np.char.strip(values, strip)
+
+    return values
+
+
+def _parse(values, fmt):
+    """
+    Parse the byte strings `values` into seconds since 1970-01-01,
+    with strptime for those that don't fit fixed width fields
+    """
+    try:
+        dates, valid = util.parse_fixed_width_dates(values, fmt)
+    except ValueError:
+        # directives that aren't fixed width
+        dates = np.zeros(len(values), dtype='M8[s]')
+        valid = np.zeros(len(values), dtype=bool)
+
+    seconds = dates.astype(np.int64)
+    if not valid.all():
+        irregular = np.flatnonzero(~valid)
+        unique, inverse = np.unique(values[irregular], return_inverse=True)
+        parsed = np.array(
+            [calendar.timegm(datetime.datetime.strptime(value, fmt)
+                             .timetuple())
+             for value in unique], dtype=np.int64)
+        seconds[irregular] = parsed[inverse]
+
+    return seconds
@@ -6,7 +6,8 @@
 """
 from datetime import timedelta
 
-from pytz.tzinfo import StaticTzInfo
+import numpy as np
+from pytz.tzinfo import DstTzInfo, StaticTzInfo
 
 
 class UTCStaticOffset(StaticTzInfo):
@@ -14,11 +15,83 @@ class UTCStaticOffset(StaticTzInfo):
         if type(offset) != int:
             raise ValueError("Offset must be an integer value")
 
+        self._offset = offset
         self._utcoffset = timedelta(hours=1) * offset
         sign = "+" if offset > 0 else ""
         self._tzname = "UTC" + sign + str(offset)
         self.zone = self._tzname
 
+    def __reduce__(self):
+        # the pytz pickle support looks the zone name up in the pytz
+        # database, which doesn't know about these offsets
+        return UTCStaticOffset, (self._offset,)
+
 
 cst = UTCStaticOffset(-6)
 cdt = UTCStaticOffset(-5)
+
+
+def _transition_indices(utc_dates, tzinfo):
+    """
+    Return the index into the transition tables of a pytz DstTzInfo
+    `tzinfo` that applies to each of the datetime64 UTC times in
+    `utc_dates`
+    """
+    # microsecond resolution is needed here since the first
+    # transition time in the pytz tables is datetime(1, 1, 1), which
+    # is out of range for datetime64[ns]
+    transition_times = np.array(tzinfo._utc_transition_times,
+                                dtype='M8[us]')
+    idx = np.searchsorted(transition_times, utc_dates.astype('M8[us]'),
+                          side='right') - 1
+    return idx.clip(0)
+
+
+def utc_offsets(utc_dates, tzinfo):
+    """
+    Return a timedelta64[ns] array containing the utc offset of
+    `tzinfo` at each of the datetime64 UTC times in `utc_dates`. Static
+    offsets and pytz timezones are handled without creating a
+    datetime.datetime instance for every value.
+    """
+    utc_dates = np.asarray(utc_dates, dtype='M8[ns]')
+
+    if tzinfo is None:
+        return np.zeros(utc_dates.shape, dtype='m8[ns]')
+
+    if isinstance(tzinfo, DstTzInfo):
+        offsets = np.array([info[0] for info in tzinfo._transition_info],
+                           dtype='m8[us]').astype('m8[ns]')
+        return offsets[_transition_indices(utc_dates, tzinfo)]
+
+    if isinstance(tzinfo, StaticTzInfo) or tzinfo.utcoffset(None) is not None:
+        offset = np.array(tzinfo.utcoffset(None), dtype='m8[us]')
+        return np.zeros(utc_dates.shape, dtype='m8[ns]') + offset
+
+    # arbitrary tzinfo implementations have to be asked one date at a
+    # time
+    return np.array([tzinfo.fromutc(dt.replace(tzinfo=tzinfo)).utcoffset()
+                     for dt in utc_dates.astype('M8[us]').astype(object)],
+                    dtype='m8[us]').astype('m8[ns]')
+
+
+def localized_tzinfos(utc_dates, tzinfo):
+    """
+    Return an object array containing the tzinfo instance that should
+    be attached to each of the datetime64 UTC times in `utc_dates` when
+    they are converted to datetime.datetime instances in `tzinfo`. This
+    is `tzinfo` itself except for pytz timezones that observe daylight
+    savings time.
+    """
+    utc_dates = np.asarray(utc_dates, dtype='M8[ns]')
+    tzinfos = np.empty(utc_dates.shape, dtype=object)
+
+    if isinstance(tzinfo, DstTzInfo):
+        localized = np.empty(len(tzinfo._transition_info), dtype=object)
+        localized[:] = [tzinfo._tzinfos[info]
+                        for info in tzinfo._transition_info]
+        tzinfos[:] = localized[_transition_indices(utc_dates, tzinfo)]
+    else:
+        tzinfos[:] = tzinfo
+
+    return tzinfos
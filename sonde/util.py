@@ -1,48 +1,167 @@
+from __future__ import absolute_import
+
+import collections
 import csv
 from datetime import datetime
-import tempfile
+import hashlib
+from StringIO import StringIO
+
+import numpy as np
+
+from sonde import timezones
+
+
+class LazyDict(collections.MutableMapping):
+    """
+    A dict whose items are made by calling `load` the first time it is
+    used, for module level tables that need modules which are slow to
+    import (e.g. quantities units)
+    """
+    def __init__(self, load):
+        self._load = load
+        self._items = None
+
+    def _loaded(self):
+        if self._items is None:
+            self._items = dict(self._load())
+        return self._items
+
+    def __getitem__(self, key):
+        return self._loaded()[key]
+
+    def __setitem__(self, key, value):
+        self._loaded()[key] = value
+
+    def __delitem__(self, key):
+        del self._loaded()[key]
+
+    def __contains__(self, key):
+        return key in self._loaded()
 
-import xlrd
+    def __iter__(self):
+        return iter(self._loaded())
 
+    def __len__(self):
+        return len(self._loaded())
 
-def xls_to_csv(xls_file):
+    def __repr__(self):
+        return repr(self._loaded())
+
+
+def open_xls_sheet(xls_file):
+    """
+    Returns the first worksheet of an excel file and the workbook's
+    datemode (needed to convert dates later on). `xls_file` can be
+    either a file path string or a file-like object, which is read in
+    memory. The other worksheets aren't loaded.
+    """
+    import xlrd
+
+    if type(xls_file) == str:
+        workbook = xlrd.open_workbook(xls_file, on_demand=True)
+    else:
+        file_initial_location = xls_file.tell()
+        xls_file.seek(0)
+        workbook = xlrd.open_workbook(file_contents=xls_file.read(),
+                                      on_demand=True)
+        xls_file.seek(file_initial_location)
+
+    try:
+        return workbook.sheet_by_index(0), workbook.datemode
+    finally:
+        workbook.release_resources()
+
+
+def xls_head_to_csv(xls_file, nrows):
     """
-    Converts excel files to csv equivalents
-    assumes all data is in first worksheet
+    Returns the first `nrows` rows of the first worksheet of an excel
+    file as a string in the csv format of xls_sheet_to_csv. Nothing
+    is written to disk.
+    """
+    sheet, datemode = open_xls_sheet(xls_file)
+    return xls_sheet_to_csv(sheet, nrows=nrows)
+
 
-    Returns a string containing the file path to a temp file
-    containing the converted csv file, plus the workbook's datemode
-    (useful if you need to convert dates later on)
+def xls_sheet_to_csv(sheet, nrows=None):
+    """
+    Returns the first `nrows` rows (all of them if `nrows` is None) of
+    an xlrd worksheet as a string in csv format, with unicode cells
+    encoded as utf8 and floats written with repr
     """
-    temp_csv_fid, csv_file_path = tempfile.mkstemp()
-    with open(csv_file_path, 'wb') as csv_file:
-        if type(xls_file) == str:
-            xls_file_path = xls_file
+    if nrows is None:
+        nrows = sheet.nrows
+
+    csv_file = StringIO()
+    csv_writer = csv.writer(csv_file, csv.excel)
+    for row in range(min(nrows, sheet.nrows)):
+        csv_writer.writerow([_xls_cell_str(val)
+                             for val in sheet.row_values(row)])
+
+    return csv_file.getvalue()
+
+
+def xls_columns(sheet, start_row=0, ncols=None):
+    """
+    Returns the first `ncols` columns (all of them if `ncols` is None)
+    of an xlrd worksheet, from `start_row` on, as a list of numpy
+    arrays. Columns that only hold numbers, dates and empty cells are
+    float arrays with nan for the empty cells; the others are arrays of
+    strings formatted as xls_sheet_to_csv writes them.
+    """
+    import xlrd
+
+    numbers = set([xlrd.XL_CELL_NUMBER, xlrd.XL_CELL_DATE])
+    empty = set([xlrd.XL_CELL_EMPTY, xlrd.XL_CELL_BLANK])
+
+    if ncols is None:
+        ncols = sheet.ncols
+
+    columns = []
+    for col in range(ncols):
+        if col >= sheet.ncols:
+            columns.append(np.repeat(np.nan,
+                                     max(sheet.nrows - start_row, 0)))
+            continue
+
+        values = sheet.col_values(col, start_rowx=start_row)
+        types = set(sheet.col_types(col, start_rowx=start_row))
+        if types <= numbers:
+            columns.append(np.array(values, dtype=float))
+        elif types <= numbers | empty:
+            columns.append(np.array([np.nan if val == '' else val
+                                     for val in values], dtype=float))
         else:
-            # write out the xls_file-like object to a temp file to
-            # xlrd can open it
-            temp_xls_fid, xls_file_path = tempfile.mkstemp()
-            xls_file.seek(0)
-            with open(xls_file_path, 'wb') as temp_xls_file:
-                temp_xls_file.writelines(xls_file.readlines())
+            columns.append(np.array([_xls_cell_str(val) for val in values],
+                                    dtype=str))
 
-        workbook = xlrd.open_workbook(xls_file_path)
-        sheet = workbook.sheet_by_index(0)
-        datemode = workbook.datemode
+    return columns
 
-        csv_writer = csv.writer(csv_file, csv.excel)
 
-        for row in range(sheet.nrows):
-            this_row = []
-            for col in range(sheet.ncols):
-                val = sheet.cell_value(row, col)
-                if isinstance(val, unicode):
-                    val = val.encode('utf8')
-                this_row.append(val)
+def _xls_cell_str(val):
+    """a cell value as the string the csv module writes for it"""
+    if isinstance(val, unicode):
+        return val.encode('utf8')
+    elif isinstance(val, float):
+        return repr(val)
+    else:
+        return str(val)
 
-            csv_writer.writerow(this_row)
 
-    return csv_file_path, datemode
+def read_file_prefix(data_file, size):
+    """
+    Returns the first `size` bytes of `data_file`, which can be either
+    a file path string or a file-like object. The position of a
+    file-like object is left unchanged.
+    """
+    if type(data_file) == str:
+        with open(data_file, 'rb') as fid:
+            return fid.read(size)
+
+    file_initial_location = data_file.tell()
+    data_file.seek(0)
+    prefix = data_file.read(size)
+    data_file.seek(file_initial_location)
+    return prefix
 
 
 def possibly_corrupt_xls_date_to_datetime(date_val, datemode=0):
@@ -51,7 +170,248 @@ def possibly_corrupt_xls_date_to_datetime(date_val, datemode=0):
     float value, but these values can be corrupt depending on how the
     file has been saved/exported
     """
+    import xlrd
+
     try:
         return datetime.strptime(date_val, '%d/%m/%Y %H:%M:%S')
     except ValueError:
         return datetime(*xlrd.xldate_as_tuple(float(date_val), datemode))
+
+
+# the first xls day number that isn't ambiguous, the first that is too
+# large and the date they count from, for each workbook datemode
+_xls_first_date = {0: 61, 1: 1}
+_xls_too_large = {0: 2958466, 1: 2958466 - 1462}
+_xls_epoch = {0: np.datetime64('1899-12-30', 's'),
+              1: np.datetime64('1904-01-01', 's')}
+
+
+def xldates_to_datetime64(xldates, datemode=0):
+    """
+    Vectorized version of xlrd.xldate_as_tuple, converts an array of
+    excel date numbers into a datetime64[s] array, rounded to the
+    nearest second like xlrd does.
+
+    Returns the dates and a boolean array of which numbers were valid
+    dates; the dates of the numbers that weren't are undefined.
+    """
+    xldates = np.asarray(xldates, dtype=float)
+    in_range = (xldates >= 0) & (xldates < _xls_too_large[datemode])
+    xldates = np.where(in_range, xldates, 0)
+    days = np.floor(xldates)
+    seconds = (days * 86400 +
+               np.floor((xldates - days) * 86400.0 + 0.5)).astype('i8')
+    # the day after rounding to the nearest second
+    days = seconds // 86400
+    valid = in_range & (days >= _xls_first_date[datemode]) & \
+        (days < _xls_too_large[datemode])
+    return _xls_epoch[datemode] + seconds, valid
+
+
+def possibly_corrupt_xls_dates_to_datetime64(date_vals, datemode=0):
+    """
+    Vectorized version of possibly_corrupt_xls_date_to_datetime that
+    returns a datetime64[s] array. 'dd/mm/yyyy HH:MM:SS' strings are
+    parsed by slicing out their fields and the other values are taken
+    as excel date numbers; anything that can't be handled that way is
+    passed to possibly_corrupt_xls_date_to_datetime. `date_vals` can
+    also be a float array of date numbers, e.g. a column returned by
+    xls_columns.
+    """
+    date_vals = np.asarray(date_vals)
+    if date_vals.dtype.kind == 'f':
+        dates, parsed = xldates_to_datetime64(date_vals, datemode)
+        for index in np.flatnonzero(~parsed):
+            date_val = date_vals[index]
+            dates[index] = possibly_corrupt_xls_date_to_datetime(
+                '' if np.isnan(date_val) else repr(date_val), datemode)
+        return dates
+
+    date_vals = np.char.strip(np.asarray(date_vals, dtype=str))
+    dates = np.zeros(date_vals.shape, dtype='M8[s]')
+    parsed = np.zeros(date_vals.shape, dtype=bool)
+
+    is_text = np.char.str_len(date_vals) == 19
+    if is_text.any():
+        text_dates, valid = parse_fixed_width_dates(date_vals[is_text],
+                                                    '%d/%m/%Y %H:%M:%S')
+        dates[is_text] = text_dates
+        parsed[is_text] = valid
+
+    is_number = ~parsed & ~is_text
+    if is_number.any():
+        try:
+            numbers = date_vals[is_number].astype(float)
+        except ValueError:
+            numbers = None
+        if numbers is not None:
+            number_dates, valid = xldates_to_datetime64(numbers, datemode)
+            dates[is_number] = np.where(valid, number_dates, dates[is_number])
+            parsed[is_number] = valid
+
+    for index in np.flatnonzero(~parsed):
+        dates[index] = possibly_corrupt_xls_date_to_datetime(
+            date_vals[index], datemode)
+
+    return dates
+
+
+def parse_fixed_width_dates(date_strs, fmt):
+    """
+    Parse an array of fixed width date strings, e.g. '20060919121500'
+    for `fmt` '%Y%m%d%H%M%S', by slicing out their fields. `fmt` can
+    only contain the directives %Y, %y, %m, %d, %H, %M and %S (with zero
+    padded values) and literal characters. Two digit years are mapped
+    to 1969-2068 like strptime does.
+
+    Returns a datetime64[s] array and a boolean array of which strings
+    matched the format and were valid dates; the dates of the strings
+    that didn't are undefined.
+    """
+    fields = {}
+    literals = []
+    width = 0
+    position = 0
+    while position < len(fmt):
+        if fmt[position] == '%':
+            directive = fmt[position + 1:position + 2]
+            if directive not in ('Y', 'y', 'm', 'd', 'H', 'M', 'S') or \
+                   directive in fields:
+                raise ValueError("Unsupported fixed width date format '%s'"
+                                 % (fmt,))
+            size = 4 if directive == 'Y' else 2
+            fields[directive] = (width, width + size)
+            width += size
+            position += 2
+        else:
+            literals.append((width, fmt[position]))
+            width += 1
+            position += 1
+
+    date_strs = np.asarray(date_strs, dtype=str)
+    if date_strs.dtype.itemsize < width:
+        date_strs = date_strs.astype('S%d' % width)
+    size = date_strs.dtype.itemsize
+    chars = np.ascontiguousarray(date_strs).view(np.uint8).reshape(-1, size)
+    # strings are padded with nulls, so the ones of the right length
+    # have a character in their last column and none after it
+    valid = chars[:, width - 1] != 0
+    if size > width:
+        valid &= chars[:, width] == 0
+    chars = chars[:, :width]
+    digits = chars.astype(np.int64) - ord('0')
+
+    values = {}
+    for directive, (start, stop) in fields.items():
+        value = np.zeros(len(chars), dtype=np.int64)
+        for column in range(start, stop):
+            valid &= (digits[:, column] >= 0) & (digits[:, column] <= 9)
+            value = value * 10 + digits[:, column]
+        values[directive] = value
+    for column, literal in literals:
+        valid &= chars[:, column] == ord(literal)
+
+    zeros = np.zeros(len(chars), dtype=np.int64)
+    if 'y' in values:
+        year = values['y'] + np.where(values['y'] < 69, 2000, 1900)
+    else:
+        year = values.get('Y', zeros + 1900)
+    dates, valid_fields = fields_to_datetime64(
+        year, values.get('m', zeros + 1), values.get('d', zeros + 1),
+        *[values.get(directive, zeros) for directive in 'HMS'])
+
+    return dates, valid & valid_fields
+
+
+def fields_to_datetime64(year, month, day, hour=0, minute=0, second=0):
+    """
+    Build a datetime64[s] array from integer arrays of date and time
+    fields, without creating a datetime.datetime for each date.
+
+    Returns the dates and a boolean array of which fields made valid
+    dates; the dates of the fields that didn't are undefined.
+    """
+    year, month, day, hour, minute, second = np.broadcast_arrays(
+        *[np.asarray(field, dtype=np.int64)
+          for field in (year, month, day, hour, minute, second)])
+    valid = (month >= 1) & (month <= 12) & (day >= 1) & (year >= 1) & \
+            (year <= 9999) & (hour >= 0) & (hour < 24) & (minute >= 0) & \
+            (minute < 60) & (second >= 0) & (second < 60)
+
+    months = np.where(valid, (year - 1970) * 12 + month - 1, 0)
+    months = months.astype('M8[M]')
+    days = months.astype('M8[D]') + np.where(valid, day - 1, 0)
+    # e.g. 31/02 rolls over into the next month
+    valid &= days.astype('M8[M]') == months
+
+    dates = days.astype('M8[s]') + \
+        np.where(valid, hour * 3600 + minute * 60 + second, 0)
+    return dates, valid
+
+
+def file_sha1(file_path, block_size=1 << 20):
+    """
+    Returns the hex sha1 digest of the contents of a file
+    """
+    sha1 = hashlib.sha1()
+    with open(file_path, 'rb') as fid:
+        block = fid.read(block_size)
+        while block:
+            sha1.update(block)
+            block = fid.read(block_size)
+
+    return sha1.hexdigest()
+
+
+def datetimes_to_datetime64(dates):
+    """
+    Convert a sequence of datetime.datetime instances into a
+    datetime64[ns] array of UTC times.
+
+    Returns the array plus the tzinfo of the first date. Naive
+    datetimes are stored as is (i.e. as wall clock times) and the
+    returned tzinfo is None.
+    """
+    if len(dates) == 0:
+        return np.array([], dtype='M8[ns]'), None
+
+    tzinfo = dates[0].tzinfo
+    if tzinfo is None:
+        naive_dates = dates
+    else:
+        naive_dates = [dt.replace(tzinfo=None) - dt.utcoffset()
+                       for dt in dates]
+
+    utc_dates = np.array(naive_dates, dtype='M8[us]').astype('M8[ns]')
+    return utc_dates, tzinfo
+
+
+def datetime64_to_datetimes(utc_dates, tzinfo=None):
+    """
+    Convert a datetime64 array of UTC times into an object array of
+    datetime.datetime instances in the timezone `tzinfo`. If `tzinfo`
+    is None the values are treated as wall clock times and naive
+    datetimes are returned.
+    """
+    utc_dates = np.asarray(utc_dates, dtype='M8[ns]')
+    local_dates = utc_dates + timezones.utc_offsets(utc_dates, tzinfo)
+    dates = local_dates.astype('M8[us]').astype(object)
+
+    if tzinfo is not None:
+        tzinfos = timezones.localized_tzinfos(utc_dates, tzinfo)
+        dates[:] = [dt.replace(tzinfo=tz) for dt, tz in zip(dates, tzinfos)]
+
+    return dates
+
+
+def format_datetime64(dates):
+    """
+    Format a datetime64 array as an array of 'yyyy/mm/dd HH:MM:SS'
+    strings without creating a datetime.datetime for each value
+    """
+    formatted = np.datetime_as_string(
+        np.asarray(dates).astype('M8[s]'), unit='s').astype('S19')
+    chars = formatted.view('S1').reshape(-1, 19)
+    chars[:, [4, 7]] = '/'
+    chars[:, 10] = ' '
+    return formatted
@@ -9,17 +9,29 @@ from __future__ import with_statement
 
 import collections
 import csv
-from datetime import datetime
+from datetime import datetime, timedelta
+import gzip
 import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import warnings
 import nose
 from nose.tools import assert_almost_equal, eq_, set_trace
 import numpy as np
 import quantities as pq
+import seawater
 
-from sonde import BaseSondeDataset, Sonde
+from sonde import BaseSondeDataset, Sonde, autodetect, formats, \
+     iter_sonde, merge, open_many
 from sonde import quantities as sq
+from sonde import sonde as sonde_module
+from sonde.cache import ParseCache
+from sonde.catalog import Catalog
+from sonde import salinity, timeparse, util
 from sonde.timezones import cdt, cst
-from sonde.formats import ysi
+from sonde.formats import greenspan, hydrolab, ysi
 
 ysi_test_files_path = os.path.join(os.path.dirname(__file__), 'ysi_test_files')
 
@@ -30,8 +42,8 @@ class SondeTestDataset(BaseSondeDataset):
     A dummy test dataset - so aspects of BaseSondeDataset can be
     tested independent of parsing logic
     """
-    def __init__(self):
-        super(SondeTestDataset, self).__init__()
+    def __init__(self, data_file=None, **kwargs):
+        super(SondeTestDataset, self).__init__(data_file, **kwargs)
 
     def _read_data(self):
         date_str_list = ['2010-12-23 11:00:24',
@@ -205,6 +217,832 @@ class BaseSondeDataset_Test():
                                 expected)
 
 
-    
+class DateTime64Dates_Test():
+    def setup(self):
+        self.object_dataset = SondeTestDataset()
+        self.dataset = SondeTestDataset(datetime64_dates=True)
+
+    def test_dates_stored_as_utc_datetime64(self):
+        assert self.dataset._dates is None
+        eq_(self.dataset.utc_dates.dtype, np.dtype('M8[ns]'))
+        eq_(str(self.dataset.utc_dates[0]), '2010-12-23T16:00:24.000000000')
+
+    def test_dates_match_object_dates(self):
+        eq_(list(self.dataset.dates), list(self.object_dataset.dates))
+        eq_(self.dataset.start_time, self.object_dataset.start_time)
+        eq_(self.dataset.stop_time, self.object_dataset.stop_time)
+
+    def test_convert_timezones(self):
+        self.dataset.convert_timezones(cst)
+        self.object_dataset.convert_timezones(cst)
+        eq_(self.dataset.tzinfo, cst)
+        eq_([str(date) for date in self.dataset.dates],
+            [str(date) for date in self.object_dataset.dates])
+
+
+class Between_Test():
+    def setup(self):
+        self.start = datetime(2010, 12, 23, 12, 0, 24, tzinfo=cdt)
+        self.end = datetime(2010, 12, 23, 14, 0, 24, tzinfo=cdt)
+
+    def check_between(self, dataset):
+        subset = dataset.between(self.start, self.end)
+
+        eq_(list(subset.dates), list(dataset.dates[1:4]))
+        eq_(sorted(subset.data.keys()), sorted(dataset.data.keys()))
+        temperature = dataset.data['water_temperature']
+        assert np.shares_memory(subset.data['water_temperature'], temperature)
+        np.testing.assert_array_equal(subset.data['water_temperature'],
+                                      temperature[1:4])
+        np.testing.assert_array_almost_equal(
+            subset.data['seawater_salinity'],
+            dataset.data['seawater_salinity'][1:4])
+
+    def test_between(self):
+        self.check_between(SondeTestDataset())
+
+    def test_between_datetime64_dates(self):
+        self.check_between(SondeTestDataset(datetime64_dates=True))
+
+    def test_open_ended_window_and_parameters(self):
+        dataset = SondeTestDataset()
+        subset = dataset.between(self.end, None,
+                                 parameters=['water_temperature'])
+
+        eq_(list(subset.dates), list(dataset.dates[3:]))
+        eq_(subset.data.keys(), ['water_temperature'])
+        eq_(len(dataset.between(None, datetime(2000, 1, 1, tzinfo=cdt))
+                .dates), 0)
+
+    def test_naive_bounds_are_in_dataset_timezone(self):
+        dataset = SondeTestDataset()
+        start = self.start.astimezone(dataset.tzinfo).replace(tzinfo=None)
+
+        eq_(list(dataset.between(start, None).dates), list(dataset.dates[1:]))
+
+    def test_merged_dataset(self):
+        dataset = merge([os.path.join(ysi_test_files_path, file_name)
+                         for file_name in ['BAYT_20070323_CDT_YS1772AA_000.dat',
+                                           'SA07.dat']])
+        start, end = dataset.dates[100], dataset.dates[200]
+        subset = dataset.between(start, end)
+
+        eq_(list(subset.dates), list(dataset.dates[100:201]))
+        eq_(list(subset.data_file), list(dataset.data_file[100:201]))
+        for param in dataset.data.keys():
+            assert np.shares_memory(subset.data[param], dataset.data[param])
+
+    def test_list_dates_are_left_alone(self):
+        dataset = SondeTestDataset()
+        dataset.dates = list(dataset.dates)
+        dataset.between(self.start, self.end)
+
+        assert isinstance(dataset.dates, list)
+
+    @nose.tools.raises(ValueError)
+    def test_unsorted_dates(self):
+        dataset = SondeTestDataset()
+        dataset.dates = dataset.dates[::-1]
+        dataset.between(self.start, self.end)
+
+
+class PlainArrays_Test():
+    def setup(self):
+        self.quantities_dataset = SondeTestDataset()
+        self.dataset = SondeTestDataset(plain_arrays=True)
+
+    def test_data_matches_quantities_data(self):
+        eq_(sorted(self.dataset.data.keys()),
+            sorted(self.quantities_dataset.data.keys()))
+        for param, values in self.quantities_dataset.data.items():
+            assert not isinstance(self.dataset.data[param], pq.Quantity)
+            eq_(self.dataset.get_units(param).dimensionality,
+                values.dimensionality)
+            np.testing.assert_array_equal(self.dataset.data[param],
+                                          values.magnitude)
+
+    def test_rescale_parameter(self):
+        for std_unit in [pq.degF, pq.degK, pq.degC]:
+            self.dataset.set_standard_unit('water_temperature', std_unit)
+            self.quantities_dataset.set_standard_unit('water_temperature',
+                                                      std_unit)
+            eq_(self.dataset.get_units('water_temperature'), std_unit)
+            np.testing.assert_array_equal(
+                self.dataset.data['water_temperature'],
+                self.quantities_dataset.data['water_temperature'].magnitude)
+
+        self.dataset.set_standard_unit('water_depth_non_vented', sq.ftH2O)
+        self.quantities_dataset.set_standard_unit('water_depth_non_vented',
+                                                  sq.ftH2O)
+        np.testing.assert_array_equal(
+            self.dataset.data['water_depth_non_vented'],
+            self.quantities_dataset.data['water_depth_non_vented'].magnitude)
+
+    def test_set_parameter_data(self):
+        values = np.array([1., 2., 3.])
+        self.dataset._set_parameter_data('water_pressure', values, pq.psi)
+        self.quantities_dataset._set_parameter_data('water_pressure',
+                                                    values, pq.psi)
+
+        assert self.dataset.data['water_pressure'] is values
+        eq_(self.dataset.get_units('water_pressure').dimensionality,
+            self.quantities_dataset.data['water_pressure'].dimensionality)
+
+
+class Salinity_Test():
+    def setup(self):
+        random_state = np.random.RandomState(0)
+        size = 100000
+        self.R = random_state.uniform(0.0, 1.6, size)
+        self.R[::997] = np.nan
+        self.T = random_state.uniform(-2.0, 40.0, size)
+        self.P = random_state.uniform(0.0, 100.0, size)
+
+    def check_matches_seawater(self, R, T, P, tolerance=1e-6, **kwargs):
+        expected = seawater.salt(R, T, P)
+        sal = salinity.salt(R, T, P, **kwargs)
+        eq_(sal.shape, expected.shape)
+        np.testing.assert_array_equal(np.isnan(sal), np.isnan(expected))
+        assert np.nanmax(np.abs(sal - expected)) < tolerance
+
+    def test_matches_seawater(self):
+        self.check_matches_seawater(self.R, self.T, self.P)
+
+    def test_scalar_temperature_and_pressure(self):
+        self.check_matches_seawater(self.R, 25.0, 10.1325)
+
+    def test_broadcasting(self):
+        self.check_matches_seawater(self.R.reshape(100, 1000),
+                                    self.T.reshape(100, 1000),
+                                    self.P[:1000])
+
+    def test_threads(self):
+        self.check_matches_seawater(self.R, self.T, self.P, workers=3,
+                                    chunk_size=1000)
+
+    def test_float32(self):
+        self.check_matches_seawater(self.R, self.T, self.P, tolerance=1e-4,
+                                    dtype=np.float32)
+
+    def test_out(self):
+        out = np.empty(len(self.R))
+        sal = salinity.salt(self.R, self.T, self.P, out=out)
+        assert sal is out
+        np.testing.assert_array_almost_equal(
+            out, seawater.salt(self.R, self.T, self.P), decimal=6)
+
+
+class DerivedData_Test():
+    def setup(self):
+        self.dataset = SondeTestDataset()
+
+    def expected_salinity(self):
+        data = self.dataset.data
+        return seawater.salt(
+            data['water_electrical_conductivity'].magnitude / 42.914,
+            data['water_temperature'].rescale(pq.degC).magnitude,
+            data['water_depth_non_vented'].rescale(sq.dbar).magnitude +
+            pq.atm.rescale(sq.dbar).magnitude)
+
+    def test_derived_parameters_are_listed(self):
+        assert 'seawater_salinity' in self.dataset.data
+        assert 'seawater_salinity' in self.dataset.data.keys()
+        assert 'seawater_salinity' in self.dataset.parameters
+        assert not self.dataset.data.is_derived('water_temperature')
+
+    def test_unlisted_derived_parameters(self):
+        data = self.dataset.data
+        data['water_specific_conductance']
+        assert 'water_specific_conductance' in data.derived_keys()
+        assert 'water_specific_conductance' not in data
+        assert 'water_specific_conductance' not in data.keys()
+        assert 'water_specific_conductance' not in data.copy()
+
+    def test_derived_on_access(self):
+        eq_(self.dataset.data._computed, {})
+        salinity = self.dataset.data['seawater_salinity']
+        eq_(salinity.units, sq.psu)
+        np.testing.assert_array_almost_equal(salinity.magnitude,
+                                             self.expected_salinity())
+        assert 'seawater_salinity' in self.dataset.data._computed
+        assert self.dataset.data['seawater_salinity'] is salinity
+
+    def test_specific_conductance(self):
+        data = self.dataset.data
+        np.testing.assert_array_almost_equal(
+            data['water_specific_conductance'].magnitude,
+            data['water_electrical_conductivity'].magnitude /
+            (1 + 0.0191 * (data['water_temperature'].magnitude - 25)))
+
+    def test_invalidated_when_input_changes(self):
+        salinity = self.dataset.data['seawater_salinity']
+        self.dataset.data['water_temperature'] = np.array(
+            [20., 21., 22., 23., 24., 25.]) * pq.degC
+        assert 'seawater_salinity' not in self.dataset.data._computed
+        np.testing.assert_array_almost_equal(
+            self.dataset.data['seawater_salinity'].magnitude,
+            self.expected_salinity())
+        assert np.any(self.dataset.data['seawater_salinity'] != salinity)
+
+    def test_rescaled_derived_parameter(self):
+        self.dataset.data['water_specific_conductance']
+        self.dataset.set_standard_unit('water_specific_conductance',
+                                       sq.uScm)
+        eq_(self.dataset.data['water_specific_conductance'].units, sq.uScm)
+
+    def test_assigned_values_replace_derived(self):
+        self.dataset.data['seawater_salinity'] = np.ones(6) * sq.psu
+        assert not self.dataset.data.is_derived('seawater_salinity')
+        self.dataset.data['water_temperature'] = np.ones(6) * pq.degC
+        np.testing.assert_array_equal(
+            self.dataset.data['seawater_salinity'].magnitude, np.ones(6))
+
+    def test_deleted_derived_parameter(self):
+        del self.dataset.data['seawater_salinity']
+        assert 'seawater_salinity' not in self.dataset.data
+        assert 'seawater_salinity' not in self.dataset.data.copy()
+
+    def test_apply_mask(self):
+        dataset = SondeTestDataset(plain_arrays=True)
+        salinity = dataset.data['seawater_salinity']
+        mask = np.array([True, False, True, True, False, True])
+        dataset.apply_mask(mask, parameters=['water_temperature'])
+        masked_salinity = dataset.data['seawater_salinity']
+        assert np.all(np.isnan(masked_salinity[~mask]))
+        np.testing.assert_array_equal(masked_salinity[mask], salinity[mask])
+
+
+class GreenspanReader_Test():
+    def setup(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.test_file = os.path.join(self.tmp_dir, 'duplicates.csv')
+        with open(os.path.join(os.path.dirname(__file__),
+                               'greenspan_test_files',
+                               '1208SB1S.csv')) as fid:
+            header = [fid.readline() for i in range(15)]
+        rows = [',27/10/2008 12:15:00,, 9.5, 18.71, .271,,,,\r\n',
+                ',27/10/2008 12:15:00,,, 18.72,, -195,,,\r\n',
+                ',27/10/2008 12:30:00,, 9.5,,,,,,\r\n',
+                ',27/10/2008 12:45:00,, 9.4, 19.16,,,,,\r\n',
+                ',27/10/2008 12:45:00,, 9.4,,,,,,\r\n']
+        with open(self.test_file, 'wb') as fid:
+            fid.writelines(header + rows)
+
+    def teardown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_duplicate_timestamps_are_combined(self):
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter('always')
+            reader = greenspan.GreenspanReader(self.test_file)
+
+        eq_(list(reader.dates), [datetime(2008, 10, 27, 12, 15),
+                                 datetime(2008, 10, 27, 12, 30),
+                                 datetime(2008, 10, 27, 12, 45)])
+        data = dict((p.name, p.data) for p in reader.parameters)
+        np.testing.assert_array_equal(data['Battery'], [9.5, 9.5, 9.4])
+        np.testing.assert_array_equal(data['Temperature'],
+                                      [18.72, np.nan, 19.16])
+        np.testing.assert_array_equal(data['Pressure'],
+                                      [.271, np.nan, np.nan])
+        np.testing.assert_array_equal(data['EC Raw'],
+                                      [-195, np.nan, np.nan])
+
+        # one warning for all the conflicting values
+        conflicts = [w for w in caught if 'Conflicting' in str(w.message)]
+        eq_(len(conflicts), 1)
+        assert '2 parameter values on 2 dates' in str(conflicts[0].message)
+
+    @nose.tools.raises(greenspan.BadDatafileError)
+    def test_non_sequential_timestamps(self):
+        with open(self.test_file, 'ab') as fid:
+            fid.write(',27/10/2008 12:00:00,, 9.4,,,,,,\r\n')
+        greenspan.GreenspanReader(self.test_file)
+
+    def test_block_records(self):
+        block_file = os.path.join(self.tmp_dir, 'records.dat')
+        with open(os.path.join(os.path.dirname(__file__),
+                               'greenspan_test_files',
+                               'JDM4_20070410_CST_GS0638.dat')) as fid:
+            header = []
+            for line in fid:
+                if line.startswith('T'):
+                    break
+                header.append(line)
+        records = ['T20070410120000\r\n', 'D1 +001.908\r\n',
+                   'D2 +0021.35\r\n',
+                   'T20070410120000\r\n', 'D2 +0021.40\r\n',
+                   '# comment\r\n',
+                   'T20070410121500\r\n', 'D3 +00262.2\r\n']
+        with open(block_file, 'wb') as fid:
+            fid.writelines(header + records)
+
+        reader = greenspan.GreenspanReader(block_file)
+        eq_(list(reader.dates), [datetime(2007, 4, 10, 12, 0),
+                                 datetime(2007, 4, 10, 12, 15)])
+        data = np.array([p.data for p in reader.parameters[1:4]])
+        np.testing.assert_array_equal(data, [[1.908, np.nan],
+                                             [21.40, np.nan],
+                                             [np.nan, 262.2]])
+        eq_(reader.header_lines[-1], '# comment\r\n')
+
+    def test_xls_file(self):
+        xls_file = os.path.join(os.path.dirname(__file__),
+                                'greenspan_test_files',
+                                'JARD_20060718_CDT_GS9549_head.xls')
+        reader = greenspan.GreenspanReader(xls_file)
+
+        eq_(reader.format_version, '2.4.1')
+        eq_(reader.serial_number, '19549')
+        eq_(len(reader.dates), 9)
+        eq_(reader.dates[-1], datetime(2006, 7, 19, 0, 0))
+        data = dict((p.name, p.data) for p in reader.parameters)
+        np.testing.assert_array_equal(data['Battery'],
+                                      [np.nan] * 8 + [10.09])
+        np.testing.assert_array_equal(data['DO'][:3], [7.84, 8.01, 7.86])
+
+        # the same rows read as text
+        with open(self.test_file, 'wb') as fid:
+            fid.write(util.xls_sheet_to_csv(util.open_xls_sheet(xls_file)[0]))
+        text_reader = greenspan.GreenspanReader(self.test_file)
+        eq_(list(reader.dates), list(text_reader.dates))
+        for parameter, text_parameter in zip(reader.parameters,
+                                             text_reader.parameters):
+            np.testing.assert_array_equal(parameter.data,
+                                          text_parameter.data)
+
+
+class XlsColumns_Test():
+    def setup(self):
+        self.xls_file = os.path.join(os.path.dirname(__file__),
+                                     'eureka_test_files',
+                                     'RIOF_20080513_CDT_EU0468.xls')
+
+    def test_file_object_matches_path(self):
+        with open(self.xls_file, 'rb') as fid:
+            from_fid = util.xls_columns(util.open_xls_sheet(fid)[0])
+            eq_(fid.tell(), 0)
+        from_path = util.xls_columns(util.open_xls_sheet(self.xls_file)[0])
+
+        eq_(len(from_fid), len(from_path))
+        for fid_column, path_column in zip(from_fid, from_path):
+            eq_(list(fid_column.astype(str)), list(path_column.astype(str)))
+
+    def test_xldates_match_xlrd(self):
+        import xlrd
+        xldates = np.array([39581.0, 39581.5416666666666, 61.0, 2000000.99],
+                           dtype=float)
+        for datemode in (0, 1):
+            dates, valid = util.xldates_to_datetime64(xldates, datemode)
+            assert valid.all()
+            eq_(list(dates.astype(object)),
+                [datetime(*xlrd.xldate_as_tuple(xldate, datemode))
+                 for xldate in xldates])
+
+        dates, valid = util.xldates_to_datetime64([12.0, -1.0, np.nan])
+        assert not valid.any()
+
+
+class Timeparse_Test():
+    def test_dates_and_times(self):
+        dates = ['03/15/2010', '"3/5/2010"', '12/31/1999']
+        times = ['13:45:00', '1:02:03', '"23:59:59"']
+        seconds = timeparse.to_epoch(dates, '%m/%d/%Y', times, '%H:%M:%S',
+                                     strip='"')
+        eq_(seconds.dtype, np.int64)
+        eq_(list(timeparse.to_datetimes(seconds)),
+            [datetime(2010, 3, 15, 13, 45), datetime(2010, 3, 5, 1, 2, 3),
+             datetime(1999, 12, 31, 23, 59, 59)])
+
+    def test_invalid_dates_raise(self):
+        nose.tools.assert_raises(ValueError, timeparse.to_epoch,
+                                 ['2010/02/30'], '%Y/%m/%d')
+        nose.tools.assert_raises(ValueError, timeparse.fields_to_epoch,
+                                 [2010], [2], [30])
+
+    def test_infer_format(self):
+        eq_(timeparse.infer_format(['2010/03/15 13:45:00']),
+            '%Y/%m/%d %H:%M:%S')
+        eq_(timeparse.infer_format(['03/05/2010', '03/15/2010']), '%m/%d/%Y')
+        eq_(timeparse.infer_format(['05/03/2010', '15/03/2010']), '%d/%m/%Y')
+        eq_(timeparse.infer_format(['13:45']), '%H:%M')
+        nose.tools.assert_raises(ValueError, timeparse.infer_format,
+                                 ['not a date'])
+
+
+class HydrolabReader_Test():
+    def setup(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.test_file = os.path.join(self.tmp_dir, 'rows.txt')
+        with open(os.path.join(os.path.dirname(__file__),
+                               'hydrolab_test_files',
+                               'SANT_20070228_CST_HY1814_000.txt')) as fid:
+            header = [fid.readline() for i in range(26)]
+        rows = ['103000   22.73   0.022     0.0    75.1    6.51   -0.65    13.2&\r\n',
+                '93000   22.90   #####     0.0    86.3    7.46   -0.72\r\n',
+                '103000   26.13   0.019     0.0    82.6    6.73   -0.35    13.2&\r\n',
+                'ERROR: data could not be acquired\r\n',
+                'Date (MMDDYY) : 030107\r\n',
+                '003000   24.79   0.015     0.0    75.4    6.29   -0.87    13.2&\r\n']
+        with open(self.test_file, 'wb') as fid:
+            fid.writelines(header + rows)
+
+    def teardown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_data_rows(self):
+        reader = hydrolab.HydrolabReader(self.test_file)
+
+        # dates are sorted, and only the first of repeated dates is kept
+        eq_(list(reader.dates), [datetime(2007, 2, 28, 9, 30),
+                                 datetime(2007, 2, 28, 10, 30),
+                                 datetime(2007, 3, 1, 0, 30)])
+        data = dict((p.name, p.data) for p in reader.parameters)
+        np.testing.assert_array_equal(data['Temp'], [22.90, 22.73, 24.79])
+        np.testing.assert_array_equal(data['SpCond'], [np.nan, 0.022, 0.015])
+        np.testing.assert_array_equal(data['Batt'], [np.nan, 13.2, 13.2])
+
+    @nose.tools.raises(ValueError)
+    def test_no_data_rows(self):
+        with open(self.test_file, 'rb') as fid:
+            header = fid.readlines()[:26]
+        with open(self.test_file, 'wb') as fid:
+            fid.writelines(header + ['ERROR: data could not be acquired\r\n'])
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            hydrolab.HydrolabReader(self.test_file)
+
+
+def test_lazy_import():
+    """
+    Test that importing sonde doesn't import quantities or the
+    dependencies of the format modules
+    """
+    code = ("import sys, sonde; "
+            "print [m for m in ('quantities', 'pandas', 'xlrd') "
+            "if m in sys.modules]")
+    output = subprocess.check_output(
+        [sys.executable, '-c', code],
+        cwd=os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+    eq_(output.strip(), '[]')
+
+
+class Merge_Test():
+    def setup(self):
+        self.file_list = [os.path.join(ysi_test_files_path, file_name)
+                          for file_name in ['BAYT_20070323_CDT_YS1772AA_000.dat',
+                                            'SA07.dat', 'SA08.dat']]
+
+    def test_parallel_merge_matches_serial_merge(self):
+        serial = merge(self.file_list)
+        parallel = merge(self.file_list, workers=2)
+
+        eq_(list(serial.dates), list(parallel.dates))
+        eq_(list(serial.data_file), list(parallel.data_file))
+        eq_(sorted(serial.data.keys()), sorted(parallel.data.keys()))
+        for param in serial.data.keys():
+            np.testing.assert_array_equal(serial.data[param],
+                                          parallel.data[param])
+
+    def test_auto_timezone(self):
+        # BAYT_20070323 was set up during daylight saving time
+        merged = merge(self.file_list[:1], tz_list='auto')
+        expected = Sonde(self.file_list[0], tzinfo=cdt)
+
+        eq_(list(merged.utc_dates), list(expected.utc_dates))
+
+
+class OpenMany_Test():
+    def setup(self):
+        self.file_list = [os.path.join(ysi_test_files_path, file_name)
+                          for file_name in ['BAYT_20070323_CDT_YS1772AA_000.dat',
+                                            'missing.dat', 'SA07.dat']]
+
+    def check_open_many(self, **kwargs):
+        results = list(open_many(self.file_list, tzinfo=cst, **kwargs))
+
+        eq_([path for path, result in results], self.file_list)
+        assert isinstance(results[1][1], IOError)
+        for path, dataset in [results[0], results[2]]:
+            expected = Sonde(path, tzinfo=cst)
+            eq_(list(dataset.dates), list(expected.dates))
+            eq_(dataset.serial_number, expected.serial_number)
+            eq_(sorted(dataset.data.keys()), sorted(expected.data.keys()))
+            for param in expected.data.keys():
+                np.testing.assert_array_equal(dataset.data[param],
+                                              expected.data[param])
+
+    def test_open_many(self):
+        self.check_open_many(workers=1)
+
+    def test_open_many_threads(self):
+        self.check_open_many(workers=2, executor='thread')
+
+    def test_open_many_processes(self):
+        self.check_open_many(workers=2, executor='process')
+
+
+class IterSonde_Test():
+    def check_chunks_match_full_read(self, test_file, chunk_rows):
+        full = Sonde(test_file)
+        chunks = list(iter_sonde(test_file, chunk_rows=chunk_rows))
+
+        assert all(len(chunk.dates) <= chunk_rows for chunk in chunks)
+        eq_(list(np.concatenate([chunk.utc_dates for chunk in chunks])),
+            list(full.utc_dates))
+        for param in full.data.keys():
+            # parameters with no data in a chunk are left out of it
+            np.testing.assert_array_almost_equal(
+                np.concatenate([chunk.data[param].magnitude
+                                if param in chunk.data
+                                else np.nan * np.ones(len(chunk.dates))
+                                for chunk in chunks]),
+                full.data[param].magnitude)
+
+    def test_ysi_binary_chunks(self):
+        self.check_chunks_match_full_read(
+            os.path.join(ysi_test_files_path, 'SA07.dat'), 100)
+
+    def test_generic_chunks(self):
+        self.check_chunks_match_full_read(
+            os.path.join(os.path.dirname(__file__), 'generic_test_files',
+                         'test1.csv'), 3)
+
+    def test_hydrolab_chunks(self):
+        self.check_chunks_match_full_read(
+            os.path.join(os.path.dirname(__file__), 'hydrolab_test_files',
+                         'BAYT_20031117_CST_HY349_000.txt'), 50)
+
+    def test_hydrolab_chunks_keep_file_parameters(self):
+        # row 21 of SANT_20060503 has no salinity, which must not be
+        # derived in chunks where that is the only salinity value
+        test_file = os.path.join(os.path.dirname(__file__),
+                                 'hydrolab_test_files',
+                                 'SANT_20060503_CDT_HY0000_000.txt')
+        full_keys = sorted(Sonde(test_file).data.keys())
+        for chunk_rows in [1, 7]:
+            self.check_chunks_match_full_read(test_file, chunk_rows)
+            for chunk in iter_sonde(test_file, chunk_rows=chunk_rows):
+                eq_(sorted(chunk.data.keys()), full_keys)
+
+    @nose.tools.raises(NotImplementedError)
+    def test_unsupported_format(self):
+        list(iter_sonde(os.path.join(os.path.dirname(__file__),
+                                     'test_file_example.txt'),
+                        file_format='solinst'))
+
+
+class ParseCache_Test():
+    def setup(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.test_file = os.path.join(self.cache_dir, 'SA07.dat')
+        shutil.copy(os.path.join(ysi_test_files_path, 'SA07.dat'),
+                    self.test_file)
+
+    def teardown(self):
+        shutil.rmtree(self.cache_dir)
+
+    def test_cached_dataset_matches_parsed_dataset(self):
+        cache = ParseCache(os.path.join(self.cache_dir, 'cache'))
+        parsed = Sonde(self.test_file)
+        Sonde(self.test_file, cache=cache)
+        cached = Sonde(self.test_file, cache=cache)
+
+        assert cached.data['water_temperature'].flags.writeable
+        eq_(list(cached.dates), list(parsed.dates))
+        eq_(cached.serial_number, parsed.serial_number)
+        eq_(sorted(cached.parameters.keys()), sorted(parsed.parameters.keys()))
+        for param in parsed.data.keys():
+            eq_(cached.data[param].dimensionality,
+                parsed.data[param].dimensionality)
+            np.testing.assert_array_equal(cached.data[param],
+                                          parsed.data[param])
+
+    def test_modified_file_is_parsed_again(self):
+        cache = ParseCache(os.path.join(self.cache_dir, 'cache'))
+        Sonde(self.test_file, cache=cache)
+        stat = os.stat(self.test_file)
+        os.utime(self.test_file, (stat.st_atime, stat.st_mtime + 10))
+
+        eq_(cache.load(self.test_file, (None, (), [])), None)
+
+    def test_cached_arrays_are_copy_on_write(self):
+        cache = ParseCache(os.path.join(self.cache_dir, 'cache'))
+        Sonde(self.test_file, cache=cache, plain_arrays=True)
+        cached = Sonde(self.test_file, cache=cache, plain_arrays=True)
+        temperature = cached.data['water_temperature'].copy()
+        mask = np.zeros(len(cached.dates), dtype=bool)
+        cached.apply_mask(mask, parameters=['water_temperature'])
+
+        assert np.all(np.isnan(cached.data['water_temperature']))
+        np.testing.assert_array_equal(
+            Sonde(self.test_file, cache=cache,
+                  plain_arrays=True).data['water_temperature'],
+            temperature)
+
+    def test_default_timezone_is_part_of_key(self):
+        cache = ParseCache(os.path.join(self.cache_dir, 'cache'))
+        key = cache.entry_path(self.test_file, (None, (), []))
+        default_static_timezone = sonde_module.default_static_timezone
+        try:
+            sonde_module.default_static_timezone = cdt
+            assert cache.entry_path(self.test_file, (None, (), [])) != key
+        finally:
+            sonde_module.default_static_timezone = default_static_timezone
+
+    def test_eviction(self):
+        cache = ParseCache(os.path.join(self.cache_dir, 'cache'), max_size=1)
+        Sonde(self.test_file, cache=cache)
+
+        eq_(os.listdir(cache.cache_dir), [])
+
+
+class Catalog_Test():
+    def setup(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        for file_name in ['BAYT_20070323_CDT_YS1772AA_000.dat', 'SA07.dat']:
+            shutil.copy(os.path.join(ysi_test_files_path, file_name),
+                        self.tmp_dir)
+        with open(os.path.join(self.tmp_dir, 'notes.txt'), 'w') as f:
+            f.write('not a data file\n')
+        self.catalog = Catalog(os.path.join(self.tmp_dir, 'catalog.db'))
+
+    def teardown(self):
+        self.catalog.close()
+        shutil.rmtree(self.tmp_dir)
+
+    def test_index(self):
+        data_dir = os.path.join(self.tmp_dir, 'data')
+        os.mkdir(data_dir)
+        for file_name in os.listdir(self.tmp_dir):
+            if file_name != 'data' and not file_name.endswith('.db'):
+                shutil.move(os.path.join(self.tmp_dir, file_name), data_dir)
+        test_file = os.path.join(data_dir,
+                                 'BAYT_20070323_CDT_YS1772AA_000.dat')
+        dataset = Sonde(test_file)
+
+        eq_(self.catalog.index(data_dir), 3)
+        eq_(self.catalog.index(data_dir), 0)
+        eq_(len(self.catalog.files()), 2)
+        eq_(len(self.catalog.files(errors=True)), 3)
+
+        record = self.catalog.files(site='bayt')[0]
+        eq_(record['path'], test_file)
+        eq_(record['format'], 'ysi_binary')
+        eq_(record['serial_number'], dataset.serial_number)
+        eq_(record['row_count'], len(dataset.dates))
+        utc_dates = np.asarray(dataset.utc_dates, dtype='M8[s]')
+        eq_(record['start_time'], utc_dates.min().astype(datetime))
+        eq_(record['stop_time'], utc_dates.max().astype(datetime))
+        eq_(record['parameters']['water_temperature'],
+            np.count_nonzero(~np.isnan(dataset.data['water_temperature'])))
+
+        stat = os.stat(test_file)
+        os.utime(test_file, (stat.st_atime, stat.st_mtime + 10))
+        os.remove(os.path.join(data_dir, 'notes.txt'))
+        eq_(self.catalog.index(data_dir), 1)
+        eq_(len(self.catalog.files(errors=True)), 2)
+
+    def test_catalog_database_is_skipped(self):
+        self.catalog.index(self.tmp_dir)
+        paths = [record['path']
+                 for record in self.catalog.files(errors=True)]
+
+        assert self.catalog.db_path not in paths
+        eq_(len(paths), 3)
+        eq_(self.catalog.index(self.tmp_dir), 0)
+
+    def test_coverage(self):
+        self.catalog.index(self.tmp_dir)
+        coverage = dict(((site, param), (start, stop, file_count))
+                        for site, param, start, stop, file_count, count
+                        in self.catalog.coverage())
+        record = self.catalog.files(site='bayt')[0]
+
+        assert 'bayt' in self.catalog.sites()
+        eq_(coverage[('bayt', 'water_temperature')],
+            (record['start_time'], record['stop_time'], 1))
+        eq_(self.catalog.files(site='bayt', parameter='water_ph'), [])
+        eq_(self.catalog.files(site='bayt',
+                               end=record['start_time'] - timedelta(1)), [])
+
+
+class WriteCsv_Test():
+    def setup(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.dataset = Sonde(os.path.join(
+            os.path.dirname(__file__), 'hydrolab_test_files',
+            'BAYT_20031117_CST_HY349_000.txt'))
+
+    def teardown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_write_does_not_modify_data(self):
+        data = dict((param, np.array(values))
+                    for param, values in self.dataset.data.items())
+        assert np.isnan(data['water_dissolved_oxygen_concentration']).any()
+
+        self.dataset.write(os.path.join(self.tmp_dir, 'test.csv'),
+                           file_format='csv', metadata={})
+        for param, values in data.items():
+            np.testing.assert_array_equal(self.dataset.data[param], values)
+
+    def test_gzip_output(self):
+        file_name = os.path.join(self.tmp_dir, 'test.csv')
+        self.dataset.write(file_name, file_format='csv', metadata={})
+        self.dataset.write(file_name + '.gz', file_format='csv',
+                           metadata={})
+
+        eq_(gzip.open(file_name + '.gz').read(), open(file_name).read())
+
+    def test_dates_are_written_in_dataset_timezone(self):
+        file_name = os.path.join(self.tmp_dir, 'test.csv')
+        self.dataset.write(file_name, file_format='csv', metadata={})
+
+        rows = [line for line in open(file_name)
+                if not line.startswith('#')]
+        eq_(len(rows), len(self.dataset.dates))
+        eq_(rows[0].split(',')[0],
+            self.dataset.dates[0].strftime('%Y/%m/%d %H:%M:%S'))
+        eq_(rows[-1].split(',')[0],
+            self.dataset.dates[-1].strftime('%Y/%m/%d %H:%M:%S'))
+
+
+class WriteNetcdf4_Test():
+    def setup(self):
+        try:
+            import netCDF4
+        except ImportError:
+            raise nose.SkipTest('netCDF4 is not installed')
+
+        self.tmp_dir = tempfile.mkdtemp()
+        self.dataset = Sonde(os.path.join(ysi_test_files_path, 'SA07.dat'))
+
+    def teardown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_write_and_read_back(self):
+        file_name = os.path.join(self.tmp_dir, 'SA07.nc')
+        self.dataset.write(file_name, metadata={})
+
+        eq_(autodetect(file_name), 'netcdf4')
+        read_back = Sonde(file_name)
+        eq_(list(read_back.dates), list(self.dataset.dates))
+        eq_(read_back.serial_number, self.dataset.serial_number)
+        eq_(read_back.data_file, self.dataset.data_file)
+        eq_(sorted(read_back.data.keys()), sorted(self.dataset.data.keys()))
+        for param in self.dataset.data.keys():
+            np.testing.assert_array_equal(read_back.data[param],
+                                          self.dataset.data[param])
+
+    def test_cf_attributes(self):
+        import netCDF4
+
+        file_name = os.path.join(self.tmp_dir, 'SA07.nc')
+        self.dataset.write(file_name, metadata={})
+        nc = netCDF4.Dataset(file_name)
+        try:
+            temperature = nc.variables['water_temperature']
+            eq_(temperature.standard_name, 'sea_water_temperature')
+            eq_(temperature.units, 'degC')
+            eq_(nc.variables['seawater_salinity'].units, '1e-3')
+        finally:
+            nc.close()
+
+
+def test_udunits():
+    eq_(sonde_module.udunits(sq.mScm), 'mS/cm')
+    eq_(sonde_module.udunits(sq.psu), '1e-3')
+    eq_(sonde_module.udunits(sq.mH2O), 'm H2O')
+    eq_(sonde_module.udunits(pq.percent), 'percent')
+    eq_(sonde_module.udunits(pq.dimensionless), '1')
+
+
+class FormatRegistry_Test():
+    def setup(self):
+        self.test_file = os.path.join(os.path.dirname(__file__),
+                                      'test_file_example.txt')
+
+    def teardown(self):
+        formats.format_registry.pop('sondetest', None)
+        formats._sniffers[:] = [registered
+                                for registered in formats._sniffers
+                                if registered.name != 'sondetest']
+
+    def test_registered_format_is_read_and_autodetected(self):
+        formats.register_format(
+            'sondetest', 'tests.sonde_tests.SondeTestDataset',
+            sniff=lambda prefix, filename: filename.endswith('example.txt'),
+            cost=-1)
+
+        eq_(autodetect(self.test_file), 'sondetest')
+        dataset = Sonde(self.test_file)
+        assert isinstance(dataset, SondeTestDataset)
+
+    @nose.tools.raises(NotImplementedError)
+    def test_unknown_format(self):
+        Sonde(self.test_file, file_format='not_a_format')
+
+
 if __name__ == '__main__':
     nose.run()
@@ -12,9 +12,12 @@ import collections
 import csv
 from datetime import datetime
 import os
+import pkg_resources
+import shutil
+import tempfile
 
 import nose
-from nose.tools import assert_almost_equal, set_trace
+from nose.tools import assert_almost_equal, eq_, set_trace
 import numpy as np
 import quantities as pq
 
@@ -108,6 +111,35 @@ def YSIReaderNaiveDatetime_Test():
     ysi_reader = ysi.YSIReader(ysi_test_file_path)
     assert ysi_reader.dates != []
 
+
+class YSIParamDef_Test():
+    def setup(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.param_file = os.path.join(self.tmp_dir, 'ysi_param.def')
+        with open(self.param_file, 'wb') as fid:
+            fid.write(pkg_resources.resource_string(
+                'sonde', ysi.DEFAULT_YSI_PARAM_DEF))
+
+    def teardown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_param_defs_are_cached(self):
+        assert ysi.load_param_def() is ysi.load_param_def()
+
+        param_def = ysi.load_param_def(self.param_file)
+        assert ysi.load_param_def(self.param_file) is param_def
+
+        # a modified file is parsed again
+        mtime = os.path.getmtime(self.param_file)
+        os.utime(self.param_file, (mtime + 10, mtime + 10))
+        assert ysi.load_param_def(self.param_file) is not param_def
+
+    def test_types_are_looked_up_by_id(self):
+        types = ysi.load_param_def().types
+        eq_(types[1][1:3], ('Temperature', 'C'))
+        # the ids in the table aren't contiguous
+        eq_(types[500][0], 500)
+
 #-------------------------------------------------------------------
 
 